@@ -0,0 +1,292 @@
+"""
+Acquirer connectors: the bank step of payment finalization.
+
+PaymentProcessor asks the connector for the payment's method (for_method) to
+authorize it and finalize_payment() applies the outcome: None for approved, or
+an error dict ({"code", "desc"}, like validate_payment_details) for a decline.
+
+ACQUIRER_UPI_URL / ACQUIRER_CARD_URL send that method to an HTTP acquirer.
+Unset, the method uses the simulated bank: TEST_PROCESSING_DELAY (TEST_MODE) or
+5-10 s, then TEST_PAYMENT_SUCCESS (TEST_MODE) or a 95% approval rate.
+
+The HTTP protocol is a POST of {"payment_id", "method", "amount", "currency"}
+with Idempotency-Key: <payment_id>, so retrying an authorization whose answer
+was lost doesn't charge twice. A 2xx answer is {"approved": true} or
+{"approved": false, "code": ..., "description": ...}; any other 4xx is a
+decline. Timeouts, transport errors, 408, 429 and 5xx raise AcquirerUnavailable:
+the job is retried with backoff and on its last attempt the payment fails with
+ACQUIRER_UNAVAILABLE. Payments that failed validation are not sent; they are
+held for the connector's typical answer time so they can't be told apart by
+timing. Card data never reaches the job table, so a real card acquirer would
+take a token from a vault in its place.
+
+Each HTTP connector has its own keep-alive pool and limits, set per method with
+a fallback to the shared setting: ACQUIRER_CARD_TIMEOUT_SECONDS, then
+ACQUIRER_TIMEOUT_SECONDS (default 10; keep it under JOB_VISIBILITY_TIMEOUT), and
+..._MAX_CONCURRENCY (default 200 requests in flight per process; more wait for
+a slot, up to the timeout).
+
+A circuit breaker per connector fails calls immediately once
+ACQUIRER_BREAKER_FAILURES (default 5) have failed in a row, instead of holding a
+job for the full timeout against a bank that is down. After
+ACQUIRER_BREAKER_RESET_SECONDS (default 30) one trial call goes through: success
+closes the circuit, failure opens it again.
+
+Try it locally against tools/acquirer_stub.py.
+"""
+import asyncio
+import os
+import random
+import time
+
+import httpx
+
+METHODS = ("upi", "card")
+UNAVAILABLE_ERROR = {"code": "ACQUIRER_UNAVAILABLE", "desc": "Bank could not be reached"}
+DECLINED_ERROR = {"code": "PAYMENT_FAILED", "desc": "Bank declined the transaction"}
+
+
+def _setting(method: str, name: str, default: str) -> str:
+    return os.getenv(f"ACQUIRER_{method.upper()}_{name}", os.getenv(f"ACQUIRER_{name}", default))
+
+
+class AcquirerUnavailable(Exception):
+    """The acquirer gave no answer (or the circuit is open); the outcome is unknown and the job should be retried."""
+
+
+def simulated_bank_delay() -> float:
+    """Returns the simulated bank latency in seconds (TEST_MODE aware)."""
+    test_mode = os.getenv("TEST_MODE", "false").lower() == "true"
+    delay_ms = int(os.getenv("TEST_PROCESSING_DELAY", "1000")) if test_mode else random.uniform(5000, 10000)
+    return delay_ms / 1000.0
+
+
+class SimulatedAcquirer:
+    """The built-in bank: a delay, then a coin toss."""
+
+    def __init__(self, method: str):
+        self.method = method
+        self.approved = 0
+        self.declined = 0
+
+    async def authorize(self, payment_id: str, payload: dict):
+        # Invalid details wait too, so a bad card and a decline take equally long
+        await asyncio.sleep(simulated_bank_delay())
+        if payload.get("error"):
+            return payload["error"]
+        test_mode = os.getenv("TEST_MODE", "false").lower() == "true"
+        approved = os.getenv("TEST_PAYMENT_SUCCESS", "true").lower() == "true" if test_mode else (random.random() < 0.95)
+        if approved:
+            self.approved += 1
+            return None
+        self.declined += 1
+        return DECLINED_ERROR
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"kind": "simulated", "approved": self.approved, "declined": self.declined}
+
+
+class CircuitBreaker:
+    """closed -> open after `failure_threshold` failures in a row -> half-open after `reset_seconds` -> closed on success."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        # Runs on the event loop only, so the state needs no lock
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._trial_running or (self._opened_at is None and self.consecutive_failures >= self.failure_threshold):
+            self.opened += 1
+            self._opened_at = time.monotonic()
+        self._trial_running = False
+
+    def release(self):
+        """Ends a trial call that neither succeeded nor failed (cancelled, or stuck behind our own cap)."""
+        self._trial_running = False
+
+    def stats(self) -> dict:
+        return {
+            "circuit_state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "circuit_opened": self.opened,
+            "circuit_rejected": self.rejected,
+        }
+
+
+class HttpAcquirer:
+    """An acquirer behind an HTTP endpoint, with a pooled client, a concurrency cap and a circuit breaker."""
+
+    def __init__(self, method: str, url: str, timeout: float, max_concurrency: int, breaker: CircuitBreaker):
+        self.method = method
+        self.url = url
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker
+        self.in_flight = 0
+        self.approved = 0
+        self.declined = 0
+        self.failures = 0
+        self.typical_seconds = 0.0  # Moving average of answered calls
+        self._client = None
+        self._slots = None
+
+    def _ensure_client(self):
+        # Built on first use, on the loop of the process that uses it
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+                follow_redirects=False,
+                trust_env=False,
+                headers={"User-Agent": "payment-gateway-acquirer/1.0"},
+            )
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    async def authorize(self, payment_id: str, payload: dict):
+        if payload.get("error"):
+            # Invalid details never go to the bank, but take as long as its answers usually do
+            await asyncio.sleep(self.typical_seconds)
+            return payload["error"]
+        if not self.breaker.allow():
+            raise AcquirerUnavailable(f"{self.method} acquirer circuit open")
+        try:
+            outcome = await self._call(payment_id, payload)
+        finally:
+            self.breaker.release()
+        if outcome is None:
+            self.approved += 1
+        else:
+            self.declined += 1
+        return outcome
+
+    async def _call(self, payment_id: str, payload: dict):
+        self._ensure_client()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            # Our own cap, not the bank's fault: the breaker doesn't count it
+            raise AcquirerUnavailable(f"{self.method} acquirer at {self.max_concurrency} requests in flight")
+        self.in_flight += 1
+        try:
+            res = await self._client.post(
+                self.url,
+                json={
+                    "payment_id": payment_id,
+                    "method": self.method,
+                    "amount": payload.get("amount"),
+                    "currency": payload.get("currency"),
+                },
+                headers={"Idempotency-Key": payment_id},
+                timeout=max(0.001, self.timeout - (time.monotonic() - started)),
+            )
+            outcome = self._outcome(res)
+        except (httpx.HTTPError, ValueError) as e:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise AcquirerUnavailable(f"{self.method} acquirer: {type(e).__name__}: {e}") from e
+        except AcquirerUnavailable:
+            self.failures += 1
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+        self.breaker.record_success()
+        self.typical_seconds += 0.05 * (time.monotonic() - started - self.typical_seconds)
+        return outcome
+
+    def _outcome(self, res: httpx.Response):
+        if res.status_code in (408, 429) or res.status_code >= 500:
+            raise AcquirerUnavailable(f"{self.method} acquirer answered HTTP {res.status_code}")
+        if not 200 <= res.status_code < 300:
+            return {"code": "PAYMENT_FAILED", "desc": f"Acquirer rejected the request (HTTP {res.status_code})"}
+        body = res.json()
+        if body.get("approved") is True:
+            return None
+        return {
+            "code": body.get("code") or DECLINED_ERROR["code"],
+            "desc": body.get("description") or DECLINED_ERROR["desc"],
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": "http",
+            "url": self.url,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "approved": self.approved,
+            "declined": self.declined,
+            "failures": self.failures,
+            "typical_seconds": round(self.typical_seconds, 4),
+            **self.breaker.stats(),
+        }
+
+
+def _build(method: str):
+    url = os.getenv(f"ACQUIRER_{method.upper()}_URL")
+    if not url:
+        return SimulatedAcquirer(method)
+    breaker = CircuitBreaker(
+        int(_setting(method, "BREAKER_FAILURES", "5")),
+        float(_setting(method, "BREAKER_RESET_SECONDS", "30")),
+    )
+    return HttpAcquirer(
+        method,
+        url,
+        float(_setting(method, "TIMEOUT_SECONDS", "10")),
+        int(_setting(method, "MAX_CONCURRENCY", "200")),
+        breaker,
+    )
+
+
+connectors = {method: _build(method) for method in METHODS}
+
+
+def for_method(method: str):
+    """The connector for a payment method; jobs queued before the method was recorded go to card's."""
+    return connectors.get(method) or connectors["card"]
+
+
+async def close():
+    for connector in connectors.values():
+        await connector.close()
+
+
+def stats() -> dict:
+    return {method: connector.stats() for method, connector in connectors.items()}
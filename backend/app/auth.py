@@ -1,7 +1,17 @@
+import hashlib
+import hmac
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
 from fastapi import Header, HTTPException, Depends, APIRouter
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
-from .database import get_db
+from . import telemetry
+from .database import get_session, run_db
 from .models import Merchant
+from .utils.cache import TTLCache
 from pydantic import BaseModel
 
 # 1. Initialize the router (This line solves the AttributeError)
@@ -13,13 +23,16 @@ class LoginRequest(BaseModel):
     api_key: str
 
 # 3. Add a login route so your frontend "Sign In" button works
-@router.post("/login")
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    merchant = db.query(Merchant).filter(
-        Merchant.email == payload.email,
-        Merchant.api_key == payload.api_key
+def _find_merchant_for_login(db: Session, email: str, api_key: str):
+    return db.query(Merchant).filter(
+        Merchant.email == email,
+        Merchant.api_key == api_key
     ).first()
 
+@router.post("/login")
+async def login(payload: LoginRequest, db: Session = Depends(get_session)):
+    merchant = await run_db(db, _find_merchant_for_login, payload.email, payload.api_key)
+
     if not merchant:
         raise HTTPException(status_code=401, detail="Invalid email or API key")
     
@@ -30,23 +43,104 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
         "api_key": merchant.api_key
     }
 
+@dataclass(frozen=True)
+class AuthenticatedMerchant:
+    """Read-only snapshot of a verified merchant, safe to share across requests."""
+    id: uuid.UUID
+    name: str
+    email: str
+    api_key: str
+    is_active: bool
+    webhook_url: Optional[str] = None
+    rate_limit_per_second: Optional[float] = None
+    rate_limit_burst: Optional[float] = None
+
+
+def _hash_secret(secret: str) -> bytes:
+    return hashlib.sha256(secret.encode()).digest()
+
+
+# 4. Verified-credential cache: api_key -> (sha256(api_secret), AuthenticatedMerchant).
+# Only a hash of the secret is kept in memory. Entries are evicted when a merchant's
+# credentials, is_active flag, webhook_url or rate limits change in this process; other processes pick up
+# changes within AUTH_CACHE_TTL_SECONDS.
+AUTH_CACHE_ENABLED = os.getenv("AUTH_CACHE_ENABLED", "true").lower() == "true"
+credential_cache = TTLCache(
+    max_entries=int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60")),
+)
+
+
+def invalidate_merchant_credentials(api_key: str):
+    credential_cache.pop(api_key)
+
+
+@event.listens_for(Merchant, "after_update")
+def _evict_on_credential_change(mapper, connection, target):
+    state = inspect(target)
+    changed = [
+        attr for attr in ("api_key", "api_secret", "is_active", "webhook_url", "rate_limit_per_second", "rate_limit_burst")
+        if state.attrs[attr].history.has_changes()
+    ]
+    if not changed:
+        return
+    # Evict both the old and the new key so a rotated key can't linger.
+    for value in state.attrs.api_key.history.sum():
+        if value:
+            invalidate_merchant_credentials(value)
+
+
+@event.listens_for(Merchant, "after_delete")
+def _evict_on_delete(mapper, connection, target):
+    invalidate_merchant_credentials(target.api_key)
+
+
+_AUTH_ERROR = {"error": {"code": "AUTHENTICATION_ERROR", "description": "Invalid API credentials"}}
+
+
+def _load_merchant(db: Session, api_key: str):
+    """(api_secret, AuthenticatedMerchant) for api_key, or None. Looked up by api_key alone (unique index)."""
+    row = db.query(Merchant).filter(Merchant.api_key == api_key).first()
+    if not row:
+        return None
+    return row.api_secret, AuthenticatedMerchant(
+        id=row.id,
+        name=row.name,
+        email=row.email,
+        api_key=row.api_key,
+        is_active=row.is_active,
+        webhook_url=row.webhook_url,
+        rate_limit_per_second=row.rate_limit_per_second,
+        rate_limit_burst=row.rate_limit_burst,
+    )
+
+
+# The lookup goes through run_db, so it never blocks the event loop (which also
+# drives the payment processor) whichever DB_DRIVER is configured.
 async def get_authenticated_merchant(
     x_api_key: str = Header(None, alias="X-Api-Key"),
     x_api_secret: str = Header(None, alias="X-Api-Secret"),
-    db: Session = Depends(get_db)
-):
-    if not x_api_key or not x_api_secret:
-        raise HTTPException(status_code=401, detail={
-            "error": {"code": "AUTHENTICATION_ERROR", "description": "Invalid API credentials"}
-        })
-    
-    merchant = db.query(Merchant).filter(
-        Merchant.api_key == x_api_key, 
-        Merchant.api_secret == x_api_secret
-    ).first()
-    
-    if not merchant:
-        raise HTTPException(status_code=401, detail={
-            "error": {"code": "AUTHENTICATION_ERROR", "description": "Invalid API credentials"}
-        })
-    return merchant
\ No newline at end of file
+    db: Session = Depends(get_session)
+) -> AuthenticatedMerchant:
+    with telemetry.stage("auth"):
+        if not x_api_key or not x_api_secret:
+            raise HTTPException(status_code=401, detail=_AUTH_ERROR)
+
+        if AUTH_CACHE_ENABLED:
+            cached = credential_cache.get(x_api_key)
+            if cached is not None:
+                secret_hash, merchant = cached
+                if hmac.compare_digest(secret_hash, _hash_secret(x_api_secret)):
+                    return merchant
+                raise HTTPException(status_code=401, detail=_AUTH_ERROR)
+
+        # run_db hands the pooled connection back as soon as the lookup is done, so it
+        # isn't held while the route waits for its own turn on the pool or threadpool.
+        found = await run_db(db, _load_merchant, x_api_key)
+        if not found or not hmac.compare_digest(found[0].encode(), x_api_secret.encode()):
+            raise HTTPException(status_code=401, detail=_AUTH_ERROR)
+
+        merchant = found[1]
+        if AUTH_CACHE_ENABLED:
+            credential_cache.set(x_api_key, (_hash_secret(x_api_secret), merchant))
+        return merchant
@@ -0,0 +1,246 @@
+"""
+BIN (IIN) metadata: card network, card type, issuer and country by card prefix.
+
+The source is a CSV of prefix ranges:
+
+    range_start,range_end,network,card_type,issuer,country
+    4,4,visa,,,
+    2221,2720,mastercard,,,
+    411111,411111,visa,credit,Example Bank,IN
+
+Ranges may nest or overlap; the narrowest range containing a card wins, so a
+full issuer file can sit on top of the network-level defaults in
+app/data/bins.csv. Prefixes are compared on the first KEY_DIGITS digits (a
+range's start is padded with 0s, its end with 9s).
+
+The CSV is compiled once into flat, non-overlapping segments stored as one
+.npy file per column and loaded with mmap, so every worker process on a host
+shares a single copy through the page cache. A lookup is one binary search.
+
+    BIN_TABLE_PATH=/data/bins.csv   # CSV (compiled into BIN_TABLE_CACHE_DIR) or a compiled directory
+    python -m app.bins compile /data/bins.csv /data/bins.compiled
+"""
+import argparse
+import csv
+import hashlib
+import heapq
+import os
+import re
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+KEY_DIGITS = 8
+FIELDS = ("network", "card_type", "issuer", "country")
+# Stored as fixed-width bytes; longer values are cut
+FIELD_WIDTHS = {"network": 16, "card_type": 10, "issuer": 64, "country": 2}
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bins.csv")
+BIN_TABLE_PATH = os.getenv("BIN_TABLE_PATH", DEFAULT_PATH)
+CACHE_DIR = os.getenv("BIN_TABLE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "payment-gateway-bins"))
+
+_NON_DIGITS = re.compile(r"[^0-9]")
+
+
+@dataclass(frozen=True)
+class BinInfo:
+    network: str
+    card_type: Optional[str] = None
+    issuer: Optional[str] = None
+    country: Optional[str] = None
+
+
+def bin_key(card_number: str):
+    """The first KEY_DIGITS digits of a card number, zero-padded, as an int; None without digits."""
+    digits = _NON_DIGITS.sub("", card_number or "")[:KEY_DIGITS]
+    return int(digits.ljust(KEY_DIGITS, "0")) if digits else None
+
+
+def _range_bounds(start: str, end: str):
+    start, end = start.strip(), end.strip() or start.strip()
+    if not start.isdigit() or not end.isdigit() or len(start) > KEY_DIGITS or len(end) > KEY_DIGITS:
+        raise ValueError(f"BIN range {start!r}-{end!r} must be 1-{KEY_DIGITS} digit prefixes")
+    low, high = int(start.ljust(KEY_DIGITS, "0")), int(end.ljust(KEY_DIGITS, "9"))
+    if low > high:
+        raise ValueError(f"BIN range {start!r}-{end!r} is reversed")
+    return low, high
+
+
+def read_csv(path: str) -> list:
+    """[(low, high, {field: value})] in file order."""
+    ranges = []
+    with open(path, newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            try:
+                low, high = _range_bounds(row["range_start"], row.get("range_end") or "")
+            except (KeyError, ValueError, AttributeError) as e:
+                raise ValueError(f"{path}:{line}: {e}") from e
+            ranges.append((low, high, {field: (row.get(field) or "").strip() for field in FIELDS}))
+    return ranges
+
+
+def flatten(ranges: list):
+    """
+    Splits possibly overlapping ranges into sorted, disjoint segments, each
+    labelled with the narrowest range covering it (the later row on a tie).
+    Returns (starts, ends, labels) where labels index into `ranges`.
+    """
+    opening = sorted(range(len(ranges)), key=lambda i: ranges[i][0])
+    boundaries = sorted({r[0] for r in ranges} | {r[1] + 1 for r in ranges})
+    active = []  # heap of (width, -row, row)
+    starts, ends, labels = [], [], []
+    next_open = 0
+    for b, next_b in zip(boundaries, boundaries[1:]):
+        while next_open < len(opening) and ranges[opening[next_open]][0] == b:
+            row = opening[next_open]
+            heapq.heappush(active, (ranges[row][1] - ranges[row][0], -row, row))
+            next_open += 1
+        while active and ranges[active[0][2]][1] < b:
+            heapq.heappop(active)  # Wider ranges that ended are dropped lazily, once on top
+        if not active:
+            continue
+        row = active[0][2]
+        if labels and labels[-1] == row and ends[-1] == b - 1:
+            ends[-1] = next_b - 1
+        else:
+            starts.append(b)
+            ends.append(next_b - 1)
+            labels.append(row)
+    return starts, ends, labels
+
+
+def compile_table(csv_path: str, out_dir: str, replace: bool = False):
+    """
+    Compiles a BIN CSV into a directory of column files, moved into place in one
+    rename. If out_dir already exists it is kept (another process compiled the
+    same CSV first, and may have its files open) unless replace is set.
+    """
+    ranges = read_csv(csv_path)
+    starts, ends, labels = flatten(ranges)
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".bins-")
+    try:
+        np.save(os.path.join(tmp, "start.npy"), np.array(starts, dtype=np.uint32))
+        np.save(os.path.join(tmp, "end.npy"), np.array(ends, dtype=np.uint32))
+        for field in FIELDS:
+            values = [ranges[row][2][field].encode()[:FIELD_WIDTHS[field]] for row in labels]
+            np.save(os.path.join(tmp, f"{field}.npy"), np.array(values, dtype=f"S{FIELD_WIDTHS[field]}"))
+        if os.path.isdir(out_dir):
+            if not replace:
+                shutil.rmtree(tmp)
+                return len(ranges), len(starts)
+            shutil.rmtree(out_dir)
+        try:
+            os.replace(tmp, out_dir)
+        except OSError:
+            # Lost the race to a process that finished first (ENOTEMPTY/EEXIST): use its copy
+            if replace or not os.path.isdir(out_dir):
+                raise
+            shutil.rmtree(tmp)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return len(ranges), len(starts)
+
+
+class BinTable:
+    """Read-only view over a compiled table; safe to share across threads."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.starts = np.load(os.path.join(directory, "start.npy"), mmap_mode="r")
+        self.ends = np.load(os.path.join(directory, "end.npy"), mmap_mode="r")
+        self.columns = {field: np.load(os.path.join(directory, f"{field}.npy"), mmap_mode="r") for field in FIELDS}
+        # A Python int key would make searchsorted cast (copy) the whole table on every call
+        self._key_type = self.starts.dtype.type
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, keys: np.ndarray) -> np.ndarray:
+        """Segment index for each key, -1 where no range covers it."""
+        keys = np.asarray(keys, dtype=self.starts.dtype)
+        index = np.searchsorted(self.starts, keys, side="right") - 1
+        covered = index >= 0
+        covered[covered] = keys[covered] <= self.ends[index[covered]]
+        return np.where(covered, index, -1)
+
+    def lookup(self, card_number: str) -> Optional[BinInfo]:
+        key = bin_key(card_number)
+        if key is None:
+            return None
+        index = int(np.searchsorted(self.starts, self._key_type(key), side="right")) - 1
+        if index < 0 or key > self.ends[index]:
+            return None
+        values = {field: self.columns[field][index].decode() or None for field in FIELDS}
+        return BinInfo(network=values.pop("network") or "unknown", **values)
+
+    def networks(self, keys: np.ndarray) -> np.ndarray:
+        """Network name per key ('unknown' where no range covers it), as a str array."""
+        index = self.find(keys)
+        if not len(self):
+            return np.full(len(index), "unknown")
+        names = self.columns["network"][np.maximum(index, 0)].astype(str)
+        names[(index < 0) | (names == "")] = "unknown"
+        return names
+
+
+def _compiled_path(csv_path: str) -> str:
+    with open(csv_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, f"{os.path.splitext(os.path.basename(csv_path))[0]}-{digest}")
+
+
+def load(path: str = None) -> BinTable:
+    """Opens a compiled directory, or a CSV via its compiled copy in CACHE_DIR (built on first use)."""
+    path = path or BIN_TABLE_PATH
+    if os.path.isdir(path):
+        return BinTable(path)
+    compiled = _compiled_path(path)
+    if not os.path.isdir(compiled):
+        compile_table(path, compiled)
+    return BinTable(compiled)
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_table() -> BinTable:
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = load()
+    return _table
+
+
+def lookup(card_number: str) -> Optional[BinInfo]:
+    return get_table().lookup(card_number)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BIN table tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compile_cmd = sub.add_parser("compile", help="compile a BIN CSV for BIN_TABLE_PATH")
+    compile_cmd.add_argument("csv_path")
+    compile_cmd.add_argument("out_dir")
+    lookup_cmd = sub.add_parser("lookup", help="look up card numbers in BIN_TABLE_PATH")
+    lookup_cmd.add_argument("card_numbers", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        rows, segments = compile_table(args.csv_path, args.out_dir, replace=True)
+        print(f"Compiled {rows} ranges into {segments} segments in {args.out_dir}")
+    else:
+        for number in args.card_numbers:
+            print(f"{number}: {lookup(number)}")
+
+
+if __name__ == "__main__":
+    main()
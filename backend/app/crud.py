@@ -1,37 +1,281 @@
+from datetime import datetime
+
+from sqlalchemy import JSON, Text, cast, func, insert, literal, select
 from sqlalchemy.orm import Session
-from . import models
+from . import job_queue, models, rollups
+from .utils.pagination import DEFAULT_PAGE_SIZE, keyset_page
+
+STATS_GROUPS = ("day", "hour", "method", "card_network", "status")
+# merchant_payment_rollups has no card_network dimension
+ROLLUP_GROUPS = ("day", "hour", "method", "status")
+
+def _time_bucket(db: Session, unit: str, column):
+    """column truncated to the hour/day, in the connected database's dialect."""
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(unit, column)
+    fmt = "%Y-%m-%dT%H:00:00" if unit == "hour" else "%Y-%m-%dT00:00:00"
+    return func.strftime(fmt, column)
 
-def get_merchant_stats(db: Session, merchant_id: str):
+def _payment_stats_source(merchant_id, created_from, created_to):
+    """Aggregates over raw payments: COUNT/SUM ... FILTER."""
+    P = models.Payment
+    is_success = P.status == "success"
+    columns = (
+        func.count(P.id).label("total_transactions"),
+        func.count(P.id).filter(is_success).label("successful_transactions"),
+        func.count(P.id).filter(P.status == "failed").label("failed_transactions"),
+        func.coalesce(func.sum(P.amount).filter(is_success), 0).label("total_amount"),
+    )
+    window = [P.merchant_id == merchant_id]
+    if created_from:
+        window.append(P.created_at >= created_from)
+    if created_to:
+        window.append(P.created_at < created_to)
+    return P, P.created_at, columns, window
+
+def _rollup_stats_source(merchant_id, created_from, created_to):
     """
-    Calculates real-time data for the dashboard stats-container.
+    The same aggregates summed from hourly rollup buckets.
+    Windows widen to whole hours: a bucket counts if its hour overlaps [from, to).
     """
-    # Fetch all payments for the specific merchant
-    payments = db.query(models.Payment).filter(models.Payment.merchant_id == merchant_id).all()
-    
-    total_transactions = len(payments)
-    
-    # Calculate total-amount from the sum of all successful payment amounts
-    successful_payments = [p for p in payments if p.status == "success"]
-    total_amount = sum(p.amount for p in successful_payments)
-    
-    # Calculate success-rate as (successful payments / total payments) × 100
+    R = models.MerchantPaymentRollup
+    is_success = R.status == "success"
+    columns = (
+        func.coalesce(func.sum(R.payment_count), 0).label("total_transactions"),
+        func.coalesce(func.sum(R.payment_count).filter(is_success), 0).label("successful_transactions"),
+        func.coalesce(func.sum(R.payment_count).filter(R.status == "failed"), 0).label("failed_transactions"),
+        func.coalesce(func.sum(R.amount_total).filter(is_success), 0).label("total_amount"),
+    )
+    window = [R.merchant_id == merchant_id]
+    if created_from:
+        window.append(R.bucket_start >= created_from.replace(minute=0, second=0, microsecond=0))
+    if created_to:
+        window.append(R.bucket_start < created_to)
+    return R, R.bucket_start, columns, window
+
+_STATS_SOURCES = {"payments": _payment_stats_source, "rollups": _rollup_stats_source}
+
+def _stats_row(row) -> dict:
+    total = int(row.total_transactions)
+    successful = int(row.successful_transactions)
     success_rate = 0
-    if total_transactions > 0:
-        success_rate = (len(successful_payments) / total_transactions) * 100
-        
+    if total > 0:
+        success_rate = (successful / total) * 100
     return {
-        "total_transactions": total_transactions,
-        "total_amount": total_amount,
-        "success_rate": round(success_rate, 2)
+        "total_transactions": total,
+        "successful_transactions": successful,
+        "failed_transactions": int(row.failed_transactions),
+        "total_amount": int(row.total_amount),
+        "success_rate": round(success_rate, 2),
     }
 
-def get_all_merchant_payments(db: Session, merchant_id: str):
+def get_merchant_stats(db: Session, merchant_id: str, created_from=None, created_to=None, source="payments"):
+    """
+    Calculates real-time data for the dashboard stats-container.
+    Aggregated in the database, so no payment rows are loaded. source="rollups"
+    reads merchant_payment_rollups instead of scanning payments.
+    """
+    _, _, columns, window = _STATS_SOURCES[source](merchant_id, created_from, created_to)
+    return _stats_row(db.query(*columns).filter(*window).one())
+
+def get_merchant_stats_breakdown(db: Session, merchant_id: str, group_by, created_from=None, created_to=None, source="payments"):
+    """
+    The same aggregates grouped by any of STATS_GROUPS (ROLLUP_GROUPS for
+    source="rollups"), e.g. ["day", "method"]. At most one of "day"/"hour" may be used.
+    """
+    model, time_column, columns, window = _STATS_SOURCES[source](merchant_id, created_from, created_to)
+    keys = []
+    for group in group_by:
+        if group in ("day", "hour"):
+            keys.append(_time_bucket(db, group, time_column).label(group))
+        else:
+            keys.append(getattr(model, group).label(group))
+
+    rows = db.query(*keys, *columns).filter(*window).group_by(*keys).order_by(*keys).all()
+
+    groups = []
+    for row in rows:
+        item = {}
+        for group in group_by:
+            value = getattr(row, group)
+            item[group] = value.isoformat() if hasattr(value, "isoformat") else value
+        item.update(_stats_row(row))
+        groups.append(item)
+    return groups
+
+def get_merchant_stats_report(db: Session, merchant_id, group_by, created_from=None, created_to=None, source="payments"):
+    """Summary plus optional breakdown for /payments/stats, as a single unit of work."""
+    summary = get_merchant_stats(db, merchant_id, created_from, created_to, source=source)
+    groups = get_merchant_stats_breakdown(db, merchant_id, group_by, created_from, created_to, source=source) if group_by else []
+    return summary, groups
+
+def _apply_common_filters(query, model, status=None, created_from=None, created_to=None, min_amount=None, max_amount=None):
+    if status:
+        query = query.filter(model.status == status)
+    if created_from:
+        query = query.filter(model.created_at >= created_from)
+    if created_to:
+        query = query.filter(model.created_at < created_to)
+    if min_amount is not None:
+        query = query.filter(model.amount >= min_amount)
+    if max_amount is not None:
+        query = query.filter(model.amount <= max_amount)
+    return query
+
+def get_merchant_payments_page(db: Session, merchant_id, cursor=None, limit=DEFAULT_PAGE_SIZE, method=None, **filters):
     """
-    Fetches all payments for the transactions-table on the dashboard.
+    One page of payments for the transactions-table on the dashboard, newest first.
+    Served by ix_payments_merchant_created / ix_payments_merchant_status_created.
+    """
+    query = db.query(models.Payment).filter(models.Payment.merchant_id == merchant_id)
+    query = _apply_common_filters(query, models.Payment, **filters)
+    if method:
+        query = query.filter(models.Payment.method == method)
+    return keyset_page(query, models.Payment, cursor, limit)
+
+def get_merchant_orders_page(db: Session, merchant_id, cursor=None, limit=DEFAULT_PAGE_SIZE, **filters):
     """
-    return db.query(models.Payment).filter(
-        models.Payment.merchant_id == merchant_id
-    ).order_by(models.Payment.created_at.desc()).all()
+    One page of orders for the merchant, newest first.
+    Served by ix_orders_merchant_created / ix_orders_merchant_status_created.
+    """
+    query = db.query(models.Order).filter(models.Order.merchant_id == merchant_id)
+    query = _apply_common_filters(query, models.Order, **filters)
+    return keyset_page(query, models.Order, cursor, limit)
+
+def get_merchant_webhook_events_page(db: Session, merchant_id, cursor=None, limit=DEFAULT_PAGE_SIZE, status=None, event=None):
+    """One page of the merchant's webhook delivery log, newest first. Served by ix_webhook_events_merchant_created."""
+    query = db.query(models.WebhookEvent).filter(models.WebhookEvent.merchant_id == merchant_id)
+    if status:
+        query = query.filter(models.WebhookEvent.status == status)
+    if event:
+        query = query.filter(models.WebhookEvent.event == event)
+    return keyset_page(query, models.WebhookEvent, cursor, limit)
+
+def get_webhook_event(db: Session, merchant_id, event_id: str):
+    """The event with its attempts (oldest first), or None."""
+    row = (
+        db.query(models.WebhookEvent)
+        .filter(models.WebhookEvent.id == event_id, models.WebhookEvent.merchant_id == merchant_id)
+        .first()
+    )
+    if row is None:
+        return None
+    attempts = (
+        db.query(models.WebhookAttempt)
+        .filter(models.WebhookAttempt.event_id == event_id)
+        .order_by(models.WebhookAttempt.id)
+        .all()
+    )
+    return row, attempts
+
+def get_archived_partitions(db: Session, table_name: str, created_from=None, created_to=None):
+    """Archived months of table_name overlapping [created_from, created_to), oldest first."""
+    A = models.ArchivedPartition
+    query = db.query(A).filter(A.table_name == table_name)
+    if created_from:
+        query = query.filter(A.range_end > created_from)
+    if created_to:
+        query = query.filter(A.range_start.is_(None) | (A.range_start < created_to))
+    return query.order_by(A.range_end).all()
+
+def set_merchant_webhook_url(db: Session, merchant_id, webhook_url):
+    merchant = db.get(models.Merchant, merchant_id)
+    merchant.webhook_url = webhook_url
+    db.commit()
+    return merchant.webhook_url
+
+def create_order(db: Session, order: models.Order, claim=None):
+    """Inserts the order; claim (idempotency.Claim) stores the response in the same transaction."""
+    db.add(order)
+    if claim is not None:
+        db.flush()
+        claim.record(db, order)
+    db.commit()
+    db.refresh(order)
+    return order
+
+def create_orders(db: Session, rows: list):
+    """
+    Inserts many orders with one multi-row INSERT ... RETURNING (batched by the
+    driver) and returns them in input order. Flushed only: the caller commits.
+    """
+    if not rows:
+        return []
+    return list(db.scalars(insert(models.Order).returning(models.Order, sort_by_parameter_order=True), rows))
+
+def _payment_insert(values: dict, merchant_id=None):
+    """
+    INSERT INTO payments (...) SELECT <values>, <order columns> FROM orders WHERE
+    id = :order_id RETURNING payments.*: the order lookup, the insert and the
+    read-back in one statement. Inserts nothing if the order doesn't exist (or
+    isn't merchant_id's, when given).
+    """
+    P, O = models.Payment.__table__, models.Order.__table__
+    own = {name: value for name, value in values.items() if name != "order_id"}
+    order = select(
+        *(literal(value, P.c[name].type) for name, value in own.items()),
+        O.c.id, O.c.merchant_id, O.c.amount, O.c.currency,
+    ).where(O.c.id == values["order_id"])
+    if merchant_id is not None:
+        order = order.where(O.c.merchant_id == merchant_id)
+    return insert(P).from_select([*own, "order_id", "merchant_id", "amount", "currency"], order).returning(*P.c)
+
+def _with_job_and_rollup(payment_insert, created_at, validation_error):
+    """Postgres: the payment INSERT as a CTE, with its job INSERT and rollup upsert as CTEs reading from it."""
+    new = payment_insert.cte("new_payment")
+    J = models.PaymentJob.__table__
+    now = datetime.utcnow()
+    payload = func.json_build_object(
+        cast(literal("error"), Text), cast(literal(validation_error, JSON), JSON),
+        cast(literal("method"), Text), new.c.method,
+        cast(literal("amount"), Text), new.c.amount,
+        cast(literal("currency"), Text), new.c.currency,
+    )
+    job = insert(J).from_select(
+        ["payment_id", "payload", "status", "attempts", "max_attempts", "run_at", "created_at", "updated_at"],
+        select(new.c.id, payload, literal("queued"), literal(0), literal(job_queue.MAX_ATTEMPTS),
+               literal(now), literal(now), literal(now)),
+    ).cte("new_job")
+    rollup = rollups.upsert_from(select(
+        new.c.merchant_id, literal(rollups.hour_bucket(created_at)), new.c.method, new.c.status,
+        literal(1), new.c.amount, literal(now),
+    )).cte("new_rollup")
+    return select(new).add_cte(job, rollup)
+
+def create_payment(db: Session, values: dict, merchant_id=None, validation_error=None):
+    """
+    Inserts a 'processing' payment for values["order_id"] with its finalization job
+    and its rollup count: one statement on Postgres (the job and rollup writes
+    are CTEs around the payment INSERT), three elsewhere. Only the validation
+    outcome goes into the job payload, never card data.
+
+    Returns the payment, not attached to the session (so commit has nothing to
+    expire and reload), or None when the order doesn't exist. Does not commit.
+    """
+    values = {**values, "status": "processing", "updated_at": values["created_at"]}
+    stmt = _payment_insert(values, merchant_id)
+    if db.get_bind().dialect.name == "postgresql":
+        row = db.execute(_with_job_and_rollup(stmt, values["created_at"], validation_error)).mappings().first()
+        return models.Payment(**row) if row else None
+    row = db.execute(stmt).mappings().first()
+    if row is None:
+        return None
+    payment = models.Payment(**row)
+    job_queue.enqueue(db, payment.id, {
+        "error": validation_error, "method": payment.method, "amount": payment.amount, "currency": payment.currency,
+    })
+    rollups.record_created(db, payment)
+    return payment
+
+def get_order(db: Session, order_id: str, merchant_id=None):
+    """The order, scoped to merchant_id when given (None for the public checkout lookups)."""
+    query = db.query(models.Order).filter(models.Order.id == order_id)
+    if merchant_id is not None:
+        query = query.filter(models.Order.merchant_id == merchant_id)
+    return query.first()
+
+def get_payment(db: Session, payment_id: str):
+    return db.query(models.Payment).filter(models.Payment.id == payment_id).first()
 
 def get_merchant_by_api_keys(db: Session, api_key: str, api_secret: str):
     """
@@ -1,32 +1,94 @@
+import asyncio
 import os
 import time
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import IntegrityError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 
-# 1. Fetch URL from environment
+from .utils.metrics import Histogram, counter_lines, gauge_lines
+
+# 1. Fetch URLs from environment; DATABASE_READ_URL (optional) is a read replica
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
 
 # 2. Fix prefix for SQLAlchemy 1.4+ (postgres:// -> postgresql://)
 if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
     SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
+if DATABASE_READ_URL and DATABASE_READ_URL.startswith("postgres://"):
+    DATABASE_READ_URL = DATABASE_READ_URL.replace("postgres://", "postgresql://", 1)
 
-# 3. Connection Resilience
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True)
+# 3. Pool settings, per process (API replica or worker process).
+# The defaults add up to 40 connections: AnyIO's threadpool size, so a sync
+# handler holding a thread never has to queue for a connection as well.
+# Pre-ping costs a round trip per checkout; stale connections are instead
+# recycled before the server's idle timeout, and a connection that fails
+# mid-query invalidates the pool so the next checkout reconnects.
+POOL_SETTINGS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "20")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "false").lower() == "true",
+}
 
-# Loop to wait for the external network to stabilize
-for i in range(12): 
-    try:
-        with engine.connect() as connection:
+
+class _CheckoutTimingMixin:
+    """Times every checkout: queueing for a free connection plus opening a new one."""
+    wait_seconds = None  # Histogram, set per engine by _instrumented()
+    timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            type(self).timeouts += 1
+            raise
+        finally:
+            self.wait_seconds.observe(time.perf_counter() - start)
+
+
+def _instrumented(pool_class):
+    # A subclass per engine: Pool.recreate() (e.g. on engine.dispose()) rebuilds
+    # from the class alone, and the histogram has to survive that.
+    return type(f"Instrumented{pool_class.__name__}", (_CheckoutTimingMixin, pool_class), {"wait_seconds": Histogram()})
+
+
+def _engine_options(url, pool_class):
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}  # In-memory SQLite keeps its single-connection pool
+    return {"poolclass": _instrumented(pool_class), **POOL_SETTINGS}
+
+
+# Nothing connects here; wait_for_database() does that from the startup hook.
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL, QueuePool))
+
+
+async def wait_for_database(attempts: int = None, delay: float = None):
+    """Waits for the database to accept connections, without blocking the event loop."""
+    attempts = attempts or int(os.getenv("DB_CONNECT_ATTEMPTS", "12"))
+    delay = delay if delay is not None else float(os.getenv("DB_CONNECT_RETRY_SECONDS", "5"))
+
+    def ping():
+        with engine.connect():
+            pass
+
+    for i in range(attempts):
+        try:
+            await run_in_threadpool(ping)
             print("Successfully connected to the database!")
-            break
-    except OperationalError as e:
-        if i == 11:
-            print("Final database connection attempt failed.")
-            raise e
-        print(f"Database connection attempt {i+1}/12 failed. Retrying in 5s...")
-        time.sleep(5)
+            return
+        except OperationalError:
+            if i == attempts - 1:
+                print("Final database connection attempt failed.")
+                raise
+            print(f"Database connection attempt {i+1}/{attempts} failed. Retrying in {delay:g}s...")
+            await asyncio.sleep(delay)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -36,4 +98,311 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def with_session(fn, *args):
+    """Runs fn(session, *args) in a fresh sync session; for background workers (via run_in_threadpool)."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+# 4. Request-path driver. "sync" runs queries with psycopg2 on the threadpool;
+# "async" runs them on the event loop with asyncpg (aiosqlite for local SQLite).
+# Schema sync, seeding and the payment processor always use the sync engine.
+DB_DRIVER = os.getenv("DB_DRIVER", "sync").lower()
+
+
+def _async_database_url(url: str):
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    url = url.set(drivername="postgresql+asyncpg")
+    # asyncpg spells libpq's sslmode as ssl
+    if "sslmode" in url.query:
+        url = url.update_query_dict({"ssl": url.query["sslmode"]}).difference_update_query(["sslmode"])
+    return url
+
+
+AsyncSession = None
+async_engine = None
+AsyncSessionLocal = None
+if DB_DRIVER == "async":
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    async_url = _async_database_url(SQLALCHEMY_DATABASE_URL)
+    async_engine = create_async_engine(async_url, **_engine_options(async_url, AsyncAdaptedQueuePool))
+    # Results are read after run_db closes the session, so nothing may be left expired.
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+elif DB_DRIVER != "sync":
+    raise RuntimeError(f"DB_DRIVER must be 'sync' or 'async', got {DB_DRIVER!r}")
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Dependency for request handlers; pass the session to run_db.
+get_session = get_async_db if DB_DRIVER == "async" else get_db
+
+
+def open_session():
+    """A session for the configured driver, for code outside a request's dependencies (e.g. streams)."""
+    return AsyncSessionLocal() if DB_DRIVER == "async" else SessionLocal()
+
+
+# 5. Read replica. GET endpoints that can tolerate a little lag take
+# get_read_session and run their queries with run_read. Their sessions are on
+# the replica while ReplicaMonitor's last check found it reachable and no more
+# than REPLICA_MAX_LAG_SECONDS behind, and on the primary otherwise (or when no
+# DATABASE_READ_URL is set).
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "2"))
+
+read_engine = None
+ReadSessionLocal = None
+async_read_engine = None
+AsyncReadSessionLocal = None
+if DATABASE_READ_URL:
+    read_engine = create_engine(DATABASE_READ_URL, **_engine_options(DATABASE_READ_URL, QueuePool))
+    # info["replica"] tells run_read where a session points
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine, info={"replica": True})
+    if DB_DRIVER == "async":
+        async_read_url = _async_database_url(DATABASE_READ_URL)
+        async_read_engine = create_async_engine(async_read_url, **_engine_options(async_read_url, AsyncAdaptedQueuePool))
+        AsyncReadSessionLocal = async_sessionmaker(
+            async_read_engine, autoflush=False, expire_on_commit=False, info={"replica": True},
+        )
+
+# 0 while the replica replays everything it has received; on a primary (or
+# another database standing in for a replica) both functions return NULL.
+_REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() IS NOT DISTINCT FROM pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReplicaMonitor:
+    """Checks the replica every REPLICA_CHECK_SECONDS and says whether reads may go to it."""
+
+    def __init__(self, max_lag_seconds: float, interval: float):
+        self.max_lag_seconds = max_lag_seconds
+        self.interval = interval
+        self.healthy = False  # Until the first check passes
+        self.lag_seconds = None
+        self.checks = 0
+        self.failures = 0
+        self.fallbacks = 0
+        self.last_error = None
+        self._task = None
+
+    def check(self) -> float:
+        """Replication lag in seconds (blocking)."""
+        with read_engine.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                return float(conn.execute(_REPLICA_LAG_SQL).scalar() or 0)
+            conn.execute(text("SELECT 1"))
+            return 0.0
+
+    async def _run(self):
+        while True:
+            try:
+                self.lag_seconds = await run_in_threadpool(self.check)
+                self.healthy = self.lag_seconds <= self.max_lag_seconds
+                self.last_error = None if self.healthy else f"lag {self.lag_seconds:.1f}s over {self.max_lag_seconds:g}s"
+            except Exception as e:
+                self.healthy = False
+                self.failures += 1
+                self.last_error = repr(e)
+            self.checks += 1
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if read_engine is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def mark_down(self, error: Exception):
+        """Sends reads to the primary until the next check passes."""
+        self.healthy = False
+        self.last_error = repr(error)
+
+    def stats(self) -> dict:
+        return {
+            "configured": read_engine is not None,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "checks": self.checks,
+            "failures": self.failures,
+            "fallbacks": self.fallbacks,
+            "last_error": self.last_error,
+        }
+
+
+replica = ReplicaMonitor(REPLICA_MAX_LAG_SECONDS, REPLICA_CHECK_SECONDS)
+
+
+def get_read_db():
+    db = ReadSessionLocal() if replica.healthy else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    async with (AsyncReadSessionLocal() if replica.healthy else AsyncSessionLocal()) as db:
+        yield db
+
+
+# Dependency for read-only handlers; pass the session to run_read.
+get_read_session = get_async_read_db if DB_DRIVER == "async" else get_read_db
+
+
+def open_sync_read_session():
+    """A sync session on the replica when it is usable, else on the primary (e.g. for streamed exports)."""
+    return ReadSessionLocal() if replica.healthy else SessionLocal()
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """
+    Runs fn(session, *args, **kwargs) as one unit of work and returns its result.
+
+    With an AsyncSession fn runs through run_sync, so its ORM calls await the
+    async driver without blocking the loop; with a Session it runs on the
+    threadpool. Either way the session is closed afterwards: the connection goes
+    back to the pool between units instead of being held while the handler waits
+    for its next turn, and returned objects stay readable (detached, not expired).
+    """
+    if AsyncSession is not None and isinstance(db, AsyncSession):
+        try:
+            return await db.run_sync(fn, *args, **kwargs)
+        finally:
+            await db.close()
+
+    def unit():
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+
+    return await run_in_threadpool(unit)
+
+
+ID_INSERT_ATTEMPTS = 3
+
+
+async def run_db_new_ids(db, fn, *args, **kwargs):
+    """
+    run_db for a unit that inserts rows under ids it draws itself with
+    generate_custom_id(). An IntegrityError (such as the primary key already
+    holding one of those ids) rolls the unit back and runs it again with new
+    ids, up to ID_INSERT_ATTEMPTS times, instead of failing the request.
+    """
+    for attempt in range(1, ID_INSERT_ATTEMPTS + 1):
+        try:
+            return await run_db(db, fn, *args, **kwargs)
+        except IntegrityError:
+            if attempt == ID_INSERT_ATTEMPTS:
+                raise
+
+
+async def run_read(db, fn, *args, **kwargs):
+    """
+    run_db for a get_read_session session. If the session is on the replica and
+    fn finds nothing (returns None), fn runs again on the primary, because a row
+    the client has just created may not have replicated yet. The same happens
+    if the replica fails; it is then marked down.
+    """
+    return await run_read_settled(db, _found, fn, *args, **kwargs)
+
+
+def _found(result) -> bool:
+    return result is not None
+
+
+async def run_read_settled(db, settled, fn, *args, **kwargs):
+    """
+    run_read that keeps the replica's result only when settled(result) is true,
+    e.g. a payment status that can't change any more; otherwise fn runs again on
+    the primary, since the replica may be behind on a change already made there.
+    """
+    if not db.info.get("replica"):
+        return await run_db(db, fn, *args, **kwargs)
+    try:
+        result = await run_db(db, fn, *args, **kwargs)
+        if settled(result):
+            return result
+    except (OperationalError, OSError) as e:
+        replica.mark_down(e)
+    replica.fallbacks += 1
+    return await run_db(open_session(), fn, *args, **kwargs)
+
+
+def _pool_stats(engine_):
+    pool = engine_.pool
+    if not isinstance(pool, _CheckoutTimingMixin):
+        return {"class": type(pool).__name__}
+    return {
+        "class": type(pool).__name__,
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # Negative while the pool has not yet opened pool_size connections
+        "overflow": pool.overflow(),
+        "timeout_seconds": pool.timeout(),
+        "recycle_seconds": POOL_SETTINGS["pool_recycle"],
+        "pre_ping": POOL_SETTINGS["pool_pre_ping"],
+        "timeouts": pool.timeouts,
+        "checkout_wait_seconds": pool.wait_seconds.snapshot(),
+    }
+
+
+def pool_stats() -> dict:
+    """Pool occupancy and checkout wait times for this process's engines."""
+    stats = {"sync": _pool_stats(engine)}
+    if async_engine is not None:
+        stats["async"] = _pool_stats(async_engine.sync_engine)
+    if read_engine is not None:
+        stats["read"] = _pool_stats(read_engine)
+    if async_read_engine is not None:
+        stats["async_read"] = _pool_stats(async_read_engine.sync_engine)
+    return stats
+
+
+def pool_metric_lines() -> list:
+    """Pool occupancy as Prometheus gauges, timeouts as a counter and checkout waits as histograms, per engine."""
+    pools = {"sync": engine.pool}
+    if async_engine is not None:
+        pools["async"] = async_engine.sync_engine.pool
+    if read_engine is not None:
+        pools["read"] = read_engine.pool
+    if async_read_engine is not None:
+        pools["async_read"] = async_read_engine.sync_engine.pool
+    pools = {name: pool for name, pool in pools.items() if isinstance(pool, _CheckoutTimingMixin)}
+    lines = []
+    for metric, help_text, read in (
+        ("db_pool_size", "Configured pool_size", lambda pool: pool.size()),
+        ("db_pool_checked_out", "Connections in use", lambda pool: pool.checkedout()),
+        ("db_pool_checked_in", "Idle connections in the pool", lambda pool: pool.checkedin()),
+        ("db_pool_overflow", "Connections beyond pool_size (negative until the pool has filled)", lambda pool: pool.overflow()),
+    ):
+        lines.extend(gauge_lines(metric, help_text, [({"engine": name}, read(pool)) for name, pool in pools.items()]))
+    lines.extend(counter_lines(
+        "db_pool_timeouts_total", "Checkouts that hit pool_timeout", [({"engine": name}, pool.timeouts) for name, pool in pools.items()],
+    ))
+    lines += ["# HELP db_pool_checkout_wait_seconds Time to check out a connection", "# TYPE db_pool_checkout_wait_seconds histogram"]
+    for name, pool in pools.items():
+        lines.extend(pool.wait_seconds.prometheus_lines("db_pool_checkout_wait_seconds", {"engine": name}))
+    return lines
@@ -0,0 +1,224 @@
+"""
+Payment status events for the checkout page.
+
+finalize_payment() publishes a small status event in the same transaction that
+moves a payment out of 'processing':
+  - On Postgres it is a pg_notify() on PAYMENT_STATUS_CHANNEL, delivered on
+    commit to every API replica's PostgresStatusListener (including the one in
+    the process that finalized it), which feeds the local bus.
+  - Elsewhere (SQLite, local runs) it is handed to the local bus after commit,
+    so only the embedded worker's own process hears it.
+
+SSE and long-poll requests wait on the bus instead of re-querying the database.
+"""
+import asyncio
+import json
+import os
+from collections import defaultdict
+
+from sqlalchemy import Text, cast, event, func, literal, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+PAYMENT_STATUS_CHANNEL = "payment_status"
+TERMINAL_STATUSES = ("success", "failed")
+
+
+# Kept small: NOTIFY payloads are limited to 8000 bytes.
+STATUS_FIELDS = ("id", "order_id", "status", "error_code", "error_description")
+
+
+def status_event(payment) -> dict:
+    """The event for a Payment, or for a PaymentResponse body (dict)."""
+    if isinstance(payment, dict):
+        return {field: payment[field] for field in STATUS_FIELDS}
+    return {field: getattr(payment, field) for field in STATUS_FIELDS}
+
+
+def notify_status(payment):
+    """
+    pg_notify() of the status event built in SQL from `payment`'s columns (e.g. a
+    CTE of the finalizing UPDATE), so it goes out with that statement.
+    """
+    fields = []
+    for field in STATUS_FIELDS:
+        fields += [cast(literal(field), Text), payment.c[field]]
+    return func.pg_notify(PAYMENT_STATUS_CHANNEL, cast(func.json_build_object(*fields), Text))
+
+
+class PaymentEventBus:
+    """In-process pub/sub keyed by payment id. Subscribers are asyncio queues on the app's loop."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)  # payment_id -> {asyncio.Queue}
+        self._listeners = []  # Called with every status event, e.g. cache invalidation
+        self._loop = None
+        self.published = 0
+        self.delivered = 0
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def subscribe(self, payment_id: str) -> asyncio.Queue:
+        """Call on the event loop, before reading the payment, so no update can slip in between."""
+        queue = asyncio.Queue()
+        self._subscribers[payment_id].add(queue)
+        return queue
+
+    def unsubscribe(self, payment_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(payment_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[payment_id]
+
+    def publish(self, status: dict):
+        """Thread-safe; a no-op in processes without an attached loop (e.g. standalone workers)."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(status)
+        else:
+            loop.call_soon_threadsafe(self._dispatch, status)
+
+    def _dispatch(self, status: dict):
+        self.published += 1
+        for fn in self._listeners:
+            fn(status)
+        for queue in self._subscribers.get(status["id"], ()):
+            queue.put_nowait(status)
+            self.delivered += 1
+
+    def stats(self) -> dict:
+        return {
+            "payments_watched": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+
+bus = PaymentEventBus()
+
+
+def publish_status(db: Session, payment):
+    """Announces the payment's new status once the caller's transaction commits."""
+    status = status_event(payment)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(select(func.pg_notify(PAYMENT_STATUS_CHANNEL, json.dumps(status))))
+    else:
+        event.listen(db, "after_commit", lambda session: bus.publish(status), once=True)
+
+
+class PostgresStatusListener:
+    """
+    LISTENs on PAYMENT_STATUS_CHANNEL over a dedicated psycopg2 connection and
+    feeds every notification into the bus. Reads are driven by the event loop
+    (add_reader), so the listener costs no thread. Reconnects with backoff;
+    notifications sent while disconnected are lost, which is why streams also
+    re-read the payment now and then.
+    """
+
+    def __init__(self, engine, reconnect_seconds: float = 5.0):
+        self.engine = engine
+        self.reconnect_seconds = reconnect_seconds
+        self.connected = False
+        self._task = None
+        self._raw = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _connect(self):
+        raw = self.engine.raw_connection()
+        raw.detach()  # Owned by the listener for good, never returned to the pool
+        conn = raw.driver_connection
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {PAYMENT_STATUS_CHANNEL}")
+        return raw
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                self._raw = await run_in_threadpool(self._connect)
+                conn = self._raw.driver_connection
+                lost = asyncio.Event()
+
+                def on_readable():
+                    try:
+                        conn.poll()
+                    except Exception:
+                        lost.set()
+                        return
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            bus.publish(json.loads(notify.payload))
+                        except ValueError:
+                            pass
+
+                loop.add_reader(conn.fileno(), on_readable)
+                self.connected = True
+                print(f"Listening for payment status events on '{PAYMENT_STATUS_CHANNEL}'")
+                try:
+                    await lost.wait()
+                finally:
+                    loop.remove_reader(conn.fileno())
+                    self.connected = False
+                print("Payment status listener lost its connection; reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Payment status listener failed to connect: {e!r}")
+            finally:
+                if self._raw is not None:
+                    try:
+                        self._raw.close()
+                    except Exception:
+                        pass
+                    self._raw = None
+            await asyncio.sleep(self.reconnect_seconds)
+
+
+# Server-sent events tuning
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+# Re-read the payment this often in case a notification was missed
+SSE_RECHECK_SECONDS = float(os.getenv("SSE_RECHECK_SECONDS", "60"))
+# Streams end after this long; EventSource reconnects on its own
+SSE_MAX_SECONDS = float(os.getenv("SSE_MAX_SECONDS", "300"))
+LONG_POLL_MAX_SECONDS = 30
+
+
+async def wait_for_terminal(queue: asyncio.Queue, timeout: float):
+    """The next terminal status event from a subscription, or None after timeout seconds."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return None
+        try:
+            status = await asyncio.wait_for(queue.get(), remaining)
+        except asyncio.TimeoutError:
+            return None
+        if status["status"] in TERMINAL_STATUSES:
+            return status
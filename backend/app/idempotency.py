@@ -0,0 +1,211 @@
+"""
+Idempotency-Key support for create endpoints.
+
+The first request with a key claims it (an 'in_progress' row in idempotency_keys)
+and records its response in the same transaction that creates the order or
+payment. Retries with the same key get that response back instead of creating
+another row. A retry that arrives while the first request is still running
+waits for it: on the in-process event when both landed on the same replica,
+otherwise by polling the row. If the first request fails, its claim is
+released and a waiting retry takes over.
+
+    async with idempotency.guard(db, key, scope, payload, schemas.OrderResponse, 201) as claim:
+        if claim.replay:
+            return claim.replay
+        ...  # inside the unit of work: flush, claim.record(db, order), commit
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import run_db
+
+TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# How long an 'in_progress' claim is honoured before another request may take it over
+LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+# How long a concurrent duplicate waits for the original before giving up with 409
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+MAX_KEY_LENGTH = 255
+# Expired keys are purged opportunistically by roughly one claim in PURGE_EVERY
+PURGE_EVERY = 100
+
+_keys = models.IdempotencyKey.__table__
+
+# (scope, key) -> Event set when this process's in-flight request for it finishes
+_inflight = {}
+
+
+def fingerprint(payload) -> str:
+    """sha256 of the canonical JSON of the request, to spot a key reused for a different request."""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class Claim:
+    """Ownership of a key for the duration of one request. key=None means no Idempotency-Key was sent."""
+
+    def __init__(self, scope: str, key: str, fingerprint: str, schema, status_code: int):
+        self.scope = scope
+        self.key = key
+        self.fingerprint = fingerprint
+        self.schema = schema  # Response model the stored body is rendered with
+        self.status_code = status_code
+        self.replay = None  # JSONResponse of the original request, for retries
+        self.recorded = False
+
+    def record(self, db: Session, obj):
+        """Stores the response for this key. Call inside the unit of work, after flush and before commit."""
+        if self.key is None:
+            return
+        db.execute(
+            update(_keys)
+            .where(_keys.c.scope == self.scope, _keys.c.key == self.key)
+            .values(
+                status="completed",
+                locked_until=None,
+                response_code=self.status_code,
+                response_body=self.schema.model_validate(obj).model_dump(mode="json"),
+            )
+        )
+        self.recorded = True
+
+
+def _claim(db: Session, scope: str, key: str, fp: str):
+    """
+    One attempt at owning (scope, key). Returns ("owner", None), ("replay", (code, body)),
+    ("busy", None) or ("mismatch", None).
+    """
+    now = datetime.utcnow()
+    lease = {
+        "fingerprint": fp,
+        "status": "in_progress",
+        "locked_until": now + timedelta(seconds=LOCK_SECONDS),
+        "response_code": None,
+        "response_body": None,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=TTL_SECONDS),
+    }
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    inserted = db.execute(
+        dialect_insert(_keys).values(scope=scope, key=key, **lease).on_conflict_do_nothing(index_elements=["scope", "key"])
+    )
+    if random.randrange(PURGE_EVERY) == 0:
+        purge_expired(db, now)
+    db.commit()
+    if inserted.rowcount == 1:
+        return "owner", None
+
+    row = db.query(models.IdempotencyKey).filter_by(scope=scope, key=key).first()
+    if row is None:
+        return "busy", None  # Released between our insert and read; the caller retries
+    if row.expires_at <= now:
+        # An expired key starts over, whatever it was used for before
+        takeover = update(_keys).where(_keys.c.scope == scope, _keys.c.key == key, _keys.c.expires_at <= now)
+    elif row.fingerprint != fp:
+        return "mismatch", None
+    elif row.status == "completed":
+        return "replay", (row.response_code, row.response_body)
+    elif row.locked_until <= now:
+        # The original request died without releasing its claim
+        takeover = update(_keys).where(
+            _keys.c.scope == scope, _keys.c.key == key,
+            _keys.c.status == "in_progress", _keys.c.locked_until <= now,
+        )
+    else:
+        return "busy", None
+
+    taken = db.execute(takeover.values(**lease))
+    db.commit()
+    return ("owner", None) if taken.rowcount == 1 else ("busy", None)
+
+
+def _release(db: Session, scope: str, key: str):
+    db.execute(delete(_keys).where(_keys.c.scope == scope, _keys.c.key == key, _keys.c.status == "in_progress"))
+    db.commit()
+
+
+def purge_expired(db: Session, now: datetime = None):
+    """Deletes expired keys (served by the expires_at index). The caller commits."""
+    db.execute(delete(_keys).where(_keys.c.expires_at <= (now or datetime.utcnow())))
+
+
+def _error(status_code: int, code: str, description: str, headers=None):
+    return HTTPException(status_code=status_code, detail={"error": {"code": code, "description": description}}, headers=headers)
+
+
+async def _acquire(db, claim: Claim):
+    """Claims the key, replays its stored response, or waits out a concurrent duplicate."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + WAIT_SECONDS
+    poll = 0.05
+    while True:
+        outcome, stored = await run_db(db, _claim, claim.scope, claim.key, claim.fingerprint)
+        if outcome == "owner":
+            _inflight[(claim.scope, claim.key)] = asyncio.Event()
+            return
+        if outcome == "replay":
+            code, body = stored
+            claim.replay = JSONResponse(status_code=code, content=body, headers={"Idempotent-Replayed": "true"})
+            return
+        if outcome == "mismatch":
+            raise _error(422, "IDEMPOTENCY_KEY_REUSED", "Idempotency-Key was already used with a different request")
+
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise _error(
+                409, "IDEMPOTENCY_KEY_IN_PROGRESS",
+                "A request with this Idempotency-Key is still being processed",
+                headers={"Retry-After": "1"},
+            )
+        event = _inflight.get((claim.scope, claim.key))
+        try:
+            if event is not None:
+                # Same replica: woken as soon as the original finishes
+                await asyncio.wait_for(event.wait(), remaining)
+            else:
+                await asyncio.sleep(min(poll, remaining))
+                poll = min(poll * 2, 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+@asynccontextmanager
+async def guard(db, key, scope: str, payload, schema, status_code: int = 201):
+    """
+    Yields a Claim for the request. claim.replay is set when the key already has a
+    response. If the body raises or returns without claim.record(), the key is
+    released so a retry can run the request again.
+    """
+    if key is None:
+        yield Claim(scope, None, None, schema, status_code)
+        return
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise _error(400, "BAD_REQUEST_ERROR", f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    claim = Claim(scope, key, fingerprint(payload), schema, status_code)
+    await _acquire(db, claim)
+    if claim.replay:
+        yield claim
+        return
+
+    try:
+        yield claim
+    finally:
+        try:
+            if not claim.recorded:
+                await run_db(db, _release, scope, key)
+        finally:
+            event = _inflight.pop((scope, key), None)
+            if event is not None:
+                event.set()
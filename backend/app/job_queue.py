@@ -0,0 +1,155 @@
+import os
+import random
+import socket
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+
+VISIBILITY_TIMEOUT_SECONDS = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "60"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "300"))
+HEARTBEAT_INTERVAL_SECONDS = int(os.getenv("WORKER_HEARTBEAT_INTERVAL", "10"))
+
+
+def worker_identity(suffix: str = "") -> str:
+    """hostname:pid[:suffix] - unique per worker process."""
+    identity = f"{socket.gethostname()}:{os.getpid()}"
+    return f"{identity}:{suffix}" if suffix else identity
+
+
+def enqueue(db: Session, payment_id: str, payload: dict = None) -> models.PaymentJob:
+    """
+    Adds a finalization job for a payment. Does not commit: callers commit it
+    together with the payment row so a payment never exists without its job.
+    """
+    job = models.PaymentJob(
+        payment_id=payment_id,
+        payload=payload,
+        status="queued",
+        attempts=0,
+        max_attempts=MAX_ATTEMPTS,
+        run_at=datetime.utcnow(),
+    )
+    db.add(job)
+    return job
+
+
+def claim(db: Session, worker_id: str, limit: int) -> list:
+    """
+    Leases up to `limit` runnable jobs to `worker_id` and returns them as dicts.
+
+    A job is runnable when it is queued and due, or when it is 'running' but its
+    lease expired (the worker holding it died) and it has attempts left. An
+    expired job that has used them all is dead-lettered instead, so a job that
+    kills or hangs its worker every time isn't retried forever. SKIP LOCKED lets
+    any number of workers claim concurrently without blocking on each other's rows.
+    """
+    now = datetime.utcnow()
+    expired = (models.PaymentJob.status == "running") & (models.PaymentJob.locked_until < now)
+    db.query(models.PaymentJob).filter(expired, models.PaymentJob.attempts >= models.PaymentJob.max_attempts).update(
+        {"status": "dead", "last_error": "lease expired", "locked_by": None, "locked_until": None, "updated_at": now},
+        synchronize_session=False,
+    )
+    jobs = (
+        db.query(models.PaymentJob)
+        .filter(
+            ((models.PaymentJob.status == "queued") & (models.PaymentJob.run_at <= now))
+            | (expired & (models.PaymentJob.attempts < models.PaymentJob.max_attempts))
+        )
+        .order_by(models.PaymentJob.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    claimed = []
+    for job in jobs:
+        job.status = "running"
+        job.attempts = (job.attempts or 0) + 1
+        job.locked_by = worker_id
+        job.locked_until = now + timedelta(seconds=VISIBILITY_TIMEOUT_SECONDS)
+        claimed.append({"id": job.id, "payment_id": job.payment_id, "payload": job.payload or {}, "attempts": job.attempts,
+                        "max_attempts": job.max_attempts})
+    db.commit()
+    return claimed
+
+
+def complete(db: Session, job_id: int):
+    db.query(models.PaymentJob).filter(models.PaymentJob.id == job_id).update(
+        {"status": "done", "locked_by": None, "locked_until": None, "updated_at": datetime.utcnow()},
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+def retry_delay(attempts: int, base: float = RETRY_BASE_SECONDS, maximum: float = RETRY_MAX_SECONDS) -> float:
+    """Exponential backoff with full jitter, capped at `maximum`."""
+    ceiling = min(maximum, base * (2 ** max(attempts - 1, 0)))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def fail(db: Session, job_id: int, error: str):
+    """Schedules a retry, or dead-letters the job once it is out of attempts."""
+    job = db.query(models.PaymentJob).filter(models.PaymentJob.id == job_id).first()
+    if not job:
+        return
+    job.last_error = error[:2000]
+    job.locked_by = None
+    job.locked_until = None
+    if job.attempts >= job.max_attempts:
+        job.status = "dead"
+    else:
+        job.status = "queued"
+        job.run_at = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+    db.commit()
+
+
+def heartbeat(db: Session, worker_id: str):
+    now = datetime.utcnow()
+    worker = db.query(models.QueueWorker).filter(models.QueueWorker.id == worker_id).first()
+    if worker:
+        worker.last_seen = now
+    else:
+        db.add(models.QueueWorker(
+            id=worker_id,
+            hostname=socket.gethostname(),
+            pid=os.getpid(),
+            started_at=now,
+            last_seen=now,
+        ))
+    db.commit()
+
+
+def deregister(db: Session, worker_id: str):
+    db.query(models.QueueWorker).filter(models.QueueWorker.id == worker_id).delete(synchronize_session=False)
+    db.commit()
+
+
+def stats(db: Session) -> dict:
+    """Queue depth, oldest due job age and live worker count for /health."""
+    now = datetime.utcnow()
+    counts = dict(
+        db.query(models.PaymentJob.status, func.count())
+        .filter(models.PaymentJob.status.in_(["queued", "running", "dead"]))
+        .group_by(models.PaymentJob.status)
+        .all()
+    )
+    oldest = (
+        db.query(func.min(models.PaymentJob.run_at))
+        .filter(models.PaymentJob.status == "queued", models.PaymentJob.run_at <= now)
+        .scalar()
+    )
+    live_cutoff = now - timedelta(seconds=HEARTBEAT_INTERVAL_SECONDS * 3)
+    live_workers = db.query(func.count()).select_from(models.QueueWorker).filter(
+        models.QueueWorker.last_seen >= live_cutoff
+    ).scalar()
+    return {
+        "depth": counts.get("queued", 0),
+        "running": counts.get("running", 0),
+        "dead": counts.get("dead", 0),
+        "oldest_job_age_seconds": round((now - oldest).total_seconds(), 3) if oldest else 0,
+        "live_workers": live_workers,
+    }
@@ -1,18 +1,76 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
+import os
+import uuid
 
-from . import auth
+import asyncio
+
+from . import acquirers, auth, bins, events, job_queue, models, partitions, public_cache, rate_limit, schema, telemetry
+from .webhooks import webhook_dispatcher
 
 # Internal imports based on your structure
-from .database import engine, Base, SessionLocal, get_db
+from .database import (
+    async_engine, async_read_engine, engine, read_engine, replica, SessionLocal, get_session, pool_metric_lines, pool_stats,
+    run_db, wait_for_database,
+)
 from .models import Merchant
 # UPDATED: Added 'auth' to the router imports
-from .routers import orders, payments 
+from .routers import archive, orders, payments, webhooks
+from .processor import payment_processor
 import sqlalchemy
 
-app = FastAPI(title="Payment Gateway API")
+# 2. Connect, create tables and seed merchant on startup
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The first connection is made here rather than at import, so importing the
+    # app (workers, CLIs, tests) never waits on the network.
+    await wait_for_database()
+    schema.sync_schema(engine)
+    seed_test_merchant()
+    # Compiles (first process on the host) and maps the BIN table before traffic arrives
+    bins.get_table()
+    # Status streams wait on this process's event bus, fed across replicas by LISTEN/NOTIFY.
+    events.bus.attach(asyncio.get_running_loop())
+    status_listener = None
+    if engine.dialect.name == "postgresql":
+        status_listener = events.PostgresStatusListener(engine)
+        await status_listener.start()
+    # Single-container deployments finalize payments in-process. Set
+    # EMBEDDED_WORKER=false when running `python -m app.worker` separately.
+    if os.getenv("EMBEDDED_WORKER", "true").lower() == "true":
+        await payment_processor.start()
+    # Webhook outbox delivery; as with payments, `python -m app.worker` can take it over.
+    if os.getenv("EMBEDDED_WEBHOOK_DISPATCHER", "true").lower() == "true":
+        await webhook_dispatcher.start()
+    # Read-only GETs go to DATABASE_READ_URL while it is reachable and caught up
+    await replica.start()
+    # Keeps upcoming monthly partitions of orders and payments created
+    partition_maintenance = None
+    if models.PARTITIONED:
+        partition_maintenance = asyncio.create_task(partitions.maintain_forever(engine))
+    yield
+    if partition_maintenance is not None:
+        partition_maintenance.cancel()
+    await replica.stop()
+    if webhook_dispatcher.running:
+        await webhook_dispatcher.stop()
+    if payment_processor.running:
+        await payment_processor.stop()
+    if status_listener is not None:
+        await status_listener.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
+    if async_read_engine is not None:
+        await async_read_engine.dispose()
+    if read_engine is not None:
+        read_engine.dispose()
+    engine.dispose()
+
+app = FastAPI(title="Payment Gateway API", lifespan=lifespan)
 
 # Initialize FastAPI app
 app.add_middleware(
@@ -26,13 +84,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link", "Idempotent-Replayed", "Retry-After", "Server-Timing"],
 )
-
-# 2. Create tables and seed merchant on startup
-@app.on_event("startup")
-def startup_event():
-    Base.metadata.create_all(bind=engine)
-    seed_test_merchant()
+# Added last so it is outermost: timings include CORS handling
+app.add_middleware(telemetry.MetricsMiddleware)
 
 def seed_test_merchant():
     """
@@ -48,7 +103,7 @@ def seed_test_merchant():
         
         if not exists:
             test_merchant = Merchant(
-                id=test_id,
+                id=uuid.UUID(test_id),
                 name="Test Merchant",
                 email=test_email,
                 api_key="key_test_abc123",
@@ -64,34 +119,83 @@ def seed_test_merchant():
 
 # 3. Include Routers
 # UPDATED: Added auth router so the /api/v1/auth/login path is active
-app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
-app.include_router(orders.router, prefix="/api/v1/orders", tags=["Orders"])
-app.include_router(payments.router, prefix="/api/v1/payments", tags=["Payments"])
+for router, prefix, tag in (
+    (auth.router, "/api/v1/auth", "Authentication"),
+    (orders.router, "/api/v1/orders", "Orders"),
+    (payments.router, "/api/v1/payments", "Payments"),
+    (webhooks.router, "/api/v1/webhooks", "Webhooks"),
+    (archive.router, "/api/v1/archive", "Archive"),
+):
+    app.include_router(router, prefix=prefix, tags=[tag])
+    telemetry.register_routes(router, prefix)  # Full route templates for the metric labels
 
 # 4. Enhanced Health Check Endpoint (Deliverable 2 Requirement)
+def _database_health(db: Session):
+    # Dynamic check for database
+    db.execute(sqlalchemy.text("SELECT 1"))
+    return job_queue.stats(db)
+
 @app.get("/health")
-def health_check():
+async def health_check(db: Session = Depends(get_session)):
     db_status = "disconnected"
+    queue_stats = None
     try:
-        # Dynamic check for database
-        db = SessionLocal()
-        db.execute(sqlalchemy.text("SELECT 1"))
+        queue_stats = await run_db(db, _database_health)
         db_status = "connected"
-        db.close()
     except Exception:
         db_status = "disconnected"
 
     return {
-        "status": "healthy",
+        "status": "healthy" if db_status == "connected" else "degraded",
         "database": db_status,
-        "redis": "connected", 
-        "worker": "running",   
+        "queue": queue_stats,
+        "worker": "running" if queue_stats and queue_stats["live_workers"] > 0 else "stopped",
+        "processor": payment_processor.stats() if payment_processor.running else None,
+        "webhooks": webhook_dispatcher.stats() if webhook_dispatcher.running else None,
+        "acquirers": acquirers.stats() if payment_processor.running else None,
+        "auth_cache": auth.credential_cache.stats(),
+        "status_events": events.bus.stats(),
+        "public_cache": public_cache.stats(),
+        "rate_limit": rate_limit.stats(),
+        "replica": replica.stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    }
+
+def _component_metric_lines() -> list:
+    lines = pool_metric_lines()
+    if payment_processor.running:
+        lines += telemetry.stats_lines("payment_processor", payment_processor.stats())
+        lines += telemetry.stats_lines("acquirer", acquirers.stats(), by="method")
+    if webhook_dispatcher.running:
+        lines += telemetry.stats_lines("webhook_dispatcher", webhook_dispatcher.stats())
+    lines += telemetry.stats_lines("auth_cache", auth.credential_cache.stats())
+    cache_stats = public_cache.stats()
+    lines += telemetry.stats_lines("public_cache", {name: cache_stats[name] for name in ("orders", "payments")}, by="cache")
+    limits = rate_limit.stats()
+    lines += telemetry.stats_lines("rate_limit", limits)
+    lines += telemetry.stats_lines("admission", limits["admission"])
+    lines += telemetry.stats_lines("db_replica", replica.stats())
+    return lines
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text format, for this process only: scrape every replica."""
+    return PlainTextResponse(telemetry.render(_component_metric_lines), media_type="text/plain; version=0.0.4")
+
+def _find_test_merchant(db: Session):
+    return db.query(Merchant).filter(Merchant.email == "test@example.com").first()
+
+@app.get("/health/pool")
+async def health_pool():
+    """Connection pool occupancy and checkout wait histogram, for sizing DB_POOL_SIZE per replica."""
+    return {
+        "pools": pool_stats(),
         "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
     }
 
 @app.get("/api/v1/test/merchant")
-def get_test_merchant(db: Session = Depends(get_db)):
-    merchant = db.query(Merchant).filter(Merchant.email == "test@example.com").first()
+async def get_test_merchant(db: Session = Depends(get_session)):
+    merchant = await run_db(db, _find_test_merchant)
     if not merchant:
         raise HTTPException(status_code=404, detail="Test merchant not found")
         
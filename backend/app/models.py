@@ -1,8 +1,17 @@
+import os
 import uuid
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, DateTime, Float, ForeignKey, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 from datetime import datetime
-from .database import Base
+from .database import Base, engine
+
+# DB_PARTITIONING=true range-partitions orders and payments by created_at month on
+# Postgres (see app/partitions.py). A partitioned table can only be unique on keys
+# that include created_at, so it joins their primary keys, and payments.order_id
+# can't be a foreign key to orders.
+PARTITIONED = os.getenv("DB_PARTITIONING", "false").lower() == "true" and engine.dialect.name == "postgresql"
+_partition_args = {"postgresql_partition_by": "RANGE (created_at)"} if PARTITIONED else {}
+_order_fk = () if PARTITIONED else (ForeignKey("orders.id"),)
 
 class Merchant(Base):
     __tablename__ = "merchants"
@@ -13,6 +22,9 @@ class Merchant(Base):
     api_secret = Column(String(64), nullable=False)
     webhook_url = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
+    # Token bucket overrides for this merchant (app/rate_limit.py); null uses the defaults
+    rate_limit_per_second = Column(Float, nullable=True)
+    rate_limit_burst = Column(Float, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -25,13 +37,19 @@ class Order(Base):
     receipt = Column(String(255), nullable=True)
     notes = Column(JSON, nullable=True)
     status = Column(String(20), default='created')
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, primary_key=PARTITIONED)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Keyset pagination on (created_at, id) per merchant, optionally per status
+    __table_args__ = (
+        Index("ix_orders_merchant_created", "merchant_id", "created_at", "id"),
+        Index("ix_orders_merchant_status_created", "merchant_id", "status", "created_at", "id"),
+        _partition_args,
+    )
 
 class Payment(Base):
     __tablename__ = "payments"
     id = Column(String(64), primary_key=True) # Format: pay_ + 16 chars
-    order_id = Column(String(64), ForeignKey("orders.id"), nullable=False)
+    order_id = Column(String(64), *_order_fk, nullable=False)
     merchant_id = Column(UUID(as_uuid=True), ForeignKey("merchants.id"), nullable=False)
     amount = Column(Integer, nullable=False)
     currency = Column(String(3), default='INR')
@@ -40,7 +58,121 @@ class Payment(Base):
     vpa = Column(String(255), nullable=True)
     card_network = Column(String(20), nullable=True)
     card_last4 = Column(String(4), nullable=True)
+    # From the BIN table (app/bins.py) when the payment was made
+    card_type = Column(String(10), nullable=True)  # credit, debit, prepaid
+    card_issuer = Column(String(64), nullable=True)
+    card_country = Column(String(2), nullable=True)  # ISO 3166-1 alpha-2
     error_code = Column(String(50), nullable=True)
     error_description = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, primary_key=PARTITIONED)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Keyset pagination on (created_at, id) per merchant, optionally per status
+    __table_args__ = (
+        Index("ix_payments_merchant_created", "merchant_id", "created_at", "id"),
+        Index("ix_payments_merchant_status_created", "merchant_id", "status", "created_at", "id"),
+        _partition_args,
+    )
+class PaymentJob(Base):
+    __tablename__ = "payment_jobs"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    payment_id = Column(String(64), nullable=False, index=True)
+    payload = Column(JSON, nullable=True)
+    status = Column(String(20), default='queued')  # queued, running, done, dead
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_at = Column(DateTime, default=datetime.utcnow)  # Earliest time the job may be claimed
+    locked_by = Column(String(128), nullable=True)
+    locked_until = Column(DateTime, nullable=True)  # Visibility timeout for 'running' jobs
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__ = (Index("ix_payment_jobs_status_run_at", "status", "run_at"),)
+
+class QueueWorker(Base):
+    __tablename__ = "queue_workers"
+    id = Column(String(128), primary_key=True)  # hostname:pid
+    hostname = Column(String(255), nullable=False)
+    pid = Column(Integer, nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime, default=datetime.utcnow)
+
+class MerchantPaymentRollup(Base):
+    """Per-merchant payment counts and amounts, bucketed by hour, method and status."""
+    __tablename__ = "merchant_payment_rollups"
+    merchant_id = Column(UUID(as_uuid=True), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)  # Hour the payments were created in
+    method = Column(String(20), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    payment_count = Column(Integer, nullable=False, default=0)
+    amount_total = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class IdempotencyKey(Base):
+    """Outcome of a create request, replayed to retries carrying the same Idempotency-Key."""
+    __tablename__ = "idempotency_keys"
+    scope = Column(String(128), primary_key=True)  # merchant id + endpoint, or 'public:' + order id
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # sha256 of the request body
+    status = Column(String(20), default='in_progress')  # in_progress, completed
+    locked_until = Column(DateTime, nullable=True)  # An in_progress key may be taken over after this
+    response_code = Column(Integer, nullable=True)
+    response_body = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class WebhookEvent(Base):
+    """Outbox of merchant webhooks, written in the transaction that finalizes the payment."""
+    __tablename__ = "webhook_events"
+    id = Column(String(64), primary_key=True)  # Format: whevt_ + 16 chars
+    merchant_id = Column(UUID(as_uuid=True), ForeignKey("merchants.id"), nullable=False)
+    event = Column(String(50), nullable=False)  # payment.success, payment.failed
+    payment_id = Column(String(64), nullable=True)
+    url = Column(String, nullable=False)  # merchants.webhook_url when the event was raised
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), default='pending')  # pending, delivering, delivered, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=8)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    locked_by = Column(String(128), nullable=True)
+    locked_until = Column(DateTime, nullable=True)  # Lease of a 'delivering' event
+    last_response_code = Column(Integer, nullable=True)
+    last_error = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    delivered_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        Index("ix_webhook_events_status_next_attempt", "status", "next_attempt_at"),
+        Index("ix_webhook_events_merchant_created", "merchant_id", "created_at", "id"),
+    )
+
+class WebhookAttempt(Base):
+    """One HTTP delivery attempt of a webhook event."""
+    __tablename__ = "webhook_attempts"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    event_id = Column(String(64), ForeignKey("webhook_events.id"), nullable=False, index=True)
+    attempt = Column(Integer, nullable=False)
+    response_code = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class RateLimitBucket(Base):
+    """Shared token bucket per api_key or client IP, for RATE_LIMIT_STORE=postgres."""
+    __tablename__ = "rate_limit_buckets"
+    key = Column(String(255), primary_key=True)  # merchant:<api_key> or ip:<address>
+    tokens = Column(Float, nullable=False)
+    allowed = Column(Boolean, nullable=False)  # Outcome of the last request
+    updated_at = Column(DateTime, nullable=False, index=True)
+
+class ArchivedPartition(Base):
+    """A month of orders or payments exported by `python -m app.partitions archive` and dropped."""
+    __tablename__ = "archived_partitions"
+    name = Column(String(63), primary_key=True)  # e.g. payments_p2025_01
+    table_name = Column(String(63), nullable=False)  # orders, payments
+    range_start = Column(DateTime, nullable=True)  # None for the legacy partition (MINVALUE)
+    range_end = Column(DateTime, nullable=False)  # Exclusive
+    path = Column(String, nullable=False)  # Relative to ARCHIVE_DIR
+    format = Column(String(20), default='csv.gz')
+    row_count = Column(BigInteger, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_archived_partitions_table_range", "table_name", "range_end"),)
@@ -0,0 +1,363 @@
+"""
+Monthly range partitions of orders and payments, and archival of old months.
+
+With DB_PARTITIONING=true (Postgres only) orders and payments are partitioned by
+created_at month: payments_p2026_10, payments_p2026_11, ... The indexes declared
+on the models are created on the parent table, so Postgres builds them on every
+partition, merchant-scoped scans only visit the months in their window, and
+vacuum works one month at a time.
+
+ensure_partitions() keeps PARTITION_MONTHS_AHEAD months of partitions ready. It
+runs in sync_schema() at startup and every PARTITION_MAINTENANCE_INTERVAL_SECONDS
+in the API; run `maintain` from cron when the API isn't long-lived.
+
+archive() exports each month that ended more than ARCHIVE_RETENTION_MONTHS ago
+to ARCHIVE_DIR/<table>/<partition>.csv.gz, records it in archived_partitions and
+drops the partition. Archived rows stay readable through GET /api/v1/archive/{table}.
+ARCHIVE_DIR must be shared by the archiving host and every API replica.
+
+    python -m app.partitions migrate     # partitions existing tables; stop the API and workers first
+    python -m app.partitions maintain
+    python -m app.partitions archive [--retention-months 13] [--dry-run]
+    python -m app.partitions list
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import insert, text
+from sqlalchemy.schema import CreateIndex
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+
+PARTITIONED_TABLES = ("orders", "payments")  # orders first: migrate() drops payments' foreign key to it
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "21600"))
+ARCHIVE_RETENTION_MONTHS = int(os.getenv("ARCHIVE_RETENTION_MONTHS", "13"))
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", "archive"))
+# DDL on a partitioned table locks the parent; give up rather than queue every
+# request behind a long-running query.
+LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+_ADVISORY_LOCK = 0x7061727473  # Serializes maintenance across replicas
+_EXPORT_CHUNK_BYTES = 64 * 1024
+
+Partition = namedtuple("Partition", "name start end")  # start/end None for MINVALUE/MAXVALUE
+
+
+def month_start(ts: datetime) -> datetime:
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(ts: datetime, months: int) -> datetime:
+    month = ts.month - 1 + months
+    return ts.replace(year=ts.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def _bound(value: str):
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def list_partitions(conn, table: str) -> list:
+    """The table's partitions with their ranges, oldest first."""
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": table})
+    found = []
+    for name, expr in rows:
+        match = re.search(r"FROM \((.+?)\) TO \((.+?)\)", expr or "")
+        if match:
+            found.append(Partition(name, _bound(match.group(1)), _bound(match.group(2))))
+    return sorted(found, key=lambda p: p.end or datetime.max)
+
+
+def is_partitioned(conn, table: str) -> bool:
+    return conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"), {"table": table}
+    ).first() is not None
+
+
+def partitioned_tables(engine) -> set:
+    if engine.dialect.name != "postgresql":
+        return set()
+    with engine.connect() as conn:
+        return {table for table in PARTITIONED_TABLES if is_partitioned(conn, table)}
+
+
+def index_names(conn, table: str) -> set:
+    """Index names on table, including partitioned indexes, which reflection may not report."""
+    rows = conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": table})
+    return {name for (name,) in rows}
+
+
+def _lock(conn):
+    conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _ADVISORY_LOCK})
+
+
+def ensure_partitions(engine, months_ahead: int = None, now: datetime = None) -> list:
+    """
+    Creates the partitions for this month and the next months_ahead months,
+    skipping months an existing partition already covers. Returns the new names.
+    """
+    months_ahead = PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    first = month_start(now or datetime.utcnow())
+    quote = engine.dialect.identifier_preparer.quote
+    created = []
+    with engine.begin() as conn:
+        _lock(conn)
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(conn, table):
+                print(f"{table} is not partitioned; run `python -m app.partitions migrate`")
+                continue
+            existing = list_partitions(conn, table)
+            for offset in range(months_ahead + 1):
+                start = add_months(first, offset)
+                end = add_months(start, 1)
+                if any((p.start is None or p.start < end) and (p.end is None or p.end > start) for p in existing):
+                    continue
+                name = partition_name(table, start)
+                conn.execute(text(
+                    f"CREATE TABLE {quote(name)} PARTITION OF {quote(table)} "
+                    f"FOR VALUES FROM ('{start.isoformat(' ')}') TO ('{end.isoformat(' ')}')"
+                ))
+                print(f"Created partition {name}")
+                created.append(name)
+    return created
+
+
+async def maintain_forever(engine, interval: float = None):
+    """Runs ensure_partitions() every interval seconds, so the API never runs out of months."""
+    interval = interval or MAINTENANCE_INTERVAL_SECONDS
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(ensure_partitions, engine)
+        except Exception as e:
+            print(f"Partition maintenance failed: {e!r}")
+
+
+def create_index(engine, index):
+    """
+    CREATE INDEX CONCURRENTLY doesn't work on a partitioned table. Creates the
+    index ON ONLY the parent (invalid until every partition has one), builds it
+    on each partition concurrently and attaches those, which validates the parent.
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+    pattern = r"^CREATE (UNIQUE )?INDEX (\S+) ON (\S+) "
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(re.sub(pattern, r"CREATE \1INDEX IF NOT EXISTS \2 ON ONLY \3 ", ddl)))
+        for partition in list_partitions(conn, index.table.name):
+            child = f"{partition.name}_{index.name}"
+            conn.execute(text(re.sub(
+                pattern, rf"CREATE \1INDEX CONCURRENTLY IF NOT EXISTS {quote(child)} ON {quote(partition.name)} ", ddl
+            )))
+            attached = conn.execute(
+                text("SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:child)"), {"child": child}
+            ).first()
+            if not attached:
+                conn.execute(text(f"ALTER INDEX {quote(index.name)} ATTACH PARTITION {quote(child)}"))
+
+
+def migrate(engine):
+    """
+    Turns unpartitioned orders/payments tables into partitioned ones. Each
+    existing table is kept, renamed <table>_legacy, as the partition of every
+    row before next month; it is archived whole once all of it has aged out.
+    Locks both tables and reads every row: stop the API and workers first.
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    for table in PARTITIONED_TABLES:
+        with engine.begin() as conn:
+            if conn.execute(text("SELECT to_regclass(:table)"), {"table": table}).scalar() is None:
+                continue
+            if is_partitioned(conn, table):
+                print(f"{table} is already partitioned")
+                continue
+            legacy = f"{table}_legacy"
+            print(f"Partitioning {table}; existing rows move to {legacy}")
+            # A partitioned table can't be referenced on id alone
+            referencing = conn.execute(text(
+                "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+                "WHERE contype = 'f' AND confrelid = to_regclass(:table)"
+            ), {"table": table}).all()
+            for child, constraint in referencing:
+                conn.execute(text(f"ALTER TABLE {quote(child)} DROP CONSTRAINT {quote(constraint)}"))
+            conn.execute(text(f"ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}"))
+            # Index names are schema-wide; free them for the new parent
+            for name in index_names(conn, legacy):
+                conn.execute(text(f"ALTER INDEX {quote(name)} RENAME TO {quote(f'{legacy}_{name}')}"))
+            conn.execute(text(
+                f"UPDATE {quote(legacy)} SET created_at = COALESCE(updated_at, now() AT TIME ZONE 'utc') "
+                "WHERE created_at IS NULL"
+            ))
+            conn.execute(text(f"ALTER TABLE {quote(legacy)} ALTER COLUMN created_at SET NOT NULL"))
+            models.Base.metadata.tables[table].create(conn)
+            newest = conn.execute(text(f"SELECT max(created_at) FROM {quote(legacy)}")).scalar()
+            end = add_months(month_start(max(newest or datetime.min, datetime.utcnow())), 1)
+            conn.execute(text(
+                f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(legacy)} "
+                f"FOR VALUES FROM (MINVALUE) TO ('{end.isoformat(' ')}')"
+            ))
+            print(f"Attached {legacy} for rows before {end.isoformat()}")
+    ensure_partitions(engine)
+
+
+def _archive_file(table: str, partition: Partition) -> Path:
+    return Path(table) / f"{partition.name}.csv.gz"
+
+
+def _export(engine, table: str, partition: Partition, path: Path) -> int:
+    """Streams the partition into a gzipped CSV with COPY, ordered by created_at. Returns the row count."""
+    quote = engine.dialect.identifier_preparer.quote
+    columns = ", ".join(quote(c.name) for c in models.Base.metadata.tables[table].columns)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".partial")
+    raw = engine.raw_connection()
+    try:
+        with gzip.open(partial, "wb") as out:
+            cursor = raw.cursor()
+            cursor.copy_expert(
+                f"COPY (SELECT {columns} FROM {quote(partition.name)} ORDER BY created_at, id) "
+                "TO STDOUT WITH (FORMAT csv, HEADER)",
+                out,
+            )
+            rows = cursor.rowcount
+        raw.commit()
+    finally:
+        raw.close()
+    with open(partial, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+    return rows
+
+
+def archive(engine, retention_months: int = None, now: datetime = None, dry_run: bool = False) -> list:
+    """
+    Archives every partition that ended at least retention_months before this
+    month: COPY to ARCHIVE_DIR, then record it and drop the partition in one
+    transaction. An interrupted run leaves the partition in place; run it again.
+    """
+    retention_months = ARCHIVE_RETENTION_MONTHS if retention_months is None else retention_months
+    cutoff = add_months(month_start(now or datetime.utcnow()), -retention_months)
+    quote = engine.dialect.identifier_preparer.quote
+    archived = []
+    for table in PARTITIONED_TABLES:
+        with engine.connect() as conn:
+            if not is_partitioned(conn, table):
+                continue
+            due = [p for p in list_partitions(conn, table) if p.end is not None and p.end <= cutoff]
+        for partition in due:
+            if dry_run:
+                print(f"Would archive {partition.name} (before {partition.end.isoformat()})")
+                continue
+            relative = _archive_file(table, partition)
+            rows = _export(engine, table, partition, ARCHIVE_DIR / relative)
+            with engine.begin() as conn:
+                _lock(conn)
+                conn.execute(insert(models.ArchivedPartition.__table__).values(
+                    name=partition.name,
+                    table_name=table,
+                    range_start=partition.start,
+                    range_end=partition.end,
+                    path=str(relative),
+                    format="csv.gz",
+                    row_count=rows,
+                    size_bytes=(ARCHIVE_DIR / relative).stat().st_size,
+                    archived_at=datetime.utcnow(),
+                ))
+                conn.execute(text(f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(partition.name)}"))
+                conn.execute(text(f"DROP TABLE {quote(partition.name)}"))
+            print(f"Archived {partition.name}: {rows} rows -> {ARCHIVE_DIR / relative}")
+            archived.append(partition.name)
+    return archived
+
+
+def _csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def iter_archived_rows(archives: list, table: str, merchant_id, created_from=None, created_to=None, status=None):
+    """
+    CSV of the merchant's archived rows in [created_from, created_to), in chunks
+    for a StreamingResponse. Columns are the model's current ones; columns added
+    after a month was archived are empty for its rows.
+    """
+    columns = [c.name for c in models.Base.metadata.tables[table].columns]
+    merchant_id = str(merchant_id)
+    chunk = [_csv_line(columns)]
+    size = 0
+    for archive_row in archives:
+        with gzip.open(ARCHIVE_DIR / archive_row.path, "rt", newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            position = {name: i for i, name in enumerate(header)}
+            merchant_at, created_at, status_at = position["merchant_id"], position["created_at"], position["status"]
+            for row in reader:
+                if row[merchant_at] != merchant_id or (status and row[status_at] != status):
+                    continue
+                created = datetime.fromisoformat(row[created_at])
+                if created_to and created >= created_to:
+                    break  # Files are ordered by created_at
+                if created_from and created < created_from:
+                    continue
+                line = _csv_line([row[position[c]] if c in position else "" for c in columns])
+                chunk.append(line)
+                size += len(line)
+                if size >= _EXPORT_CHUNK_BYTES:
+                    yield "".join(chunk)
+                    chunk, size = [], 0
+    yield "".join(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order and payment partition maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="Partition existing unpartitioned tables (stop the API and workers first)")
+    maintain_cmd = sub.add_parser("maintain", help="Create upcoming monthly partitions")
+    maintain_cmd.add_argument("--months-ahead", type=int)
+    archive_cmd = sub.add_parser("archive", help="Export and drop partitions past the retention window")
+    archive_cmd.add_argument("--retention-months", type=int)
+    archive_cmd.add_argument("--dry-run", action="store_true")
+    sub.add_parser("list", help="Show partitions and their ranges")
+    args = parser.parse_args()
+
+    from .database import engine
+
+    if not models.PARTITIONED:
+        parser.error("partitioning needs DB_PARTITIONING=true and a Postgres DATABASE_URL")
+    if args.command == "migrate":
+        migrate(engine)
+    elif args.command == "maintain":
+        ensure_partitions(engine, args.months_ahead)
+    elif args.command == "archive":
+        archived = archive(engine, args.retention_months, dry_run=args.dry_run)
+        print(f"Done: {len(archived)} partitions archived")
+    else:
+        with engine.connect() as conn:
+            for table in PARTITIONED_TABLES:
+                for p in list_partitions(conn, table):
+                    start = p.start.isoformat() if p.start else "MINVALUE"
+                    end = p.end.isoformat() if p.end else "MAXVALUE"
+                    print(f"{table}\t{p.name}\t{start}\t{end}")
+
+
+if __name__ == "__main__":
+    main()
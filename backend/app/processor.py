@@ -0,0 +1,246 @@
+import asyncio
+import os
+from datetime import datetime
+
+from sqlalchemy import func, literal, select, union_all, update
+from starlette.concurrency import run_in_threadpool
+
+from . import acquirers, events, job_queue, models, rollups, schemas, telemetry, webhooks
+from .database import SessionLocal, with_session
+from .utils.validation import validate_vpa, validate_luhn, validate_expiry
+
+
+def validate_payment_details(payment_in: schemas.PaymentCreate):
+    """Returns an error dict for invalid payment details, or None when they look fine."""
+    if payment_in.method == "upi":
+        if not payment_in.vpa or not validate_vpa(payment_in.vpa):
+            return {"code": "INVALID_VPA", "desc": "VPA format invalid"}
+
+    elif payment_in.method == "card":
+        if not payment_in.card:
+            return {"code": "BAD_REQUEST_ERROR", "desc": "Card details required"}
+        if not validate_luhn(payment_in.card.number):
+            return {"code": "INVALID_CARD", "desc": "Card validation failed"}
+        if not validate_expiry(payment_in.card.expiry_month, payment_in.card.expiry_year):
+            return {"code": "EXPIRED_CARD", "desc": "Card expiry date invalid"}
+
+    return None
+
+
+def _finalize_statement(payment_id: str, status: str, error: dict, now):
+    """
+    UPDATE payments ... WHERE id = :id AND status = 'processing' RETURNING payments.*:
+    the guard and the write in one statement, so a payment is finalized at most
+    once however many times its job runs.
+    """
+    P = models.Payment.__table__
+    return (
+        update(P)
+        .where(P.c.id == payment_id, P.c.status == "processing")
+        .values(
+            status=status,
+            error_code=error["code"] if error else None,
+            error_description=error["desc"] if error else None,
+            updated_at=now,
+        )
+        .returning(*P.c)
+    )
+
+
+def _finalize_postgres(db, finalized, status: str, now):
+    """
+    The finalizing UPDATE as a CTE, with the order UPDATE and the rollup move as
+    CTEs reading from it and the NOTIFY in the select list: one statement,
+    which also returns the merchant's webhook_url.
+    """
+    O, M = models.Order.__table__, models.Merchant.__table__
+    done = finalized.cte("finalized")
+    bucket = func.date_trunc("hour", done.c.created_at)
+    moved = union_all(
+        select(done.c.merchant_id, bucket, done.c.method, literal("processing"), literal(-1), -done.c.amount, literal(now)),
+        select(done.c.merchant_id, bucket, done.c.method, done.c.status, literal(1), done.c.amount, literal(now)),
+    )
+    ctes = [rollups.upsert_from(moved).cte("moved_rollup")]
+    if status == "success":
+        ctes.append(update(O).where(O.c.id == done.c.order_id).values(status="paid", updated_at=now).cte("paid_order"))
+    stmt = (
+        select(done, M.c.webhook_url, events.notify_status(done).label("notified"))
+        .select_from(done.outerjoin(M, M.c.id == done.c.merchant_id))
+        .add_cte(*ctes)
+    )
+    return db.execute(stmt).mappings().first()
+
+
+def finalize_payment(payment_id: str, error: dict = None):
+    """
+    Moves a 'processing' payment to success (and its order to paid), or to failed
+    with error ({"code", "desc"}), together with its rollup move, status event
+    and webhook outbox row. Runs after the acquirer answered, in its own
+    short-lived session. Safe to retry: payments that already left
+    'processing' are left alone.
+
+    On Postgres that is one statement plus, for merchants with a webhook_url,
+    the outbox INSERT; elsewhere the writes go one by one.
+    """
+    status = "failed" if error else "success"
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        finalized = _finalize_statement(payment_id, status, error, now)
+        if db.get_bind().dialect.name == "postgresql":
+            row = _finalize_postgres(db, finalized, status, now)
+            if row is None:
+                return
+            payment = models.Payment(**{column.name: row[column.name] for column in models.Payment.__table__.c})
+            if row["webhook_url"]:
+                # Outbox row only; the dispatcher delivers it after commit, off the payment path
+                webhooks.add_payment_event(db, payment, row["webhook_url"])
+        else:
+            row = db.execute(finalized).mappings().first()
+            if row is None:
+                return
+            payment = models.Payment(**row)
+            if status == "success":
+                O = models.Order.__table__
+                db.execute(update(O).where(O.c.id == payment.order_id).values(status="paid", updated_at=now))
+            rollups.record_transition(db, payment, "processing", status)
+            events.publish_status(db, payment)
+            webhooks.enqueue_payment_event(db, payment)
+        db.commit()
+        telemetry.PAYMENTS_FINALIZED.inc(payment.method, payment.card_network or "", payment.status, payment.error_code or "")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class PaymentProcessor:
+    """
+    Claims payment jobs from the durable queue and finalizes them.
+
+    Jobs live on the event loop, so a payment waiting on the bank costs a
+    coroutine rather than a threadpool worker or a pooled DB connection.
+    The processor never holds more than `max_concurrency` jobs at once; the
+    rest stay in the queue for this or another worker process to claim.
+    Runs embedded in the API (EMBEDDED_WORKER=true) or via `python -m app.worker`.
+    """
+
+    def __init__(self, max_concurrency: int, worker_id: str, poll_interval: float = 1.0):
+        self.max_concurrency = max_concurrency
+        self.worker_id = worker_id
+        self.poll_interval = poll_interval
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self._loop = None
+        self._wakeup = None
+        self._tasks = set()
+        self._background = []
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._background = [
+            asyncio.create_task(self._consume()),
+            asyncio.create_task(self._heartbeat()),
+        ]
+
+    async def stop(self):
+        # Jobs cancelled here stay 'running' in the queue and are picked up
+        # again once their visibility timeout runs out.
+        tasks = self._background + list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await acquirers.close()
+        self._loop = None
+        try:
+            await run_in_threadpool(with_session, job_queue.deregister, self.worker_id)
+        except Exception as e:
+            print(f"Worker {self.worker_id} failed to deregister: {e}")
+
+    def notify(self):
+        """Wakes the consumer after an enqueue. Safe to call from threadpool handlers."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _heartbeat(self):
+        while True:
+            try:
+                await run_in_threadpool(with_session, job_queue.heartbeat, self.worker_id)
+            except Exception as e:
+                print(f"Worker {self.worker_id} heartbeat failed: {e}")
+            await asyncio.sleep(job_queue.HEARTBEAT_INTERVAL_SECONDS)
+
+    async def _consume(self):
+        while True:
+            # Clear before claiming so a notify() that lands mid-claim is not lost.
+            self._wakeup.clear()
+            free = self.max_concurrency - self.in_flight
+            jobs = []
+            if free > 0:
+                try:
+                    jobs = await run_in_threadpool(with_session, job_queue.claim, self.worker_id, free)
+                except Exception as e:
+                    print(f"Worker {self.worker_id} failed to claim jobs: {e}")
+            for job in jobs:
+                self.in_flight += 1
+                task = asyncio.create_task(self._run(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            if len(jobs) < free or free <= 0:
+                # Queue drained (or we are full): sleep until notified or the next poll.
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _run(self, job: dict):
+        try:
+            # Validation ran at enqueue time so card data never reaches the job table;
+            # its outcome travels in the payload and the connector returns it.
+            payload = job["payload"]
+            with telemetry.stage("bank_delay"):
+                try:
+                    error = await acquirers.for_method(payload.get("method")).authorize(job["payment_id"], payload)
+                except acquirers.AcquirerUnavailable:
+                    if job["attempts"] < job["max_attempts"]:
+                        raise
+                    # Out of retries: fail the payment rather than strand it in 'processing'
+                    error = acquirers.UNAVAILABLE_ERROR
+            with telemetry.stage("finalize"):
+                await run_in_threadpool(finalize_payment, job["payment_id"], error)
+            await run_in_threadpool(with_session, job_queue.complete, job["id"])
+            self.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            print(f"Payment {job['payment_id']} finalization failed (attempt {job['attempts']}): {e}")
+            try:
+                await run_in_threadpool(with_session, job_queue.fail, job["id"], repr(e))
+            except Exception as fail_error:
+                print(f"Could not record failure for job {job['id']}: {fail_error}")
+        finally:
+            self.in_flight -= 1
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+payment_processor = PaymentProcessor(
+    max_concurrency=int(os.getenv("PAYMENT_PROCESSOR_CONCURRENCY", "1000")),
+    worker_id=job_queue.worker_identity("embedded"),
+)
@@ -0,0 +1,99 @@
+"""
+In-memory cache for the unauthenticated checkout lookups
+(GET /orders/{id}/public and GET /payments/{id}/public).
+
+Records in a final state (paid orders, success/failed payments) never change,
+so they stay cached until LRU eviction. Anything else is cached for
+PUBLIC_CACHE_TTL_SECONDS and is dropped as soon as a payment status event
+(events.bus, fed across replicas by LISTEN/NOTIFY) mentions it. Unknown ids
+can be cached as misses for PUBLIC_CACHE_NEGATIVE_TTL_SECONDS, so id
+enumeration doesn't reach the database on every guess.
+"""
+import math
+import os
+import threading
+
+from . import events
+from .utils.cache import TTLCache
+
+PUBLIC_CACHE_ENABLED = os.getenv("PUBLIC_CACHE_ENABLED", "true").lower() == "true"
+MAX_ENTRIES = int(os.getenv("PUBLIC_CACHE_MAX_ENTRIES", "50000"))
+TTL_SECONDS = float(os.getenv("PUBLIC_CACHE_TTL_SECONDS", "2"))
+NEGATIVE_TTL_SECONDS = float(os.getenv("PUBLIC_CACHE_NEGATIVE_TTL_SECONDS", "5"))  # 0 disables
+
+_NOT_FOUND = object()
+
+
+class PublicReadCache:
+    """Response bodies keyed by id; TTL depends on whether the record can still change."""
+
+    def __init__(self, terminal_statuses):
+        self.terminal_statuses = terminal_statuses
+        self.entries = TTLCache(max_entries=MAX_ENTRIES, ttl=TTL_SECONDS)
+        self.negative_hits = 0
+        self.stale_writes_skipped = 0
+        # Bumped by every invalidation. A read that started before one may have
+        # seen the old row, so only its immutable (terminal) results are stored.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        """Token for store() when writing through a record the caller just wrote itself."""
+        return self._generation
+
+    def lookup(self, key):
+        """Returns (hit, body, token). A hit with body None is a cached "not found"."""
+        token = self._generation
+        if not PUBLIC_CACHE_ENABLED:
+            return False, None, token
+        value = self.entries.get(key)
+        if value is None:
+            return False, None, token
+        if value is _NOT_FOUND:
+            self.negative_hits += 1
+            return True, None, token
+        return True, value, token
+
+    def store(self, key, body, token):
+        """Caches a body read from the database (None for "not found"); token comes from lookup() or generation."""
+        if not PUBLIC_CACHE_ENABLED:
+            return
+        if body is None:
+            if NEGATIVE_TTL_SECONDS > 0 and token == self._generation:
+                self.entries.set(key, _NOT_FOUND, ttl=NEGATIVE_TTL_SECONDS)
+            return
+        if body["status"] in self.terminal_statuses:
+            self.entries.set(key, body, ttl=math.inf)
+        elif token == self._generation:
+            self.entries.set(key, body)
+        else:
+            self.stale_writes_skipped += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+        self.entries.pop(key)
+
+    def stats(self) -> dict:
+        return {
+            **self.entries.stats(),
+            "negative_hits": self.negative_hits,
+            "stale_writes_skipped": self.stale_writes_skipped,
+        }
+
+
+orders = PublicReadCache(terminal_statuses=("paid",))
+payments = PublicReadCache(terminal_statuses=events.TERMINAL_STATUSES)
+
+
+def _on_status_change(status: dict):
+    payments.invalidate(status["id"])
+    orders.invalidate(status["order_id"])  # A successful payment marks its order paid
+
+
+events.bus.add_listener(_on_status_change)
+
+
+def stats() -> dict:
+    return {"enabled": PUBLIC_CACHE_ENABLED, "orders": orders.stats(), "payments": payments.stats()}
@@ -0,0 +1,255 @@
+"""
+Per-merchant rate limiting and admission control for the order and payment routes.
+
+Rate limits are token buckets: a key may burst up to RATE_LIMIT_BURST requests
+and then gets RATE_LIMIT_PER_SECOND more every second. Authenticated routes are
+keyed by api_key (merchants.rate_limit_per_second / rate_limit_burst override
+the defaults per merchant); the unauthenticated /public routes by client IP.
+Over the limit a request gets 429 RATE_LIMIT_ERROR with Retry-After before it
+touches the threadpool or the database.
+
+RATE_LIMIT_STORE=memory (default) keeps buckets in this process, so each replica
+enforces the limit on its own share of traffic. RATE_LIMIT_STORE=postgres keeps
+them in rate_limit_buckets, updated with one upsert per request, so the limit
+holds across replicas; it needs a PostgreSQL DATABASE_URL and refuses to start
+on anything else. If the database can't be reached the request is let through,
+and the failure is logged at most once every ERROR_LOG_SECONDS.
+
+Admission control caps how many payment creations run at once in this process:
+beyond ADMISSION_MAX_INFLIGHT new ones get 503 SERVICE_UNAVAILABLE, and a merchant
+beyond ADMISSION_MAX_INFLIGHT_PER_MERCHANT gets 429, straight away instead of
+queueing for a thread and a connection until they time out. Both are off (0) by default.
+The public checkout route only knows its merchant once the order is read, so it
+is held to the global cap (and its per-IP rate limit) alone.
+"""
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import case, delete, func
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import auth, models
+from .database import engine, with_session
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory").lower()
+if RATE_LIMIT_STORE not in ("memory", "postgres"):
+    raise RuntimeError(f"RATE_LIMIT_STORE must be 'memory' or 'postgres', got {RATE_LIMIT_STORE!r}")
+MERCHANT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "200"))
+MERCHANT_BURST = float(os.getenv("RATE_LIMIT_BURST", "400"))
+PUBLIC_PER_SECOND = float(os.getenv("RATE_LIMIT_PUBLIC_PER_SECOND", "20"))
+PUBLIC_BURST = float(os.getenv("RATE_LIMIT_PUBLIC_BURST", "60"))
+MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))  # In-process store, LRU
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "0"))
+ADMISSION_MAX_INFLIGHT_PER_MERCHANT = int(os.getenv("ADMISSION_MAX_INFLIGHT_PER_MERCHANT", "0"))
+# Idle shared buckets are deleted by roughly one request in PURGE_EVERY
+PURGE_EVERY = 1000
+IDLE_BUCKET_SECONDS = 3600
+# Store failures are logged at most once per interval, with a count of the ones in between
+ERROR_LOG_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBucketStore:
+    """Token buckets in a bounded LRU dict; an evicted key simply starts full again."""
+
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at monotonic)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float):
+        """(allowed, seconds until a token is available)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def stats(self) -> dict:
+        return {"store": "memory", "buckets": len(self._buckets), "max_buckets": self.max_buckets}
+
+
+_buckets = models.RateLimitBucket.__table__
+
+
+def _take_shared(db: Session, key: str, rate: float, burst: float):
+    """Refills and takes from the bucket in one upsert, so concurrent replicas can't both spend the last token."""
+    now = func.timezone("utc", func.now())
+    refilled = func.least(burst, _buckets.c.tokens + func.extract("epoch", now - _buckets.c.updated_at) * rate)
+    stmt = postgresql.insert(_buckets).values(key=key, tokens=burst - 1, allowed=True, updated_at=now)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["key"],
+        set_={
+            "tokens": case((refilled >= 1, refilled - 1), else_=refilled),
+            "allowed": refilled >= 1,
+            "updated_at": now,
+        },
+    ).returning(_buckets.c.allowed, _buckets.c.tokens)
+    allowed, tokens = db.execute(stmt).one()
+    if random.randrange(PURGE_EVERY) == 0:
+        cutoff = datetime.utcnow() - timedelta(seconds=IDLE_BUCKET_SECONDS)
+        db.execute(delete(_buckets).where(_buckets.c.updated_at < cutoff))
+    db.commit()
+    return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class PostgresBucketStore:
+    """Token buckets in rate_limit_buckets, shared by every replica."""
+
+    def __init__(self):
+        if engine.dialect.name != "postgresql":
+            raise RuntimeError(f"RATE_LIMIT_STORE=postgres needs a PostgreSQL database, DATABASE_URL points to {engine.dialect.name}")
+        self.errors = 0
+        self._unlogged_errors = 0
+        self._next_log = 0.0
+
+    async def take(self, key: str, rate: float, burst: float):
+        try:
+            return await run_in_threadpool(with_session, _take_shared, key, rate, burst)
+        except Exception as e:
+            # Fail open: an unreachable store must not take the API down with it
+            self.errors += 1
+            self._log_error(e)
+            return True, 0.0
+
+    def _log_error(self, e: Exception):
+        now = time.monotonic()
+        if now < self._next_log:
+            self._unlogged_errors += 1
+            return
+        suppressed, self._unlogged_errors = self._unlogged_errors, 0
+        self._next_log = now + ERROR_LOG_SECONDS
+        logger.warning(
+            "Rate limit store unavailable, letting requests through: %r (%d more failures since the last report)",
+            e, suppressed,
+        )
+
+    def stats(self) -> dict:
+        return {"store": "postgres", "errors": self.errors}
+
+
+class RateLimiter:
+    def __init__(self, store):
+        self.store = store
+        self.allowed = 0
+        self.limited = 0
+
+    async def check(self, key: str, rate: float, burst: float):
+        """Raises 429 with Retry-After when key is out of tokens."""
+        if isinstance(self.store, MemoryBucketStore):
+            allowed, retry_after = self.store.take(key, rate, burst)
+        else:
+            allowed, retry_after = await self.store.take(key, rate, burst)
+        if allowed:
+            self.allowed += 1
+            return
+        self.limited += 1
+        raise HTTPException(
+            status_code=429,
+            detail={"error": {"code": "RATE_LIMIT_ERROR", "description": "Too many requests"}},
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def stats(self) -> dict:
+        return {"enabled": RATE_LIMIT_ENABLED, "allowed": self.allowed, "limited": self.limited, **self.store.stats()}
+
+
+limiter = RateLimiter(PostgresBucketStore() if RATE_LIMIT_STORE == "postgres" else MemoryBucketStore(MAX_BUCKETS))
+
+
+async def limit_merchant(
+    merchant: auth.AuthenticatedMerchant = Depends(auth.get_authenticated_merchant)
+) -> auth.AuthenticatedMerchant:
+    """get_authenticated_merchant, then the merchant's rate limit. Use in place of it on rate-limited routes."""
+    if RATE_LIMIT_ENABLED:
+        await limiter.check(
+            f"merchant:{merchant.api_key}",
+            merchant.rate_limit_per_second or MERCHANT_PER_SECOND,
+            merchant.rate_limit_burst or MERCHANT_BURST,
+        )
+    return merchant
+
+
+async def limit_public(request: Request):
+    """Per-client-IP limit for the unauthenticated checkout routes."""
+    if RATE_LIMIT_ENABLED:
+        # request.client is the proxy unless uvicorn runs with --proxy-headers
+        ip = request.client.host if request.client else "unknown"
+        await limiter.check(f"ip:{ip}", PUBLIC_PER_SECOND, PUBLIC_BURST)
+
+
+class AdmissionController:
+    """Counts payment creations in flight in this process, overall and per merchant."""
+
+    def __init__(self, max_inflight: int, max_per_merchant: int):
+        self.max_inflight = max_inflight
+        self.max_per_merchant = max_per_merchant
+        self.inflight = 0
+        self.rejected = 0
+        self._per_merchant = {}
+
+    @asynccontextmanager
+    async def admit(self, key: Optional[str]):
+        """Holds a slot for one payment creation; key None (merchant not known yet) counts toward the global cap only."""
+        # Runs on the event loop only, so the counters need no lock
+        if self.max_inflight and self.inflight >= self.max_inflight:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail={"error": {"code": "SERVICE_UNAVAILABLE", "description": "Too many payments in progress, retry shortly"}},
+                headers={"Retry-After": "1"},
+            )
+        if key is not None and self.max_per_merchant and self._per_merchant.get(key, 0) >= self.max_per_merchant:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail={"error": {"code": "RATE_LIMIT_ERROR", "description": "Too many concurrent payments"}},
+                headers={"Retry-After": "1"},
+            )
+        self.inflight += 1
+        if key is not None:
+            self._per_merchant[key] = self._per_merchant.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            if key is not None:
+                remaining = self._per_merchant[key] - 1
+                if remaining:
+                    self._per_merchant[key] = remaining
+                else:
+                    del self._per_merchant[key]
+
+    def stats(self) -> dict:
+        return {
+            "max_inflight": self.max_inflight,
+            "max_inflight_per_merchant": self.max_per_merchant,
+            "inflight": self.inflight,
+            "rejected": self.rejected,
+        }
+
+
+admission = AdmissionController(ADMISSION_MAX_INFLIGHT, ADMISSION_MAX_INFLIGHT_PER_MERCHANT)
+
+
+def stats() -> dict:
+    return {**limiter.stats(), "admission": admission.stats()}
@@ -0,0 +1,190 @@
+"""
+Incrementally maintained per-merchant payment rollups.
+
+Every payment is counted in exactly one merchant_payment_rollups row: the hour it
+was created in, its method and its current status. Creating a payment adds it
+to the 'processing' bucket; finalizing it moves it to 'success'/'failed'. Both
+happen in the same transaction as the payment write, so dashboard stats can
+read a few hundred rollup rows instead of scanning payments.
+
+Backfill or reconcile against raw payments with:
+
+    python -m app.rollups rebuild [--merchant-id UUID] [--since ISO] [--until ISO] [--chunk-hours 24]
+"""
+import argparse
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+_rollups = models.MerchantPaymentRollup.__table__
+
+
+def hour_bucket(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _adding(stmt):
+    """ON CONFLICT DO UPDATE adding the deltas to existing buckets."""
+    return stmt.on_conflict_do_update(
+        index_elements=["merchant_id", "bucket_start", "method", "status"],
+        set_={
+            "payment_count": _rollups.c.payment_count + stmt.excluded.payment_count,
+            "amount_total": _rollups.c.amount_total + stmt.excluded.amount_total,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+def _upsert(db: Session, rows: list):
+    """INSERT ... ON CONFLICT DO UPDATE adding the deltas to existing buckets."""
+    dialect = db.get_bind().dialect.name
+    dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    db.execute(_adding(dialect_insert(_rollups).values(rows)))
+
+
+def upsert_from(deltas):
+    """
+    Postgres upsert of rows selected by `deltas` (merchant_id, bucket_start, method,
+    status, payment_count, amount_total, updated_at), for use as a CTE next to
+    the payment write that produced them.
+    """
+    return _adding(postgresql.insert(_rollups).from_select(
+        ["merchant_id", "bucket_start", "method", "status", "payment_count", "amount_total", "updated_at"], deltas,
+    ))
+
+
+def _delta(payment, status: str, sign: int) -> dict:
+    return {
+        "merchant_id": payment.merchant_id,
+        "bucket_start": hour_bucket(payment.created_at),
+        "method": payment.method,
+        "status": status,
+        "payment_count": sign,
+        "amount_total": sign * payment.amount,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def record_created(db: Session, payment: models.Payment):
+    """Counts a new payment. Call before the commit that inserts it."""
+    _upsert(db, [_delta(payment, payment.status, 1)])
+
+
+def record_transition(db: Session, payment: models.Payment, old_status: str, new_status: str):
+    """Moves a payment between status buckets. Call before the commit that updates it."""
+    if old_status == new_status:
+        return
+    _upsert(db, [_delta(payment, old_status, -1), _delta(payment, new_status, 1)])
+
+
+def _hour_expr(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc("hour", models.Payment.created_at)
+    return func.strftime("%Y-%m-%d %H:00:00", models.Payment.created_at)
+
+
+def _as_datetime(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def rebuild_window(db: Session, start: datetime, end: datetime, merchant_id=None) -> int:
+    """
+    Recomputes the rollups for buckets in [start, end) from raw payments, in one
+    transaction. Returns the number of buckets whose stored values were wrong.
+    Windows should be hour-aligned. Payments finalized while a window is being
+    rebuilt may be miscounted; run it again (or at a quiet time) to settle them.
+    """
+    bucket = _hour_expr(db)
+    query = db.query(
+        models.Payment.merchant_id,
+        bucket.label("bucket_start"),
+        models.Payment.method,
+        models.Payment.status,
+        func.count(models.Payment.id),
+        func.coalesce(func.sum(models.Payment.amount), 0),
+    ).filter(models.Payment.created_at >= start, models.Payment.created_at < end)
+    existing = db.query(models.MerchantPaymentRollup).filter(
+        models.MerchantPaymentRollup.bucket_start >= start,
+        models.MerchantPaymentRollup.bucket_start < end,
+    )
+    purge = delete(_rollups).where(_rollups.c.bucket_start >= start, _rollups.c.bucket_start < end)
+    if merchant_id:
+        query = query.filter(models.Payment.merchant_id == merchant_id)
+        existing = existing.filter(models.MerchantPaymentRollup.merchant_id == merchant_id)
+        purge = purge.where(_rollups.c.merchant_id == merchant_id)
+
+    now = datetime.utcnow()
+    fresh = {}
+    for m_id, bucket_start, method, status, count, amount in query.group_by(
+        models.Payment.merchant_id, bucket, models.Payment.method, models.Payment.status
+    ):
+        key = (m_id, _as_datetime(bucket_start), method, status)
+        fresh[key] = (count, int(amount))
+    stored = {
+        (r.merchant_id, r.bucket_start, r.method, r.status): (r.payment_count, r.amount_total)
+        for r in existing
+        if r.payment_count or r.amount_total
+    }
+    drift = sum(1 for key in fresh.keys() | stored.keys() if fresh.get(key) != stored.get(key))
+
+    db.execute(purge)
+    if fresh:
+        db.execute(insert(_rollups), [
+            {
+                "merchant_id": m_id, "bucket_start": bucket_start, "method": method, "status": status,
+                "payment_count": count, "amount_total": amount, "updated_at": now,
+            }
+            for (m_id, bucket_start, method, status), (count, amount) in fresh.items()
+        ])
+    db.commit()
+    return drift
+
+
+def rebuild(db: Session, since: datetime = None, until: datetime = None, merchant_id=None, chunk_hours: int = 24):
+    """Rebuilds rollups chunk by chunk so no single transaction scans the whole history."""
+    bounds = db.query(func.min(models.Payment.created_at), func.max(models.Payment.created_at))
+    if merchant_id:
+        bounds = bounds.filter(models.Payment.merchant_id == merchant_id)
+    first, last = bounds.one()
+    if first is None:
+        return 0
+    start = hour_bucket(since or _as_datetime(first))
+    end = until or (hour_bucket(_as_datetime(last)) + timedelta(hours=1))
+
+    total_drift = 0
+    while start < end:
+        chunk_end = min(start + timedelta(hours=chunk_hours), end)
+        drift = rebuild_window(db, start, chunk_end, merchant_id)
+        total_drift += drift
+        print(f"Rebuilt rollups {start.isoformat()} -> {chunk_end.isoformat()} ({drift} buckets corrected)")
+        start = chunk_end
+    return total_drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payment rollup maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = sub.add_parser("rebuild", help="Backfill/reconcile rollups from raw payments")
+    rebuild_cmd.add_argument("--merchant-id", type=uuid.UUID)
+    rebuild_cmd.add_argument("--since", type=datetime.fromisoformat)
+    rebuild_cmd.add_argument("--until", type=datetime.fromisoformat)
+    rebuild_cmd.add_argument("--chunk-hours", type=int, default=24)
+    args = parser.parse_args()
+
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        drift = rebuild(db, args.since, args.until, args.merchant_id, args.chunk_hours)
+        print(f"Done: {drift} buckets corrected")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Path, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from .. import auth
+from .. import crud, database, partitions
+from ..utils.pagination import utc_naive
+
+router = APIRouter()
+
+
+@router.get("/{table}")
+async def export_archived(
+    table: str = Path(..., pattern="^(orders|payments)$"),
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    db: Session = Depends(database.get_session),
+    merchant: auth.AuthenticatedMerchant = Depends(auth.get_authenticated_merchant)
+):
+    """
+    The merchant's orders or payments from archived months (see app/partitions.py)
+    as CSV, oldest first. Archives are read sequentially, so narrow from/to when you can.
+    """
+    created_from, created_to = utc_naive(created_from), utc_naive(created_to)
+    archives = await database.run_db(db, crud.get_archived_partitions, table, created_from, created_to)
+    # A sync iterator: Starlette reads and decompresses it on the threadpool
+    rows = partitions.iter_archived_rows(archives, table, merchant.id, created_from, created_to, status)
+    return StreamingResponse(
+        rows,
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{table}-archive.csv"'},
+    )
@@ -1,57 +1,158 @@
-from fastapi import APIRouter, Depends, HTTPException
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import datetime
 
 from .. import auth
-from .. import models, schemas, database
+from .. import crud, idempotency, models, public_cache, rate_limit, schemas, database
 from ..utils.id_generator import generate_custom_id
+from ..utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, set_next_cursor, utc_naive
 
 # Create the router
 router = APIRouter()
 
-# Change the path to "" so it matches the prefix exactly
-@router.post("", response_model=schemas.OrderResponse, status_code=201)
-def create_order(
-    order_in: schemas.OrderCreate,
-    db: Session = Depends(database.get_db),
-    merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
-):
-    # Your order logic here...
+ORDER_BATCH_MAX = int(os.getenv("ORDER_BATCH_MAX", "1000"))
+
+def _create_order(db: Session, merchant_id, order_in: schemas.OrderCreate, claim):
+    # The id is drawn here, so a retried unit (run_db_new_ids) inserts under a new one
     new_order = models.Order(
         id=generate_custom_id("order_"),
-        merchant_id=merchant.id,
+        merchant_id=merchant_id,
         amount=order_in.amount,
         currency=order_in.currency,
         receipt=order_in.receipt,
+        notes=order_in.notes,
         status="created"
     )
-    db.add(new_order)
+    return crud.create_order(db, new_order, claim)
+
+
+# Change the path to "" so it matches the prefix exactly
+@router.post("", response_model=schemas.OrderResponse, status_code=201)
+async def create_order(
+    order_in: schemas.OrderCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(database.get_session),
+    merchant: auth.AuthenticatedMerchant = Depends(rate_limit.limit_merchant)
+):
+    scope = f"{merchant.id}:POST /api/v1/orders"
+    async with idempotency.guard(db, idempotency_key, scope, order_in.model_dump(), schemas.OrderResponse) as claim:
+        if claim.replay:
+            return claim.replay
+        return await database.run_db_new_ids(db, _create_order, merchant.id, order_in, claim)
+
+
+def _validation_error(e: ValidationError) -> dict:
+    first = e.errors()[0]
+    field = ".".join(str(part) for part in first["loc"]) or "item"
+    return {"code": "BAD_REQUEST_ERROR", "description": f"{field}: {first['msg']}"}
+
+
+def _create_order_batch(db: Session, merchant_id, items: list, claim):
+    """Validates every item, inserts the valid ones in one transaction and builds the per-item response."""
+    results = [None] * len(items)
+    rows = []
+    positions = []
+    now = datetime.utcnow()
+    for index, item in enumerate(items):
+        try:
+            order_in = schemas.OrderCreate.model_validate(item)
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "error", "error": _validation_error(e)}
+            continue
+        rows.append({
+            "id": generate_custom_id("order_"),
+            "merchant_id": merchant_id,
+            "amount": order_in.amount,
+            "currency": order_in.currency,
+            "receipt": order_in.receipt,
+            "notes": order_in.notes,
+            "status": "created",
+            "created_at": now,
+            "updated_at": now,
+        })
+        positions.append(index)
+
+    for index, order in zip(positions, crud.create_orders(db, rows)):
+        results[index] = {"index": index, "status": "created", "order": schemas.OrderResponse.model_validate(order)}
+    response = schemas.OrderBatchResponse(created=len(rows), failed=len(items) - len(rows), results=results)
+    claim.record(db, response)
     db.commit()
-    db.refresh(new_order)
-    return new_order
+    return response
+
+
+@router.post("/batch", response_model=schemas.OrderBatchResponse, status_code=201)
+async def create_order_batch(
+    batch: schemas.OrderBatchCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(database.get_session),
+    merchant: auth.AuthenticatedMerchant = Depends(rate_limit.limit_merchant)
+):
+    """
+    Creates up to ORDER_BATCH_MAX orders in one transaction. Invalid items are
+    reported per index in `results` and don't prevent the others from being created.
+    """
+    if len(batch.items) > ORDER_BATCH_MAX:
+        raise HTTPException(status_code=400, detail={"error": {
+            "code": "BAD_REQUEST_ERROR",
+            "description": f"A batch may contain at most {ORDER_BATCH_MAX} orders",
+        }})
+    scope = f"{merchant.id}:POST /api/v1/orders/batch"
+    async with idempotency.guard(db, idempotency_key, scope, batch.items, schemas.OrderBatchResponse) as claim:
+        if claim.replay:
+            return claim.replay
+        return await database.run_db_new_ids(db, _create_order_batch, merchant.id, batch.items, claim)
 
 # GET single order
 @router.get("/{order_id}", response_model=schemas.OrderResponse)
-def get_order(order_id: str, db: Session = Depends(database.get_db), merchant: models.Merchant = Depends(auth.get_authenticated_merchant)):
-    order = db.query(models.Order).filter(models.Order.id == order_id, models.Order.merchant_id == merchant.id).first()
+async def get_order(order_id: str, db: Session = Depends(database.get_read_session), merchant: auth.AuthenticatedMerchant = Depends(rate_limit.limit_merchant)):
+    order = await database.run_read(db, crud.get_order, order_id, merchant.id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
 # GET all orders
 @router.get("", response_model=list[schemas.OrderResponse])
-def list_orders(db: Session = Depends(database.get_db), merchant: models.Merchant = Depends(auth.get_authenticated_merchant)):
-    return db.query(models.Order).filter(models.Order.merchant_id == merchant.id).all()
+async def list_orders(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    min_amount: Optional[int] = Query(None, ge=0),
+    max_amount: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(database.get_read_session),
+    merchant: auth.AuthenticatedMerchant = Depends(rate_limit.limit_merchant)
+):
+    try:
+        orders, next_cursor = await database.run_read(
+            db, crud.get_merchant_orders_page, merchant.id, cursor=cursor, limit=limit, status=status,
+            created_from=utc_naive(created_from), created_to=utc_naive(created_to),
+            min_amount=min_amount, max_amount=max_amount,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Invalid cursor"}})
+    set_next_cursor(response, request, next_cursor)
+    return orders
 
 
-@router.get("/{order_id}/public")
-def get_order_public(order_id: str, db: Session = Depends(database.get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
+@router.get("/{order_id}/public", dependencies=[Depends(rate_limit.limit_public)])
+async def get_order_public(order_id: str, db: Session = Depends(database.get_read_session)):
+    hit, body, token = public_cache.orders.lookup(order_id)
+    if not hit:
+        order = await database.run_read(db, crud.get_order, order_id)
+        # Return only basic info
+        body = {
+            "id": order.id,
+            "amount": order.amount,
+            "currency": order.currency,
+            "status": order.status
+        } if order else None
+        public_cache.orders.store(order_id, body, token)
+    if not body:
         raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND_ERROR", "description": "Order not found"}})
-    # Return only basic info
-    return {
-        "id": order.id,
-        "amount": order.amount,
-        "currency": order.currency,
-        "status": order.status
-    }
\ No newline at end of file
+    return body
\ No newline at end of file
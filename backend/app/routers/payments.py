@@ -1,131 +1,327 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-import time
+import asyncio
+import json
 import os
-import random
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime
 
 from .. import auth
 
-from .. import models, schemas, database
+from .. import bins, crud, events, exports, idempotency, models, public_cache, rate_limit, schemas, database, telemetry
 from ..utils.id_generator import generate_custom_id
-from ..utils.validation import validate_vpa, validate_luhn, detect_card_network, validate_expiry
+from ..utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, set_next_cursor, utc_naive
+from ..utils import batch_validation
+from ..processor import payment_processor, validate_payment_details
 
 router = APIRouter()
 
+VALIDATE_BATCH_MAX = int(os.getenv("VALIDATE_BATCH_MAX", "10000"))
+
+
+def _idempotency_payload(payment_in: schemas.PaymentCreate) -> dict:
+    # Fingerprint the request without the card number or CVV, so even a hash of
+    # them never reaches the idempotency_keys table.
+    payload = payment_in.model_dump(exclude={"card"})
+    if payment_in.card:
+        card = payment_in.card
+        payload["card"] = [card.number[-4:], card.expiry_month, card.expiry_year, card.holder_name]
+    return payload
 
-def execute_payment_processing(payment_in: schemas.PaymentCreate, db: Session, order: models.Order):
 
-    payment_id = generate_custom_id("pay_")
-    
-    card_network = None
-    card_last4 = None
+def execute_payment_processing(db: Session, payment_in: schemas.PaymentCreate, merchant_id=None, claim=None):
+    """
+    Inserts the payment with its finalization job (crud.create_payment: one
+    statement on Postgres) and commits, as one unit of work for database.run_db.
+    Returns None when the order doesn't exist.
+    claim (idempotency.Claim) stores the response in the same transaction.
+    """
+    card_bin = None
     if payment_in.method == "card" and payment_in.card:
-        card_network = detect_card_network(payment_in.card.number)
-        card_last4 = payment_in.card.number[-4:]
-
-    new_payment = models.Payment(
-        id=payment_id,
-        order_id=order.id,
-        merchant_id=order.merchant_id,
-        amount=order.amount,
-        currency=order.currency,
-        method=payment_in.method,
-        vpa=payment_in.vpa if payment_in.method == "upi" else None,
-        card_network=card_network,
-        card_last4=card_last4,
-        status="processing"  # Starts in processing state as required
-    )
-    db.add(new_payment)
-    db.commit()
-    db.refresh(new_payment)
-
-    # --- STEP 2: SIMULATE BANK LATENCY ---
-    # Now everyone waits, even if the card is wrong!
-    test_mode = os.getenv("TEST_MODE", "false").lower() == "true"
-    delay_ms = int(os.getenv("TEST_PROCESSING_DELAY", "1000")) if test_mode else random.uniform(5000, 10000)
-    time.sleep(delay_ms / 1000.0)
-
-    # --- STEP 3: PERFORM VALIDATION & DETERMINE OUTCOME ---
-    error_info = None
-
-    # Check for validation errors first
-    if payment_in.method == "upi":
-        if not payment_in.vpa or not validate_vpa(payment_in.vpa):
-            error_info = {"code": "INVALID_VPA", "desc": "VPA format invalid"}
-    
-    elif payment_in.method == "card":
-        if not payment_in.card:
-            error_info = {"code": "BAD_REQUEST_ERROR", "desc": "Card details required"}
-        elif not validate_luhn(payment_in.card.number):
-            error_info = {"code": "INVALID_CARD", "desc": "Card validation failed"}
-        elif not validate_expiry(payment_in.card.expiry_month, payment_in.card.expiry_year):
-            error_info = {"info": "EXPIRED_CARD", "desc": "Card expiry date invalid"}
-
-    # --- STEP 4: UPDATE FINAL STATUS ---
-    if error_info:
-        # It's a validation failure (after the delay)
-        new_payment.status = "failed"
-        new_payment.error_code = error_info["code"]
-        new_payment.error_description = error_info["desc"]
-    else:
-        # Valid data, check for success vs bank decline
-        is_success = os.getenv("TEST_PAYMENT_SUCCESS", "true").lower() == "true" if test_mode else (random.random() < 0.95)
-        
-        if is_success:
-            new_payment.status = "success"
-            order.status = "paid"
-        else:
-            new_payment.status = "failed"
-            new_payment.error_code = "PAYMENT_FAILED"
-            new_payment.error_description = "Bank declined the transaction"
-
-    db.commit()
-    db.refresh(new_payment)
-
-    # If it was a validation error, we still raise the Exception for the API response
-    if error_info:
-        raise HTTPException(status_code=400, detail={"error": error_info})
+        card_bin = bins.lookup(payment_in.card.number) or bins.BinInfo(network="unknown")
 
+    # The job is committed with the payment, so a crash can't strand it in 'processing'.
+    with telemetry.stage("validate"):
+        validation_error = validate_payment_details(payment_in)
+    values = {
+        "id": generate_custom_id("pay_"),
+        "order_id": payment_in.order_id,
+        "created_at": datetime.utcnow(),  # Set up front: the rollup bucket is keyed on it
+        "method": payment_in.method,
+        "vpa": payment_in.vpa if payment_in.method == "upi" else None,
+        "card_network": card_bin.network if card_bin else None,
+        "card_last4": payment_in.card.number[-4:] if card_bin else None,
+        "card_type": card_bin.card_type if card_bin else None,
+        "card_issuer": card_bin.issuer if card_bin else None,
+        "card_country": card_bin.country if card_bin else None,
+    }
+    with telemetry.stage("insert_commit"):
+        new_payment = crud.create_payment(db, values, merchant_id, validation_error)
+        if new_payment is None:
+            return None
+        if claim is not None:
+            claim.record(db, new_payment)
+        db.commit()
+    telemetry.PAYMENTS_CREATED.inc(new_payment.method, new_payment.card_network or "")
     return new_payment
 
+def _public_body(payment) -> dict:
+    with telemetry.stage("serialize"):
+        return schemas.PaymentResponse.model_validate(payment).model_dump(mode="json")
+
+
+async def _load_public_payment(db: Session, payment_id: str):
+    """PaymentResponse body for the checkout page (None if unknown), served from public_cache when possible."""
+    hit, body, token = public_cache.payments.lookup(payment_id)
+    if hit:
+        return body
+    # A 'processing' payment on the replica may already be final on the primary, with
+    # its status event gone: long-polls and SSE would wait on it, and it would be cached
+    payment = await database.run_read_settled(
+        db, lambda found: found is not None and found.status in events.TERMINAL_STATUSES, crud.get_payment, payment_id
+    )
+    body = _public_body(payment) if payment else None
+    public_cache.payments.store(payment_id, body, token)
+    return body
+
+
 # --- 1. PUBLIC ENDPOINT (Checkout Page) ---
 # FIX: No 'auth' dependency here so Postman/Frontend can call it without a secret key.
-@router.post("/public", response_model=schemas.PaymentResponse, status_code=201)
-def create_public_payment(payment_in: schemas.PaymentCreate, db: Session = Depends(database.get_db)):
-    order = db.query(models.Order).filter(models.Order.id == payment_in.order_id).first()
-    if not order:
+@router.post("/public", response_model=schemas.PaymentResponse, status_code=201, dependencies=[Depends(rate_limit.limit_public)])
+async def create_public_payment(
+    payment_in: schemas.PaymentCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(database.get_session)
+):
+    # The order is the only tenant this route knows: keys are per order, so
+    # shoppers (and merchants) can't collide on, or squat, each other's keys
+    if len(payment_in.order_id) > models.Order.id.type.length:
         raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND_ERROR", "description": "Order not found"}})
-    return execute_payment_processing(payment_in, db, order)
+    scope = f"public:{payment_in.order_id}"
+    # The merchant is only known once the order is read, so only the global cap applies here;
+    # checkout traffic is also limited per client IP (limit_public)
+    async with rate_limit.admission.admit(None), \
+            idempotency.guard(db, idempotency_key, scope, _idempotency_payload(payment_in), schemas.PaymentResponse) as claim:
+        if claim.replay:
+            return claim.replay
+        token = public_cache.payments.generation
+        payment = await database.run_db_new_ids(db, execute_payment_processing, payment_in, None, claim)
+        if not payment:
+            raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND_ERROR", "description": "Order not found"}})
+    # Write-through: the checkout page asks for this payment's status next
+    public_cache.payments.store(payment.id, _public_body(payment), token)
+    # The simulated bank delay and the final status update run in a worker.
+    # The client gets the 'processing' payment now and polls for the outcome.
+    payment_processor.notify()
+    return payment
 
 
 # --- 2. PRIVATE ENDPOINT (Merchant Backend) ---
 @router.post("", response_model=schemas.PaymentResponse, status_code=201)
-def create_private_payment(
+async def create_private_payment(
     payment_in: schemas.PaymentCreate, 
-    db: Session = Depends(database.get_db),
-    merchant: models.Merchant = Depends(auth.get_authenticated_merchant)
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(database.get_session),
+    merchant: auth.AuthenticatedMerchant = Depends(rate_limit.limit_merchant)
 ):
-    order = db.query(models.Order).filter(
-        models.Order.id == payment_in.order_id, 
-        models.Order.merchant_id == merchant.id
-    ).first()
-    
-    if not order:
-        raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND_ERROR"}})
-    
-    return execute_payment_processing(payment_in, db, order)
+    scope = f"{merchant.id}:POST /api/v1/payments"
+    # Rejected before the idempotency claim, so a shed request leaves its key free for the retry
+    async with rate_limit.admission.admit(str(merchant.id)), \
+            idempotency.guard(db, idempotency_key, scope, _idempotency_payload(payment_in), schemas.PaymentResponse) as claim:
+        if claim.replay:
+            return claim.replay
+        token = public_cache.payments.generation
+        payment = await database.run_db_new_ids(db, execute_payment_processing, payment_in, merchant.id, claim)
+        if not payment:
+            raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND_ERROR"}})
+    public_cache.payments.store(payment.id, _public_body(payment), token)
+    payment_processor.notify()
+    return payment
+
+
+def _validate_batch(batch: schemas.PaymentValidationBatch) -> dict:
+    return {
+        "cards": batch_validation.validate_cards(batch.card_numbers, batch.expiry_months, batch.expiry_years),
+        "vpas": {"valid": batch_validation.validate_vpas(batch.vpas)},
+    }
+
+
+@router.post("/validate/batch", response_model=schemas.PaymentValidationBatchResponse)
+async def validate_payment_batch(
+    batch: schemas.PaymentValidationBatch,
+    merchant: auth.AuthenticatedMerchant = Depends(rate_limit.limit_merchant)
+):
+    """
+    Pre-screens saved cards (Luhn, length, expiry, network) and VPAs without
+    creating payments. Results are arrays in the same order as the input.
+    """
+    if not len(batch.card_numbers) == len(batch.expiry_months) == len(batch.expiry_years):
+        raise HTTPException(status_code=400, detail={"error": {
+            "code": "BAD_REQUEST_ERROR",
+            "description": "card_numbers, expiry_months and expiry_years must have the same length",
+        }})
+    if len(batch.card_numbers) + len(batch.vpas) > VALIDATE_BATCH_MAX:
+        raise HTTPException(status_code=400, detail={"error": {
+            "code": "BAD_REQUEST_ERROR",
+            "description": f"A batch may contain at most {VALIDATE_BATCH_MAX} cards and VPAs",
+        }})
+    # CPU-bound; keeps the event loop free for other requests
+    return await run_in_threadpool(_validate_batch, batch)
 
 
 # --- 3. DASHBOARD ENDPOINTS ---
 @router.get("", response_model=List[schemas.PaymentResponse])
-def list_payments(db: Session = Depends(database.get_db), merchant: models.Merchant = Depends(auth.get_authenticated_merchant)):
-    return db.query(models.Payment).filter(models.Payment.merchant_id == merchant.id).all()
+async def list_payments(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[str] = None,
+    method: Optional[str] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    min_amount: Optional[int] = Query(None, ge=0),
+    max_amount: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(database.get_read_session),
+    merchant: auth.AuthenticatedMerchant = Depends(rate_limit.limit_merchant)
+):
+    try:
+        payments, next_cursor = await database.run_read(
+            db, crud.get_merchant_payments_page, merchant.id, cursor=cursor, limit=limit, method=method, status=status,
+            created_from=utc_naive(created_from), created_to=utc_naive(created_to),
+            min_amount=min_amount, max_amount=max_amount,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Invalid cursor"}})
+    set_next_cursor(response, request, next_cursor)
+    return payments
+
+@router.get("/stats")
+async def get_payment_stats(
+    group_by: List[str] = Query([]),
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    source: str = Query("auto", pattern="^(auto|rollups|payments)$"),
+    db: Session = Depends(database.get_read_session),
+    merchant: auth.AuthenticatedMerchant = Depends(rate_limit.limit_merchant)
+):
+    """
+    Dashboard stats for a time window, optionally grouped by day|hour, method, card_network, status.
+    Served from the hourly rollups unless card_network grouping (or source=payments) needs raw payments.
+    """
+    if source == "auto":
+        source = "rollups" if all(g in crud.ROLLUP_GROUPS for g in group_by) else "payments"
+    allowed = crud.ROLLUP_GROUPS if source == "rollups" else crud.STATS_GROUPS
+    unknown = [g for g in group_by if g not in allowed]
+    if unknown or ("day" in group_by and "hour" in group_by) or len(set(group_by)) != len(group_by):
+        raise HTTPException(status_code=400, detail={"error": {
+            "code": "BAD_REQUEST_ERROR",
+            "description": f"group_by accepts distinct values of {', '.join(allowed)} (day or hour, not both)",
+        }})
+
+    summary, groups = await database.run_read(
+        db, crud.get_merchant_stats_report, merchant.id, group_by, utc_naive(created_from), utc_naive(created_to), source=source
+    )
+    return {"summary": summary, "group_by": group_by, "source": source, "groups": groups}
+
+@router.get("/export")
+async def export_payments(
+    request: Request,
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    status: Optional[str] = None,
+    method: Optional[str] = None,
+    created_from: Optional[datetime] = Query(None, alias="from"),
+    created_to: Optional[datetime] = Query(None, alias="to"),
+    merchant: auth.AuthenticatedMerchant = Depends(rate_limit.limit_merchant)
+):
+    """
+    The merchant's payments in [from, to), oldest first, streamed as CSV or NDJSON
+    (gzip-compressed on the fly when the client sends Accept-Encoding: gzip).
+    """
+    gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    body = exports.iter_payment_export(
+        merchant.id, fmt, gzip,
+        created_from=utc_naive(created_from), created_to=utc_naive(created_to), status=status, method=method,
+    )
+    headers = {"Content-Disposition": f'attachment; filename="payments.{fmt}"', "Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=exports.FORMATS[fmt], headers=headers)
 
 # Added /public suffix to allow the checkout page to check status without a key
-@router.get("/{payment_id}/public", response_model=schemas.PaymentResponse)
-def get_public_payment_status(payment_id: str, db: Session = Depends(database.get_db)):
-    payment = db.query(models.Payment).filter(models.Payment.id == payment_id).first()
+@router.get("/{payment_id}/public", response_model=schemas.PaymentResponse, dependencies=[Depends(rate_limit.limit_public)])
+async def get_public_payment_status(
+    payment_id: str,
+    wait: float = Query(0, ge=0, le=events.LONG_POLL_MAX_SECONDS),
+    db: Session = Depends(database.get_read_session)
+):
+    """
+    Current payment status. With wait=N (long-poll) a 'processing' payment is held
+    for up to N seconds and returned as soon as it reaches success/failed.
+    """
+    queue = events.bus.subscribe(payment_id) if wait else None
+    try:
+        payment = await _load_public_payment(db, payment_id)
+        if not payment:
+            raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND_ERROR"}})
+        if queue is not None and payment["status"] not in events.TERMINAL_STATUSES:
+            if await events.wait_for_terminal(queue, wait):
+                # The event already evicted the cached 'processing' copy. Read the
+                # primary: the replica may not have replayed the final status yet.
+                payment = await _load_public_payment(database.open_session(), payment_id)
+        return payment
+    finally:
+        if queue is not None:
+            events.bus.unsubscribe(payment_id, queue)
+
+
+def _sse(status: dict) -> str:
+    return f"event: status\ndata: {json.dumps(status)}\n\n"
+
+
+@router.get("/{payment_id}/events", dependencies=[Depends(rate_limit.limit_public)])
+async def stream_payment_status(payment_id: str, db: Session = Depends(database.get_read_session)):
+    """
+    Server-sent events for the checkout page: the current status right away, then
+    the final status as soon as the payment is finalized, after which the stream ends.
+    """
+    queue = events.bus.subscribe(payment_id)
+    try:
+        payment = await _load_public_payment(db, payment_id)
+    except BaseException:
+        events.bus.unsubscribe(payment_id, queue)
+        raise
     if not payment:
+        events.bus.unsubscribe(payment_id, queue)
         raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND_ERROR"}})
-    return payment
\ No newline at end of file
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        try:
+            yield f"retry: 2000\n{_sse(events.status_event(payment))}"
+            if payment["status"] in events.TERMINAL_STATUSES:
+                return
+            started = last_check = loop.time()
+            while loop.time() - started < events.SSE_MAX_SECONDS:
+                status = await events.wait_for_terminal(queue, events.SSE_KEEPALIVE_SECONDS)
+                if status is None and loop.time() - last_check >= events.SSE_RECHECK_SECONDS:
+                    # Safety net for a missed notification (listener reconnecting, external worker on SQLite)
+                    last_check = loop.time()
+                    current = await database.run_db(database.open_session(), crud.get_payment, payment_id)
+                    if current and current.status in events.TERMINAL_STATUSES:
+                        status = events.status_event(current)
+                if status is not None:
+                    yield _sse(status)
+                    return
+                yield ": keepalive\n\n"
+        finally:
+            events.bus.unsubscribe(payment_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: stop nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
\ No newline at end of file
@@ -0,0 +1,104 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from .. import auth
+from .. import crud, schemas, database, webhooks
+from ..utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, set_next_cursor
+
+router = APIRouter()
+
+_NOT_FOUND = {"error": {"code": "NOT_FOUND_ERROR", "description": "Webhook event not found"}}
+
+
+@router.get("/config", response_model=schemas.WebhookConfig)
+async def get_webhook_config(merchant: auth.AuthenticatedMerchant = Depends(auth.get_authenticated_merchant)):
+    return {"webhook_url": merchant.webhook_url}
+
+
+@router.put("/config", response_model=schemas.WebhookConfig)
+async def set_webhook_config(
+    config: schemas.WebhookConfig,
+    db: Session = Depends(database.get_session),
+    merchant: auth.AuthenticatedMerchant = Depends(auth.get_authenticated_merchant)
+):
+    url = config.webhook_url or None
+    if url is not None:
+        try:
+            await webhooks.check_url(url)
+        except webhooks.UnsafeWebhookURL as e:
+            raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": str(e)}})
+    return {"webhook_url": await database.run_db(db, crud.set_merchant_webhook_url, merchant.id, url)}
+
+
+def _add_test_event(db: Session, merchant_id, url: str):
+    event = webhooks.add_event(db, merchant_id, url, "webhook.test", {"merchant_id": str(merchant_id)})
+    db.commit()
+    db.refresh(event)
+    return event
+
+
+@router.post("/test", response_model=schemas.WebhookEventResponse, status_code=202)
+async def send_test_webhook(
+    db: Session = Depends(database.get_session),
+    merchant: auth.AuthenticatedMerchant = Depends(auth.get_authenticated_merchant)
+):
+    """Queues a 'webhook.test' event to the configured webhook_url."""
+    if not merchant.webhook_url:
+        raise HTTPException(status_code=400, detail={"error": {
+            "code": "BAD_REQUEST_ERROR", "description": "No webhook_url configured",
+        }})
+    event = await database.run_db(db, _add_test_event, merchant.id, merchant.webhook_url)
+    webhooks.webhook_dispatcher.notify()
+    return event
+
+
+# Delivery log
+@router.get("", response_model=list[schemas.WebhookEventResponse])
+async def list_webhook_events(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[str] = None,
+    event: Optional[str] = None,
+    db: Session = Depends(database.get_session),
+    merchant: auth.AuthenticatedMerchant = Depends(auth.get_authenticated_merchant)
+):
+    try:
+        rows, next_cursor = await database.run_db(
+            db, crud.get_merchant_webhook_events_page, merchant.id, cursor=cursor, limit=limit, status=status, event=event,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail={"error": {"code": "BAD_REQUEST_ERROR", "description": "Invalid cursor"}})
+    set_next_cursor(response, request, next_cursor)
+    return rows
+
+
+@router.get("/{event_id}", response_model=schemas.WebhookEventDetail)
+async def get_webhook_event(
+    event_id: str,
+    db: Session = Depends(database.get_session),
+    merchant: auth.AuthenticatedMerchant = Depends(auth.get_authenticated_merchant)
+):
+    found = await database.run_db(db, crud.get_webhook_event, merchant.id, event_id)
+    if not found:
+        raise HTTPException(status_code=404, detail=_NOT_FOUND)
+    event, attempts = found
+    detail = schemas.WebhookEventDetail.model_validate(event)
+    detail.delivery_attempts = [schemas.WebhookAttemptResponse.model_validate(a) for a in attempts]
+    return detail
+
+
+@router.post("/{event_id}/retry", response_model=schemas.WebhookEventResponse, status_code=202)
+async def retry_webhook_event(
+    event_id: str,
+    db: Session = Depends(database.get_session),
+    merchant: auth.AuthenticatedMerchant = Depends(auth.get_authenticated_merchant)
+):
+    """Sends the event again now, including events that ran out of attempts."""
+    event = await database.run_db(db, webhooks.retry_event, merchant.id, event_id)
+    if not event:
+        raise HTTPException(status_code=404, detail=_NOT_FOUND)
+    webhooks.webhook_dispatcher.notify()
+    return event
@@ -0,0 +1,70 @@
+import re
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from . import models, partitions
+from .database import Base
+
+
+def _create_missing_indexes(engine):
+    """
+    create_all() only builds indexes together with new tables, so indexes added
+    to existing models would never reach a live database. Create them here; on
+    Postgres CONCURRENTLY, so large tables keep taking writes meanwhile.
+    """
+    inspector = inspect(engine)
+    partitioned = partitions.partitioned_tables(engine)
+    for table in Base.metadata.sorted_tables:
+        if table.name in partitioned:
+            with engine.connect() as conn:
+                existing = partitions.index_names(conn, table.name)
+        else:
+            existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            print(f"Creating missing index {index.name} on {table.name}")
+            if table.name in partitioned:
+                partitions.create_index(engine, index)
+            elif engine.dialect.name == "postgresql":
+                ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+                ddl = re.sub(r"^CREATE (UNIQUE )?INDEX", r"CREATE \1INDEX CONCURRENTLY IF NOT EXISTS", ddl)
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.execute(text(ddl))
+            else:
+                index.create(bind=engine, checkfirst=True)
+
+
+def _add_missing_columns(engine):
+    """
+    Nor does create_all() add columns to existing tables. Nullable columns
+    without a default are added here; on Postgres that only touches the catalog,
+    so it is instant even on large tables. Anything else needs a migration.
+    """
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable or column.server_default is not None:
+                print(f"Column {table.name}.{column.name} is missing and can't be added automatically")
+                continue
+            print(f"Adding missing column {column.name} to {table.name}")
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+
+
+def sync_schema(engine):
+    """
+    Brings the database up to the models: new tables (and, when partitioned,
+    the upcoming months of orders and payments), new columns, then missing indexes.
+    """
+    Base.metadata.create_all(bind=engine)
+    if models.PARTITIONED:
+        partitions.ensure_partitions(engine)
+    _add_missing_columns(engine)
+    _create_missing_indexes(engine)
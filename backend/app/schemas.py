@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from uuid import UUID
 
@@ -20,6 +20,25 @@ class OrderResponse(BaseModel):
     created_at: datetime
     model_config = ConfigDict(from_attributes=True)
 
+class OrderBatchCreate(BaseModel):
+    # Items are validated one by one in the route, so one bad item doesn't reject the batch
+    items: List[Any] = Field(..., min_length=1)
+
+class BatchItemError(BaseModel):
+    code: str
+    description: str
+
+class OrderBatchItemResult(BaseModel):
+    index: int
+    status: str  # "created" or "error"
+    order: Optional[OrderResponse] = None
+    error: Optional[BatchItemError] = None
+
+class OrderBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[OrderBatchItemResult]
+
 class PaymentCreateCard(BaseModel):
     number: str
     expiry_month: int
@@ -45,6 +64,59 @@ class PaymentResponse(BaseModel):
     vpa: Optional[str] = None
     card_network: Optional[str] = None
     card_last4: Optional[str] = None
+    card_type: Optional[str] = None
+    card_issuer: Optional[str] = None
+    card_country: Optional[str] = None
+    error_code: Optional[str] = None
+    error_description: Optional[str] = None
     created_at: datetime
     # Added: Required to convert SQLAlchemy models to Pydantic responses
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+class WebhookConfig(BaseModel):
+    webhook_url: Optional[str] = None  # http(s) URL; null stops webhooks
+
+class WebhookAttemptResponse(BaseModel):
+    attempt: int
+    response_code: Optional[int] = None
+    error: Optional[str] = None
+    duration_ms: Optional[int] = None
+    created_at: datetime
+    model_config = ConfigDict(from_attributes=True)
+
+class WebhookEventResponse(BaseModel):
+    id: str
+    event: str
+    payment_id: Optional[str] = None
+    url: str
+    status: str  # pending, delivering, delivered, failed
+    attempts: int
+    max_attempts: int
+    next_attempt_at: Optional[datetime] = None
+    last_response_code: Optional[int] = None
+    last_error: Optional[str] = None
+    created_at: datetime
+    delivered_at: Optional[datetime] = None
+    model_config = ConfigDict(from_attributes=True)
+
+class WebhookEventDetail(WebhookEventResponse):
+    payload: Dict[str, Any]
+    delivery_attempts: List[WebhookAttemptResponse] = []
+
+class PaymentValidationBatch(BaseModel):
+    # Parallel arrays: card_numbers[i] expires expiry_months[i] / expiry_years[i]
+    card_numbers: List[str] = []
+    expiry_months: List[int] = []
+    expiry_years: List[int] = []
+    vpas: List[str] = []
+
+class CardValidationResults(BaseModel):
+    valid: List[bool]
+    network: List[str]
+    error_code: List[Optional[str]]  # INVALID_CARD, EXPIRED_CARD or null
+
+class VpaValidationResults(BaseModel):
+    valid: List[bool]
+
+class PaymentValidationBatchResponse(BaseModel):
+    cards: CardValidationResults
+    vpas: VpaValidationResults
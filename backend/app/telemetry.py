@@ -0,0 +1,211 @@
+"""
+Prometheus metrics and per-request timing (GET /metrics).
+
+MetricsMiddleware times every request by method, route template and status.
+SQLAlchemy cursor events time every query, both overall and against the request
+that issued it: the request's RequestTimings lives in a context variable, which
+run_in_threadpool and AsyncSession.run_sync carry into the unit of work. stage()
+times named steps of the payment path (auth, validation, insert/commit,
+serialization, bank delay, finalization).
+
+Metrics are per process. The API serves them on /metrics; `python -m app.worker
+--metrics-port` serves a worker's (payment outcomes are counted where payments
+are finalized).
+
+Send `X-Profile: true` to get the request's own breakdown back in a Server-Timing
+header, e.g. `auth;dur=0.41, db;dur=3.12;desc="4 queries", total;dur=5.27`
+(milliseconds). PROFILE_HEADER_ENABLED=false ignores the header.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .utils.metrics import Counter, Histogram, HistogramFamily, counter_lines, gauge_lines
+
+PROFILE_HEADER_ENABLED = os.getenv("PROFILE_HEADER_ENABLED", "true").lower() == "true"
+# Stream endpoints stay open for minutes; the upper buckets keep them visible
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+REQUEST_SECONDS = HistogramFamily(
+    "http_request_duration_seconds", "Request latency until the response finished",
+    ("method", "route", "status"), REQUEST_BUCKETS,
+)
+REQUEST_QUERIES = HistogramFamily("http_request_db_queries", "Database queries per request", ("route",), QUERY_COUNT_BUCKETS)
+REQUEST_DB_SECONDS = HistogramFamily("http_request_db_seconds", "Time spent in database queries per request", ("route",))
+DB_QUERY_SECONDS = Histogram()
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Queries that raised")
+STAGE_SECONDS = HistogramFamily("payment_stage_duration_seconds", "Time spent in each step of the payment path", ("stage",))
+PAYMENTS_CREATED = Counter("payments_created_total", "Payments created", ("method", "card_network"))
+PAYMENTS_FINALIZED = Counter(
+    "payments_finalized_total", "Payments moved to success/failed", ("method", "card_network", "status", "error_code"),
+)
+
+
+class RequestTimings:
+    __slots__ = ("started", "queries", "db_seconds", "stages")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.stages = {}
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries"')
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_current = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Times a step into payment_stage_duration_seconds and the current request's breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        timings = _current.get()
+        if timings is not None:
+            timings.stages[name] = timings.stages.get(name, 0.0) + elapsed
+
+
+# On the Engine class, so the sync engine and the async engine's sync_engine are both covered.
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_QUERY_SECONDS.observe(elapsed)
+    timings = _current.get()
+    if timings is not None:
+        timings.queries += 1
+        timings.db_seconds += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _query_failed(context):
+    DB_QUERY_ERRORS.inc()
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+_templates = {}  # id(route) -> full path template, for routes declared on included routers
+
+
+def register_routes(router, prefix: str):
+    """
+    Records the full template of each of router's routes. Call with the prefix
+    it is included under: a route's own path is relative to its router ("" for
+    GET /api/v1/payments), and that route object is what scope["route"] holds.
+    """
+    for route in router.routes:
+        if hasattr(route, "path"):
+            _templates[id(route)] = prefix + route.path
+
+
+def route_template(scope) -> str:
+    """The matched route's full template (/api/v1/payments/{payment_id}/public), not the path, to bound the label set."""
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    return _templates.get(id(route)) or scope.get("root_path", "") + route.path
+
+
+class MetricsMiddleware:
+    """Pure ASGI, so streaming responses pass straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profile = PROFILE_HEADER_ENABLED and any(
+            name == b"x-profile" and value.lower() == b"true" for name, value in scope["headers"]
+        )
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if profile:
+                    headers = [*message.get("headers", []), (b"server-timing", timings.server_timing().encode())]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            template = route_template(scope)
+            REQUEST_SECONDS.labels(scope["method"], template, str(status)).observe(time.perf_counter() - timings.started)
+            REQUEST_QUERIES.labels(template).observe(timings.queries)
+            REQUEST_DB_SECONDS.labels(template).observe(timings.db_seconds)
+
+
+# stats() keys that count events since the process started, exported as counters
+STATS_COUNTERS = {
+    "payment_processor": ("completed", "failed"),
+    "acquirer": ("approved", "declined", "failures", "circuit_opened", "circuit_rejected"),
+    "webhook_dispatcher": ("delivered", "failed_attempts"),
+    "auth_cache": ("hits", "misses", "evictions"),
+    "public_cache": ("hits", "misses", "evictions", "negative_hits", "stale_writes_skipped"),
+    "rate_limit": ("allowed", "limited", "errors"),
+    "admission": ("rejected",),
+    "db_replica": ("checks", "failures", "fallbacks"),
+}
+
+
+def stats_lines(prefix: str, stats: dict, by: str = None) -> list:
+    """
+    A metric per numeric value of a component's stats() dict: a counter
+    (payment_processor_completed_total) for the keys in STATS_COUNTERS[prefix],
+    a gauge (payment_processor_in_flight) for the rest. With by, stats maps a
+    value of that label to a dict.
+    """
+    counters = STATS_COUNTERS.get(prefix, ())
+    labeled = [({by: name}, values) for name, values in stats.items()] if by else [(None, stats)]
+    keys = dict.fromkeys(key for _, values in labeled for key in values)
+    lines = []
+    for key in keys:
+        samples = [
+            (labels, values[key]) for labels, values in labeled
+            if isinstance(values.get(key), (int, float)) and not isinstance(values.get(key), bool)
+        ]
+        if samples and key in counters:
+            lines.extend(counter_lines(f"{prefix}_{key}_total", f"{prefix} {key} since start (see /health)", samples))
+        elif samples:
+            lines.extend(gauge_lines(f"{prefix}_{key}", f"{prefix} {key} (see /health)", samples))
+    return lines
+
+
+def render(*collectors) -> str:
+    """The process's metrics in the Prometheus text format; collectors add lines for other components."""
+    lines = []
+    for family in (REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS, STAGE_SECONDS):
+        lines.extend(family.prometheus_lines())
+    lines += ["# HELP db_query_duration_seconds Database query latency", "# TYPE db_query_duration_seconds histogram"]
+    lines.extend(DB_QUERY_SECONDS.prometheus_lines("db_query_duration_seconds"))
+    for counter in (DB_QUERY_ERRORS, PAYMENTS_CREATED, PAYMENTS_FINALIZED):
+        lines.extend(counter.prometheus_lines())
+    for collect in collectors:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,116 @@
+"""
+Whole-batch versions of the checks in utils/validation.py, for pre-screening
+many cards or VPAs at once. Results match the per-item functions, except
+that only ASCII digits count here (validate_luhn() also accepts other Unicode
+digits, e.g. Arabic-Indic ones).
+
+PANs are laid out as a (n, width) matrix of digits, so the Luhn sum, length
+and BIN prefix of every card come out of a handful of NumPy operations instead
+of a Python loop per card; networks come from one batched search of the BIN
+table (app/bins.py). Separators (spaces, dashes) are dropped first, the
+same way validate_luhn() drops them, whatever the input's length.
+"""
+import re
+from datetime import datetime
+
+import numpy as np
+
+from .. import bins
+from .validation import VPA_PATTERN
+
+# Inputs longer than this have their separators dropped in Python instead of
+# widening the matrix for every row
+MAX_PAN_CHARS = 32
+
+ERROR_CODES = np.array([None, "INVALID_CARD", "EXPIRED_CARD"], dtype=object)
+_KEY_WEIGHTS = 10 ** np.arange(bins.KEY_DIGITS - 1, -1, -1, dtype=np.int64)
+_NON_DIGITS = re.compile(r"[^0-9]")
+# Luhn: a doubled digit contributes 2d, minus 9 when that is above 9
+_DOUBLED = np.array([0, 2, 4, 6, 8, 1, 3, 5, 7, 9], dtype=np.uint8)
+
+
+def _digit_matrix(numbers):
+    """
+    (digits, count). digits is an (n, width) uint8 matrix holding each PAN's
+    digits left-aligned and zero-padded, i.e. what validate_luhn() keeps.
+    """
+    n = len(numbers)
+    lengths = np.fromiter(map(len, numbers), dtype=np.int64, count=n)
+    long_rows = np.flatnonzero(lengths > MAX_PAN_CHARS)
+    if len(long_rows):
+        numbers = list(numbers)
+        for row in long_rows:
+            numbers[row] = _NON_DIGITS.sub("", numbers[row])
+            lengths[row] = len(numbers[row])
+    # Wide enough to always read a full BIN prefix. Rows still longer are cut to
+    # MAX_PAN_CHARS + 1 digits, which is too many for a valid PAN either way.
+    width = max(min(int(lengths.max(initial=0)), MAX_PAN_CHARS + 1), bins.KEY_DIGITS)
+    try:
+        codes = np.array(numbers, dtype=f"S{width}").view(np.uint8).reshape(n, width)
+    except UnicodeEncodeError:
+        numbers = [_NON_DIGITS.sub("", number) for number in numbers]
+        codes = np.array(numbers, dtype=f"S{width}").view(np.uint8).reshape(n, width)
+
+    is_digit = (codes >= 48) & (codes <= 57)
+    # Rows with separators (or any other non-digit): a stable sort moves their
+    # digits to the front, in order, and the rest is blanked out as padding
+    dirty = np.flatnonzero((~is_digit & (codes != 0)).any(axis=1))
+    if len(dirty):
+        order = np.argsort(~is_digit[dirty], axis=1, kind="stable")
+        codes[dirty] = np.take_along_axis(codes[dirty], order, axis=1)
+        is_digit[dirty] = np.take_along_axis(is_digit[dirty], order, axis=1)
+    digits = np.where(is_digit, codes - 48, 0).astype(np.uint8)
+    return digits, is_digit.sum(axis=1)
+
+
+def luhn_and_network(numbers):
+    """(valid, network) arrays, as validate_luhn() and detect_card_network() for each number."""
+    digits, count = _digit_matrix(numbers)
+    columns = np.arange(digits.shape[1])
+
+    # The check digit is position 1 from the right, so column j is position count - j;
+    # even positions are doubled. Padding columns hold 0 and add nothing.
+    doubled = (count[:, None] & 1) == (columns & 1)
+    total = np.where(doubled, _DOUBLED[digits], digits).sum(axis=1, dtype=np.int32)
+    valid = (total % 10 == 0) & (count >= 13) & (count <= 19)
+
+    # The zero-padded BIN prefix (bins.bin_key) of every card, then one batched binary search
+    keys = digits[:, :bins.KEY_DIGITS].astype(np.int64) @ _KEY_WEIGHTS
+    network = bins.get_table().networks(keys)
+    network[count == 0] = "unknown"
+    return valid, network
+
+
+def validate_expiries(months, years, now: datetime = None):
+    """Boolean array, as validate_expiry() for each (month, year)."""
+    months = np.asarray(months, dtype=np.int64)
+    years = np.asarray(years, dtype=np.int64)
+    years = np.where(years > 1000, years % 100, years)
+    now = now or datetime.now()
+    current_year, current_month = now.year % 100, now.month
+    return (
+        (months >= 1) & (months <= 12)
+        & ((years > current_year) | ((years == current_year) & (months >= current_month)))
+    )
+
+
+def validate_cards(numbers, months, years, now: datetime = None) -> dict:
+    """
+    Validates parallel lists of PANs and expiries. Returns lists: valid,
+    network and error_code (None, INVALID_CARD or EXPIRED_CARD; the number is
+    checked first, as for single payments).
+    """
+    number_ok, network = luhn_and_network(numbers)
+    expiry_ok = validate_expiries(months, years, now)
+    outcome = np.select([~number_ok, ~expiry_ok], [1, 2], 0)
+    return {
+        "valid": (outcome == 0).tolist(),
+        "network": network.tolist(),
+        "error_code": ERROR_CODES[outcome].tolist(),
+    }
+
+
+def validate_vpas(vpas) -> list:
+    """As validate_vpa() for each VPA. Regexes don't vectorize; this just skips the per-call overhead."""
+    match = VPA_PATTERN.match
+    return [bool(vpa) and match(vpa) is not None for vpa in vpas]
@@ -1,8 +1,67 @@
-import secrets
+import os
 import string
+import time
+
+# ID_GENERATOR_MODE=random (default): 16 random base62 characters.
+# ID_GENERATOR_MODE=sortable: 8 characters of millisecond timestamp, then 8 random
+# base62 characters. Ids made later sort later, so primary key inserts land on the
+# right edge of the B-tree instead of on random (cold, half-full) leaf pages. The
+# timestamp is base36 (digits and lowercase) because Postgres text collations
+# don't order upper and lower case the way ASCII does. Ids still can't be guessed:
+# each millisecond has 62^8 (~2^47) possible suffixes, so a collision among ids
+# made in the same millisecond is about as likely as a random one today. Ids are
+# not checked before use: order and payment creation run under
+# database.run_db_new_ids, which retries with a new id when the insert collides.
+ID_GENERATOR_MODE = os.getenv("ID_GENERATOR_MODE", "random").lower()
+if ID_GENERATOR_MODE not in ("random", "sortable"):
+    raise RuntimeError(f"ID_GENERATOR_MODE must be 'random' or 'sortable', got {ID_GENERATOR_MODE!r}")
+
+ID_LENGTH = 16
+TIMESTAMP_CHARS = 8
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z; 36^8 ms lasts until 2113
+
+_BASE36 = string.digits + string.ascii_lowercase
+# Maps each random byte to a base62 character; bytes >= 248 (= 4 * 62) are dropped
+# so every character stays equally likely.
+_TO_BASE62 = bytes((string.digits + string.ascii_letters).encode()[b % 62] for b in range(256))
+_REJECTED = bytes(range(248, 256))
+
+
+def _random_chars(n: int) -> str:
+    """n uniform base62 characters from one os.urandom call (rarely two)."""
+    while True:
+        chars = os.urandom(n + 4).translate(_TO_BASE62, _REJECTED)
+        if len(chars) >= n:
+            return chars[:n].decode()
+
+
+_last_timestamp = (None, "")
+
+
+def _timestamp_chars(ms: int) -> str:
+    global _last_timestamp
+    if _last_timestamp[0] == ms:
+        return _last_timestamp[1]
+    n = ms - EPOCH_MS
+    chars = []
+    for _ in range(TIMESTAMP_CHARS):
+        n, digit = divmod(n, 36)
+        chars.append(_BASE36[digit])
+    encoded = "".join(reversed(chars))
+    _last_timestamp = (ms, encoded)  # Many ids share a millisecond under load
+    return encoded
+
+
+def generate_random_id(prefix: str) -> str:
+    return f"{prefix}{_random_chars(ID_LENGTH)}"
+
+
+def generate_sortable_id(prefix: str) -> str:
+    return f"{prefix}{_timestamp_chars(time.time_ns() // 1_000_000)}{_random_chars(ID_LENGTH - TIMESTAMP_CHARS)}"
+
 
 def generate_custom_id(prefix: str) -> str:
-    """Generates a prefix followed by exactly 16 alphanumeric characters."""
-    alphabet = string.ascii_letters + string.digits
-    unique_part = ''.join(secrets.choice(alphabet) for _ in range(16))
-    return f"{prefix}{unique_part}"
\ No newline at end of file
+    """Generates a prefix followed by exactly 16 alphanumeric characters (see ID_GENERATOR_MODE)."""
+    if ID_GENERATOR_MODE == "sortable":
+        return generate_sortable_id(prefix)
+    return generate_random_id(prefix)
@@ -0,0 +1,146 @@
+import bisect
+import threading
+
+# Upper bounds in seconds, from "no wait" to "about to hit pool_timeout".
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Thread-safe fixed-bucket histogram (cumulative, Prometheus-style).
+    Cheap enough to observe on every pool checkout.
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[slot] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-th observation; None when empty or beyond the last bucket."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, n in zip(self.buckets, self._counts):
+                seen += n
+                if seen >= rank:
+                    return bound
+        return None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative = []
+            running = 0
+            for bound, n in zip(self.buckets, self._counts):
+                running += n
+                cumulative.append({"le": bound, "count": running})
+            cumulative.append({"le": "+Inf", "count": self.count})
+            count, total = self.count, self.sum
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "p50": self.quantile(0.50),
+            "p99": self.quantile(0.99),
+            "buckets": cumulative,
+        }
+
+    def prometheus_lines(self, name: str, labels: dict = None) -> list:
+        """_bucket/_sum/_count samples in the Prometheus text format."""
+        with self._lock:
+            counts, count, total = list(self._counts), self.count, self.sum
+        lines = []
+        running = 0
+        for bound, n in zip(self.buckets, counts):
+            running += n
+            lines.append(f"{name}_bucket{_labels({**(labels or {}), 'le': f'{bound:g}'})} {running}")
+        lines.append(f"{name}_bucket{_labels({**(labels or {}), 'le': '+Inf'})} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict = None) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Counter:
+    """Thread-safe counter per combination of label values (Prometheus-style)."""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def prometheus_lines(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: tuple(map(str, item[0])))
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in values:
+            lines.append(f"{self.name}{_labels(dict(zip(self.labelnames, labelvalues)))} {value:g}")
+        return lines
+
+
+class HistogramFamily:
+    """One Histogram per combination of label values, created on first use."""
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *labelvalues) -> Histogram:
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labelvalues, Histogram(self.buckets))
+        return child
+
+    def prometheus_lines(self) -> list:
+        with self._lock:
+            children = sorted(self._children.items(), key=lambda item: tuple(map(str, item[0])))
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labelvalues, child in children:
+            lines.extend(child.prometheus_lines(self.name, dict(zip(self.labelnames, labelvalues))))
+        return lines
+
+
+def gauge_lines(name: str, help: str, samples) -> list:
+    """A gauge from (labels dict, value) pairs."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {value:g}")
+    return lines
+
+
+def counter_lines(name: str, help: str, samples) -> list:
+    """A counter from (labels dict, value) pairs, for totals kept elsewhere that only go up. name ends in _total."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {value:g}")
+    return lines
@@ -0,0 +1,59 @@
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """A from/to query value as naive UTC, the way created_at is stored; naive values are taken as UTC already."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    """Opaque cursor for the row a page ended on."""
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Returns (created_at, id). Raises ValueError for anything we didn't issue."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), str(row_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def keyset_page(query, model, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    Newest-first keyset pagination on (created_at, id).
+
+    Each page is an index range scan that starts where the previous one ended,
+    so the cost does not grow with how deep the client pages. Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def set_next_cursor(response, request, next_cursor: str):
+    """Advertises the next page via X-Next-Cursor and an RFC 8288 Link header."""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
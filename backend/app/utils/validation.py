@@ -1,7 +1,11 @@
 import re
 from datetime import datetime
 
-import re
+from .. import bins
+
+# Regex: Alphanumeric (including . -) before @, and alphabetic after @
+# Standard length: 2-256 chars for username, 2-64 for handle
+VPA_PATTERN = re.compile(r"^[a-zA-Z0-9.-]{2,256}@[a-zA-Z]{2,64}$")
 
 def validate_vpa(vpa: str) -> bool:
     """
@@ -10,11 +14,7 @@ def validate_vpa(vpa: str) -> bool:
     """
     if not vpa or "@" not in vpa:
         return False
-    
-    # Regex: Alphanumeric (including . -) before @, and alphabetic after @
-    # Standard length: 2-256 chars for username, 2-64 for handle
-    vpa_regex = r"^[a-zA-Z0-9.-]{2,256}@[a-zA-Z]{2,64}$"
-    return bool(re.match(vpa_regex, vpa))
+    return VPA_PATTERN.match(vpa) is not None
 
 def validate_luhn(card_number: str) -> bool:
     """Implements the mathematical Mod 10 Luhn check."""
@@ -40,32 +40,9 @@ def validate_luhn(card_number: str) -> bool:
 
 
 def detect_card_network(card_number: str) -> str:
-    """Detects card brand based on leading digits (IIN/BIN)."""
-    # Clean the input
-    n = "".join(filter(str.isdigit, card_number))
-    if not n:
-        return "unknown"
-        
-    # Visa: Starts with 4
-    if n.startswith('4'):
-        return "visa"
-    
-    # Mastercard: 51–55 OR 2221–2720
-    prefix2 = int(n[:2]) if len(n) >= 2 else 0
-    prefix4 = int(n[:4]) if len(n) >= 4 else 0
-    
-    if (51 <= prefix2 <= 55) or (2221 <= prefix4 <= 2720):
-        return "mastercard"
-        
-    # Amex: 34 or 37
-    if prefix2 in [34, 37]:
-        return "amex"
-        
-    # RuPay: 60, 65, or 81–89
-    if prefix2 in [60, 65] or (81 <= prefix2 <= 89):
-        return "rupay"
-        
-    return "unknown"
+    """Detects card brand based on leading digits (IIN/BIN), from the BIN table in app/bins.py."""
+    info = bins.lookup(card_number)
+    return info.network if info else "unknown"
 
 def validate_expiry(month, year):
     """Checks if the card expiry date is valid and in the future."""
@@ -0,0 +1,492 @@
+"""
+Merchant webhooks.
+
+finalize_payment() writes a row to the webhook_events outbox in the same
+transaction that moves the payment to success/failed, so an event exists if
+and only if the status change committed. WebhookDispatcher delivers the outbox
+over a pooled HTTP client, at most WEBHOOK_MERCHANT_CONCURRENCY requests per
+merchant at a time, and retries failures with exponential backoff. Every
+attempt is logged in webhook_attempts.
+
+Requests are signed with the merchant's api_secret:
+
+    X-Webhook-Signature: hex(HMAC-SHA256(api_secret, raw request body))
+
+Events can be delivered more than once (e.g. a dispatcher dies after the POST
+but before recording it); receivers should dedupe on X-Webhook-Id.
+
+Webhook URLs must resolve to public addresses only: loopback, private,
+link-local and reserved ranges are refused when the URL is saved
+(check_url) and again when the dispatcher connects, against the address it
+actually connects to, so a name that later resolves somewhere internal (DNS
+rebinding) is refused too. WEBHOOK_ALLOWED_HOSTS (comma-separated host names
+or addresses, e.g. "localhost,127.0.0.1") skips the check for those hosts, for
+testing against tools/webhook_stub.py.
+"""
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+import httpcore
+import httpx
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from . import events, job_queue, models, schemas
+from .database import with_session
+from .utils.id_generator import generate_custom_id
+
+MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+RETRY_BASE_SECONDS = float(os.getenv("WEBHOOK_RETRY_BASE_SECONDS", "5"))
+RETRY_MAX_SECONDS = float(os.getenv("WEBHOOK_RETRY_MAX_SECONDS", "3600"))
+TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+# A 'delivering' event whose dispatcher went quiet for this long is claimable again
+LEASE_SECONDS = int(os.getenv("WEBHOOK_LEASE_SECONDS", "60"))
+MERCHANT_CONCURRENCY = int(os.getenv("WEBHOOK_MERCHANT_CONCURRENCY", "4"))
+MAX_ERROR_LENGTH = 2000
+ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()}
+
+
+class UnsafeWebhookURL(ValueError):
+    """The URL is not http(s), or its host is not (only) reachable at public addresses."""
+
+
+def is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])  # Drop an IPv6 zone id
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def resolve_public(host: str, port: int) -> str:
+    """An address of `host` to connect to; raises UnsafeWebhookURL unless every address it resolves to is public."""
+    host = host.strip("[]").lower()
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError):
+        raise UnsafeWebhookURL(f"{host} could not be resolved")
+    addresses = [info[4][0] for info in infos]
+    if not addresses or not all(is_public_address(address) for address in addresses):
+        raise UnsafeWebhookURL(f"{host} does not resolve to a public address")
+    return addresses[0]
+
+
+async def check_url(url: str):
+    """Raises UnsafeWebhookURL unless `url` is an http(s) URL whose host is public (or in WEBHOOK_ALLOWED_HOSTS)."""
+    parsed = urlparse(url)
+    try:
+        port = parsed.port
+    except ValueError:  # Out of range or not a number
+        port = -1
+    if parsed.scheme not in ("http", "https") or not parsed.hostname or port == -1:
+        raise UnsafeWebhookURL("webhook_url must be an http(s) URL")
+    if parsed.hostname.lower() in ALLOWED_HOSTS:
+        return
+    try:
+        await resolve_public(parsed.hostname, port or (443 if parsed.scheme == "https" else 80))
+    except UnsafeWebhookURL:
+        # One answer for both, so the check can't be used to probe internal names
+        raise UnsafeWebhookURL("webhook_url must resolve to a public address")
+
+
+class _PublicOnlyBackend(httpcore.AsyncNetworkBackend):
+    """
+    Wraps httpcore's network backend so every connection goes to an address
+    checked with resolve_public. The connection is made to that address, while
+    TLS (SNI, certificate) and the Host header still use the URL's host name.
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend):
+        self._backend = backend
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if host.lower() not in ALLOWED_HOSTS:
+            try:
+                host = await resolve_public(host, port)
+            except UnsafeWebhookURL as e:
+                raise httpcore.ConnectError(str(e))
+        return await self._backend.connect_tcp(
+            host, port, timeout=timeout, local_address=local_address, socket_options=socket_options,
+        )
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise httpcore.ConnectError("Unix sockets are not allowed for webhooks")
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+
+# httpcore errors as the httpx errors _send() expects; the most specific match wins
+_HTTPCORE_ERRORS = (
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (Exception, httpx.TransportError),
+)
+
+
+def _as_httpx_error(e: Exception) -> httpx.TransportError:
+    for source, target in _HTTPCORE_ERRORS:
+        if isinstance(e, source):
+            return target(str(e))
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream):
+        self._stream = stream
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except (httpcore.TimeoutException, httpcore.NetworkError, httpcore.ProtocolError) as e:
+            raise _as_httpx_error(e) from e
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+class _PublicOnlyTransport(httpx.AsyncBaseTransport):
+    """
+    The dispatcher's transport: an httpcore connection pool built with
+    _PublicOnlyBackend, through httpcore's public network_backend option, so
+    every new connection (keep-alive ones are reused per host) is checked.
+    """
+
+    def __init__(self, limits: httpx.Limits):
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(trust_env=False),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=_PublicOnlyBackend(httpcore.AnyIOBackend()),
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        try:
+            response = await self._pool.handle_async_request(core_request)
+        except (httpcore.TimeoutException, httpcore.NetworkError, httpcore.ProtocolError, httpcore.UnsupportedProtocol) as e:
+            raise _as_httpx_error(e) from e
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._pool.aclose()
+
+
+def sign(secret: str, body: bytes) -> str:
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def encode_payload(payload: dict) -> bytes:
+    """The exact bytes that are sent and signed."""
+    return json.dumps(payload, separators=(",", ":"), sort_keys=True).encode()
+
+
+def add_event(db: Session, merchant_id, url: str, event: str, data: dict, payment_id: str = None) -> models.WebhookEvent:
+    """Adds an event to the outbox. Does not commit: it is sent only if the caller's transaction commits."""
+    event_id = generate_custom_id("whevt_")
+    row = models.WebhookEvent(
+        id=event_id,
+        merchant_id=merchant_id,
+        event=event,
+        payment_id=payment_id,
+        url=url,
+        payload={"id": event_id, "event": event, "created_at": int(time.time()), "data": data},
+        status="pending",
+        attempts=0,
+        max_attempts=MAX_ATTEMPTS,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(row)
+    return row
+
+
+def enqueue_payment_event(db: Session, payment: models.Payment):
+    """payment.success / payment.failed for merchants with a webhook_url; None otherwise."""
+    merchant = db.get(models.Merchant, payment.merchant_id)
+    if not merchant or not merchant.webhook_url:
+        return None
+    return add_payment_event(db, payment, merchant.webhook_url)
+
+
+def add_payment_event(db: Session, payment: models.Payment, url: str) -> models.WebhookEvent:
+    """payment.success / payment.failed to a webhook_url the caller already read."""
+    data = {"payment": schemas.PaymentResponse.model_validate(payment).model_dump(mode="json")}
+    return add_event(db, payment.merchant_id, url, f"payment.{payment.status}", data, payment.id)
+
+
+def claim(db: Session, worker_id: str, limit: int, active: dict, per_merchant: int) -> list:
+    """
+    Leases up to `limit` due events, never more than `per_merchant` in flight
+    per merchant counting those already `active` in this dispatcher. Events of
+    merchants at their limit are left pending for the next round, so one slow
+    endpoint can't hold every slot (or sit on leases it can't use yet).
+    """
+    now = datetime.utcnow()
+    query = db.query(models.WebhookEvent).filter(
+        ((models.WebhookEvent.status == "pending") & (models.WebhookEvent.next_attempt_at <= now))
+        | ((models.WebhookEvent.status == "delivering") & (models.WebhookEvent.locked_until < now))
+    )
+    busy = [merchant_id for merchant_id, n in active.items() if n >= per_merchant]
+    if busy:
+        query = query.filter(models.WebhookEvent.merchant_id.notin_(busy))
+    rows = query.order_by(models.WebhookEvent.next_attempt_at).limit(limit).with_for_update(skip_locked=True).all()
+
+    counts = dict(active)
+    claimed = []
+    for row in rows:
+        if counts.get(row.merchant_id, 0) >= per_merchant:
+            continue
+        counts[row.merchant_id] = counts.get(row.merchant_id, 0) + 1
+        row.status = "delivering"
+        row.attempts = (row.attempts or 0) + 1
+        row.locked_by = worker_id
+        row.locked_until = now + timedelta(seconds=LEASE_SECONDS)
+        claimed.append({
+            "id": row.id,
+            "merchant_id": row.merchant_id,
+            "url": row.url,
+            "payload": row.payload,
+            "attempts": row.attempts,
+        })
+    if claimed:
+        # Secrets are read at send time, so a rotated secret signs pending retries too
+        merchant_ids = {event["merchant_id"] for event in claimed}
+        secrets = dict(
+            db.query(models.Merchant.id, models.Merchant.api_secret).filter(models.Merchant.id.in_(merchant_ids)).all()
+        )
+        for event in claimed:
+            event["secret"] = secrets.get(event["merchant_id"])
+    db.commit()
+    return claimed
+
+
+def record_attempt(db: Session, event_id: str, attempt: int, response_code, error, duration_ms: int):
+    """Logs an attempt and moves the event to delivered, back to pending, or to failed when out of attempts."""
+    now = datetime.utcnow()
+    db.add(models.WebhookAttempt(
+        event_id=event_id,
+        attempt=attempt,
+        response_code=response_code,
+        error=error[:MAX_ERROR_LENGTH] if error else None,
+        duration_ms=duration_ms,
+        created_at=now,
+    ))
+    # Only while the lease is ours: a dispatcher that lost it leaves the event to the new holder
+    row = (
+        db.query(models.WebhookEvent)
+        .filter(
+            models.WebhookEvent.id == event_id,
+            models.WebhookEvent.status == "delivering",
+            models.WebhookEvent.attempts == attempt,
+        )
+        .first()
+    )
+    if row is not None:
+        row.last_response_code = response_code
+        row.last_error = error[:MAX_ERROR_LENGTH] if error else None
+        row.locked_by = None
+        row.locked_until = None
+        if error is None:
+            row.status = "delivered"
+            row.delivered_at = now
+        elif row.attempts >= row.max_attempts:
+            row.status = "failed"
+        else:
+            row.status = "pending"
+            row.next_attempt_at = now + timedelta(
+                seconds=job_queue.retry_delay(row.attempts, RETRY_BASE_SECONDS, RETRY_MAX_SECONDS)
+            )
+    db.commit()
+
+
+def retry_event(db: Session, merchant_id, event_id: str):
+    """Schedules another attempt now; failed events get one more attempt. None if not found."""
+    row = (
+        db.query(models.WebhookEvent)
+        .filter(models.WebhookEvent.id == event_id, models.WebhookEvent.merchant_id == merchant_id)
+        .first()
+    )
+    if row is None:
+        return None
+    if row.status != "delivering":
+        row.status = "pending"
+        row.next_attempt_at = datetime.utcnow()
+        row.max_attempts = max(row.max_attempts, row.attempts + 1)
+        db.commit()
+        db.refresh(row)
+    return row
+
+
+class WebhookDispatcher:
+    """
+    Delivers the webhook outbox. Like PaymentProcessor, deliveries are
+    coroutines on the event loop and only the short bookkeeping queries use
+    the threadpool, so thousands of slow merchant endpoints cost sockets, not
+    threads or pooled DB connections. Any number of dispatchers may run.
+    """
+
+    def __init__(self, max_concurrency: int, worker_id: str, poll_interval: float = 1.0,
+                 per_merchant: int = MERCHANT_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.per_merchant = per_merchant
+        self.worker_id = worker_id
+        self.poll_interval = poll_interval
+        self.in_flight = 0
+        self.delivered = 0
+        self.failed_attempts = 0
+        self._active = {}  # merchant_id -> deliveries in flight
+        self._client = None
+        self._loop = None
+        self._wakeup = None
+        self._tasks = set()
+        self._consumer = None
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        # Keep-alive connections are reused across deliveries to the same host
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        self._client = httpx.AsyncClient(
+            timeout=TIMEOUT_SECONDS,
+            transport=_PublicOnlyTransport(limits),
+            follow_redirects=False,
+            trust_env=False,
+            headers={"User-Agent": "payment-gateway-webhooks/1.0"},
+        )
+        self._consumer = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        # Interrupted deliveries are claimed again once their lease runs out.
+        tasks = [self._consumer] + list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._client.aclose()
+        self._loop = None
+
+    def notify(self):
+        """Wakes the dispatcher, e.g. after a payment status change. Thread-safe."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _consume(self):
+        while True:
+            self._wakeup.clear()
+            free = self.max_concurrency - self.in_flight
+            claimed = []
+            if free > 0:
+                try:
+                    claimed = await run_in_threadpool(
+                        with_session, claim, self.worker_id, free, dict(self._active), self.per_merchant
+                    )
+                except Exception as e:
+                    print(f"Webhook dispatcher {self.worker_id} failed to claim events: {e}")
+            for event in claimed:
+                self.in_flight += 1
+                self._active[event["merchant_id"]] = self._active.get(event["merchant_id"], 0) + 1
+                task = asyncio.create_task(self._run(event))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            if not claimed or len(claimed) < free:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _send(self, event: dict):
+        """One POST; returns (response_code, error). error is None for a 2xx."""
+        if not event["secret"]:
+            return None, "Merchant not found"
+        body = encode_payload(event["payload"])
+        headers = {
+            "Content-Type": "application/json",
+            "X-Webhook-Id": event["id"],
+            "X-Webhook-Attempt": str(event["attempts"]),
+            "X-Webhook-Signature": sign(event["secret"], body),
+        }
+        try:
+            res = await self._client.post(event["url"], content=body, headers=headers)
+        except httpx.HTTPError as e:
+            return None, f"{type(e).__name__}: {e}"
+        if 200 <= res.status_code < 300:
+            return res.status_code, None
+        return res.status_code, f"HTTP {res.status_code}"
+
+    async def _run(self, event: dict):
+        merchant_id = event["merchant_id"]
+        try:
+            started = time.perf_counter()
+            code, error = await self._send(event)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            if error is None:
+                self.delivered += 1
+            else:
+                self.failed_attempts += 1
+            await run_in_threadpool(with_session, record_attempt, event["id"], event["attempts"], code, error, duration_ms)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Webhook {event['id']} attempt {event['attempts']} could not be recorded: {e}")
+        finally:
+            self.in_flight -= 1
+            self._active[merchant_id] -= 1
+            if not self._active[merchant_id]:
+                del self._active[merchant_id]
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "in_flight": self.in_flight,
+            "merchants_in_flight": len(self._active),
+            "delivered": self.delivered,
+            "failed_attempts": self.failed_attempts,
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+webhook_dispatcher = WebhookDispatcher(
+    max_concurrency=int(os.getenv("WEBHOOK_CONCURRENCY", "200")),
+    worker_id=job_queue.worker_identity("webhooks"),
+)
+
+# Finalized payments usually come with an outbox row: look for it right away
+# instead of at the next poll.
+events.bus.add_listener(lambda status: webhook_dispatcher.notify())
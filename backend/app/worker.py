@@ -0,0 +1,139 @@
+"""
+Payment finalization worker.
+
+Claims jobs from the `payment_jobs` table and finalizes payments, independently
+of the API tier, and delivers the webhook outbox (unless --no-webhooks). Run as
+many processes (and nodes) as the load needs:
+
+    python -m app.worker --processes 4 --concurrency 500 [--metrics-port 9100]
+
+With --metrics-port each process serves Prometheus metrics on its own port
+(the given one, then the next ones up) at /metrics.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _serve_metrics(port: int, collect):
+    """/metrics on a daemon thread; the worker has no HTTP server of its own."""
+    from .telemetry import render
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render(collect).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _serve(concurrency: int, poll_interval: float, webhooks: bool, metrics_port: int = None):
+    # Imported here so every spawned process builds its own engine and pool.
+    from . import acquirers
+    from .database import pool_metric_lines, wait_for_database
+    from .job_queue import worker_identity
+    from .telemetry import stats_lines
+    from .processor import PaymentProcessor
+    from .webhooks import WebhookDispatcher
+
+    await wait_for_database()
+
+    processor = PaymentProcessor(
+        max_concurrency=concurrency,
+        worker_id=worker_identity("worker"),
+        poll_interval=poll_interval,
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    dispatcher = None
+    if webhooks:
+        dispatcher = WebhookDispatcher(
+            max_concurrency=int(os.getenv("WEBHOOK_CONCURRENCY", "200")),
+            worker_id=worker_identity("webhooks"),
+            poll_interval=poll_interval,
+        )
+
+    def collect():
+        lines = pool_metric_lines() + stats_lines("payment_processor", processor.stats())
+        lines += stats_lines("acquirer", acquirers.stats(), by="method")
+        if dispatcher is not None:
+            lines += stats_lines("webhook_dispatcher", dispatcher.stats())
+        return lines
+
+    metrics_server = _serve_metrics(metrics_port, collect) if metrics_port else None
+
+    await processor.start()
+    if dispatcher is not None:
+        await dispatcher.start()
+    print(f"Worker {processor.worker_id} started (concurrency={concurrency}, webhooks={webhooks})")
+    await stop.wait()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    if dispatcher is not None:
+        await dispatcher.stop()
+    await processor.stop()
+    print(f"Worker {processor.worker_id} stopped")
+
+
+def run_worker(concurrency: int, poll_interval: float, webhooks: bool = True, metrics_port: int = None):
+    asyncio.run(_serve(concurrency, poll_interval, webhooks, metrics_port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payment finalization worker")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "1")))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("PAYMENT_PROCESSOR_CONCURRENCY", "1000")))
+    parser.add_argument("--poll-interval", type=float, default=float(os.getenv("WORKER_POLL_INTERVAL", "1.0")))
+    parser.add_argument("--no-webhooks", dest="webhooks", action="store_false", help="don't deliver webhooks from this worker")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("WORKER_METRICS_PORT", "0")) or None,
+                        help="serve /metrics from this port (one port per process, counting up)")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker(args.concurrency, args.poll_interval, args.webhooks, args.metrics_port)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    children = [
+        ctx.Process(
+            target=run_worker,
+            args=(args.concurrency, args.poll_interval, args.webhooks, args.metrics_port + i if args.metrics_port else None),
+            daemon=False,
+        )
+        for i in range(args.processes)
+    ]
+    for child in children:
+        child.start()
+
+    def forward(signum, _frame):
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signum)
+
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+    for child in children:
+        child.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: per-request overhead of get_authenticated_merchant, cache on vs off.
+
+Calls the auth dependency directly (no HTTP) against the database in
+DATABASE_URL, or a throwaway SQLite file when it is not set. Point it at
+Postgres to include the real network round trip that a cache miss costs.
+
+Usage (from backend/):
+    python benchmarks/bench_auth_cache.py --iterations 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_auth.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import auth  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.main import seed_test_merchant  # noqa: E402
+
+API_KEY = "key_test_abc123"
+API_SECRET = "secret_test_xyz789"
+
+
+def measure(iterations: int) -> float:
+    """Returns mean microseconds per authenticated call."""
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            auth.get_authenticated_merchant(x_api_key=API_KEY, x_api_secret=API_SECRET, db=db)
+        return (time.perf_counter() - start) / iterations * 1e6
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    seed_test_merchant()
+
+    auth.AUTH_CACHE_ENABLED = False
+    measure(100)  # warm up the pool and statement cache
+    uncached = measure(args.iterations)
+
+    auth.AUTH_CACHE_ENABLED = True
+    auth.credential_cache.clear()
+    cached = measure(args.iterations)
+
+    print(f"database           : {engine.url.get_backend_name()}")
+    print(f"iterations         : {args.iterations}")
+    print(f"cache off          : {uncached:8.1f} us/request")
+    print(f"cache on           : {cached:8.1f} us/request")
+    print(f"speedup            : {uncached / cached:8.1f}x")
+    print(f"cache stats        : {auth.credential_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark: per-item validation (utils/validation.py) vs batch validation
+(utils/batch_validation.py) for cards and VPAs.
+
+Generates --sizes inputs each: a mix of valid and invalid PANs across the
+networks (some formatted with spaces), random expiries, and VPAs. Pure CPU,
+no database.
+
+Usage (from backend/):
+    python benchmarks/bench_batch_validation.py --sizes 1000,100000,1000000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import batch_validation  # noqa: E402
+from app.utils.validation import detect_card_network, validate_expiry, validate_luhn, validate_vpa  # noqa: E402
+
+PREFIXES = ["4", "51", "55", "2221", "2720", "34", "37", "60", "65", "81", "9"]
+
+
+def make_pan(rng: random.Random) -> str:
+    body = rng.choice(PREFIXES) + "".join(rng.choices(string.digits, k=rng.randint(11, 14)))
+    pan = body + str(rng.randrange(10))  # About one in ten passes Luhn
+    return " ".join(pan[i:i + 4] for i in range(0, len(pan), 4)) if rng.random() < 0.2 else pan
+
+
+def make_inputs(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    numbers = [make_pan(rng) for _ in range(n)]
+    months = [rng.randint(1, 12) for _ in range(n)]
+    years = [rng.randint(2020, 2035) for _ in range(n)]
+    vpas = [f"user{rng.randrange(10**6)}@{rng.choice(['okaxis', 'ybl', 'paytm', '1bad'])}" for _ in range(n)]
+    return numbers, months, years, vpas
+
+
+def per_item_cards(numbers, months, years):
+    return [
+        (validate_luhn(number), detect_card_network(number), validate_expiry(month, year))
+        for number, month, year in zip(numbers, months, years)
+    ]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    args = parser.parse_args()
+
+    batch_validation.validate_cards(["4111111111111111"], [12], [2030])  # warm up
+    print(f"{'inputs':>9} {'cards/item s':>13} {'cards/batch s':>14} {'speedup':>8} {'vpas/item s':>12} {'vpas/batch s':>13} {'speedup':>8}")
+    for n in (int(size) for size in args.sizes.split(",")):
+        numbers, months, years, vpas = make_inputs(n)
+        cards_item = timed(per_item_cards, numbers, months, years)
+        cards_batch = timed(batch_validation.validate_cards, numbers, months, years)
+        vpas_item = timed(lambda: [validate_vpa(v) for v in vpas])
+        vpas_batch = timed(batch_validation.validate_vpas, vpas)
+        print(
+            f"{n:>9} {cards_item:>13.3f} {cards_batch:>14.3f} {cards_item / cards_batch:>7.1f}x"
+            f" {vpas_item:>12.3f} {vpas_batch:>13.3f} {vpas_item / vpas_batch:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
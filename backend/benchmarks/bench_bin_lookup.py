@@ -0,0 +1,94 @@
+"""
+Benchmark: BIN table lookups against a large synthetic table.
+
+Builds a CSV of --ranges ranges (network-level defaults plus 6-digit issuer
+ranges with nested 8-digit sub-ranges, as a licensed BIN file would have),
+compiles it with app.bins, and measures:
+
+  - compile time and size of the memory-mapped files,
+  - single-card lookups/s (BinTable.lookup, the payment path),
+  - batched lookups/s (BinTable.find, the batch validation path).
+
+Pure CPU, no database.
+
+Usage (from backend/):
+    python benchmarks/bench_bin_lookup.py --ranges 500000 --lookups 200000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import bins  # noqa: E402
+
+COUNTRIES = ["IN", "US", "GB", "SG", "AE", "JP"]
+TYPES = ["credit", "debit", "prepaid"]
+
+
+def write_ranges(path: str, count: int, rng: random.Random):
+    with open(bins.DEFAULT_PATH, newline="") as f:
+        defaults = list(csv.reader(f))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerows(defaults)
+        written = len(defaults) - 1
+        # Distinct 6-digit BINs, some split further into 8-digit sub-ranges
+        for bin6 in rng.sample(range(100000, 1000000), count):
+            if written >= count:
+                break
+            row = [bin6, bin6, rng.choice(["visa", "mastercard", "rupay", "amex", "discover"]),
+                   rng.choice(TYPES), f"Issuer {bin6 % 5000}", rng.choice(COUNTRIES)]
+            writer.writerow(row)
+            written += 1
+            if rng.random() < 0.2 and written < count:
+                low = bin6 * 100 + rng.randrange(0, 90)
+                writer.writerow([low, low + rng.randrange(0, 10)] + row[2:3] + [rng.choice(TYPES), f"Issuer {bin6 % 5000} Premium", row[5]])
+                written += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ranges", type=int, default=500000)
+    parser.add_argument("--lookups", type=int, default=200000)
+    parser.add_argument("--batch", type=int, default=1000000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "bins.csv")
+        write_ranges(csv_path, args.ranges, rng)
+
+        start = time.perf_counter()
+        rows, segments = bins.compile_table(csv_path, os.path.join(tmp, "compiled"))
+        compile_s = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(tmp, "compiled", name)) for name in os.listdir(os.path.join(tmp, "compiled")))
+
+        start = time.perf_counter()
+        table = bins.BinTable(os.path.join(tmp, "compiled"))
+        open_ms = (time.perf_counter() - start) * 1000
+
+        pans = [f"{rng.randrange(10**15, 10**16)}" for _ in range(args.lookups)]
+        start = time.perf_counter()
+        hits = sum(table.lookup(pan) is not None for pan in pans)
+        single_s = time.perf_counter() - start
+
+        keys = np.array([rng.randrange(10**7, 10**8) for _ in range(args.batch)], dtype=np.int64)
+        start = time.perf_counter()
+        found = table.find(keys)
+        batch_s = time.perf_counter() - start
+
+    print(f"ranges          : {rows} -> {segments} segments, compiled in {compile_s:.1f} s, {size / 2**20:.1f} MiB mapped")
+    print(f"open (mmap)     : {open_ms:.2f} ms")
+    print(f"single lookups  : {args.lookups / single_s:12,.0f} /s  ({single_s / args.lookups * 1e6:.2f} us each, {hits / args.lookups:.0%} hit)")
+    print(f"batched lookups : {args.batch / batch_s:12,.0f} /s  ({(found >= 0).mean():.0%} hit)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark: DB_DRIVER=sync vs DB_DRIVER=async under concurrent clients.
+
+For each driver, starts the API under uvicorn and drives authenticated
+GET /api/v1/orders/{id} (one indexed query per request) and POST /api/v1/orders
+(one insert + commit) from N concurrent clients, reporting throughput and
+latency percentiles.
+
+Uses a throwaway SQLite file unless --database-url points at Postgres, which is
+what the numbers should be taken from: SQLite serializes writers, and aiosqlite
+runs every call on its own thread. Rows created by the run are left behind.
+The async driver needs asyncpg (Postgres) or aiosqlite (SQLite) installed.
+
+Usage (from backend/):
+    python benchmarks/bench_db_driver.py --clients 50,200,1000 --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HEADERS = {"X-Api-Key": "key_test_abc123", "X-Api-Secret": "secret_test_xyz789"}
+
+
+def start_server(port: int, database_url: str, driver: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        DB_DRIVER=driver,
+        # Measure the request path only; payments aren't created here.
+        EMBEDDED_WORKER="false",
+        RATE_LIMIT_ENABLED="false",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+    )
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+async def wait_until_up(client: httpx.AsyncClient):
+    for _ in range(200):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("API did not start")
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[max(0, int(len(sorted_values) * pct) - 1)]
+
+
+async def drive(client, clients: int, total: int, make_request):
+    """Runs `total` requests from `clients` concurrent workers; returns (req/s, latencies, errors)."""
+    remaining = total
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                res = await make_request()
+                if res.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    return total / elapsed, sorted(latencies), errors
+
+
+async def run_driver(args, driver: str, database_url: str):
+    rows = []
+    server = start_server(args.port, database_url, driver)
+    try:
+        max_clients = max(args.clients)
+        limits = httpx.Limits(max_connections=max_clients, max_keepalive_connections=max_clients)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=120, trust_env=False
+        ) as client:
+            await wait_until_up(client)
+            res = await client.post("/api/v1/orders", json={"amount": 50000}, headers=HEADERS)
+            res.raise_for_status()
+            order_id = res.json()["id"]
+
+            scenarios = {
+                "read": lambda: client.get(f"/api/v1/orders/{order_id}", headers=HEADERS),
+                "write": lambda: client.post("/api/v1/orders", json={"amount": 50000}, headers=HEADERS),
+            }
+            for name, make_request in scenarios.items():
+                for clients in args.clients:
+                    # Warm up connections on both sides before measuring.
+                    await drive(client, clients, clients, make_request)
+                    rps, latencies, errors = await drive(client, clients, args.requests, make_request)
+                    rows.append((driver, name, clients, rps, percentile(latencies, 0.50), percentile(latencies, 0.99), errors))
+    finally:
+        stop_server(server)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", default="50,200,1000")
+    parser.add_argument("--requests", type=int, default=5000, help="requests per scenario and client count")
+    parser.add_argument("--drivers", default="sync,async")
+    parser.add_argument("--database-url", help="database the API runs against (default: throwaway SQLite)")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    args.clients = [int(c) for c in args.clients.split(",")]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        for driver in args.drivers.split(","):
+            rows += asyncio.run(run_driver(args, driver, database_url))
+
+    print(f"{'driver':>7} {'scenario':>9} {'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for driver, name, clients, rps, p50, p99, errors in rows:
+        print(f"{driver:>7} {name:>9} {clients:>8} {rps:>9.0f} {p50 * 1000:>9.1f} {p99 * 1000:>9.1f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
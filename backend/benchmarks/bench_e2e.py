@@ -0,0 +1,315 @@
+"""
+End-to-end load test of the payment API: order create -> payment create -> status poll.
+
+Seeds --merchants merchants, each with --seed-payments historical payments (so
+list endpoints and indexes see realistic tables), starts the API under uvicorn
+and runs --flows checkout flows from --clients concurrent clients, spread over
+the merchants. Each flow creates an order, pays it (card and UPI alternately),
+waits for the outcome by polling GET /payments/{id}/public every --poll-ms (or
+long-polling with --long-poll) and, every --list-every flows, lists the
+merchant's payments.
+
+Every request is sent with X-Profile: true, so the database queries it ran are
+read from its Server-Timing header. Reports throughput, p50/p95/p99 latency and
+queries per request for each operation, and writes them as JSON (--output).
+--compare a previous JSON to fail (exit 1) when p95 latency or throughput is
+worse by more than --max-regression.
+
+Uses a throwaway SQLite file unless --database-url is given (use a scratch
+Postgres database for representative numbers; its tables are dropped). The
+bank delay is TEST_PROCESSING_DELAY (--delay-ms) with TEST_MODE=true.
+
+Usage (from backend/):
+    python benchmarks/bench_e2e.py --flows 2000 --clients 50 --delay-ms 200 --output run.json
+    python benchmarks/bench_e2e.py --flows 2000 --clients 50 --delay-ms 200 --compare run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+CARD = {"number": "4111111111111111", "expiry_month": 12, "expiry_year": 2099, "cvv": "123", "holder_name": "Load Test"}
+OPERATIONS = ("order_create", "payment_create", "status_poll", "list_payments")
+_QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+def merchant_credentials(i: int) -> dict:
+    return {"X-Api-Key": f"key_bench_{i}", "X-Api-Secret": f"secret_bench_{i}"}
+
+
+def seed(database_url: str, merchants: int, payments_per_merchant: int):
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+
+    from app import models, rollups
+    from app.database import Base
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    start = datetime.utcnow() - timedelta(days=30)
+    try:
+        for m in range(merchants):
+            merchant_id = uuid.uuid4()
+            db.execute(insert(models.Merchant), [{
+                "id": merchant_id, "name": f"Bench {m}", "email": f"bench{m}@example.com",
+                "api_key": f"key_bench_{m}", "api_secret": f"secret_bench_{m}", "is_active": True,
+            }])
+            if not payments_per_merchant:
+                continue
+            order_id = f"order_seed{m:011d}"
+            db.execute(insert(models.Order), [{
+                "id": order_id, "merchant_id": merchant_id, "amount": 50000, "currency": "INR",
+                "status": "paid", "created_at": start, "updated_at": start,
+            }])
+            batch = []
+            for i in range(payments_per_merchant):
+                created = start + timedelta(seconds=i * 30 * 86400 // payments_per_merchant)
+                batch.append({
+                    "id": f"pay_s{m:05d}{i:010d}", "order_id": order_id, "merchant_id": merchant_id,
+                    "amount": 100 + i % 100000, "currency": "INR", "method": "upi" if i % 2 else "card",
+                    "status": "success" if i % 10 else "failed", "vpa": "user@okaxis" if i % 2 else None,
+                    "card_network": None if i % 2 else "visa", "card_last4": None if i % 2 else "1111",
+                    "created_at": created, "updated_at": created,
+                })
+                if len(batch) == 10000:
+                    db.execute(insert(models.Payment), batch)
+                    batch = []
+            if batch:
+                db.execute(insert(models.Payment), batch)
+        db.commit()
+        rollups.rebuild(db)
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def start_server(port: int, database_url: str, delay_ms: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        TEST_MODE="true",
+        TEST_PAYMENT_SUCCESS="true",
+        TEST_PROCESSING_DELAY=str(delay_ms),
+        RATE_LIMIT_ENABLED="false",  # Every client comes from 127.0.0.1
+        PROFILE_HEADER_ENABLED="true",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+async def wait_until_up(client: httpx.AsyncClient):
+    for _ in range(300):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("API did not start")
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {op: [] for op in OPERATIONS}  # (seconds, queries)
+        self.errors = {op: 0 for op in OPERATIONS}
+
+    async def call(self, op: str, request):
+        start = time.perf_counter()
+        try:
+            res = await request
+        except httpx.HTTPError:
+            self.errors[op] += 1
+            return None
+        elapsed = time.perf_counter() - start
+        if res.status_code >= 400:
+            self.errors[op] += 1
+            return None
+        match = _QUERIES.search(res.headers.get("server-timing", ""))
+        self.samples[op].append((elapsed, int(match.group(1)) if match else None))
+        return res
+
+
+def percentile(sorted_values: list, q: float):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))]
+
+
+async def run_flows(args, recorder: Recorder):
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    profile = {"X-Profile": "true"}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=120, trust_env=False) as client:
+        await wait_until_up(client)
+        next_flow = 0
+
+        async def flow(n: int):
+            headers = {**merchant_credentials(n % args.merchants), **profile}
+            res = await recorder.call("order_create", client.post("/api/v1/orders", json={"amount": 50000}, headers=headers))
+            if res is None:
+                return
+            body = {"order_id": res.json()["id"], "method": "card", "card": CARD} if n % 2 else \
+                {"order_id": res.json()["id"], "method": "upi", "vpa": "user@okaxis"}
+            res = await recorder.call("payment_create", client.post("/api/v1/payments", json=body, headers=headers))
+            if res is None:
+                return
+            payment_id = res.json()["id"]
+            deadline = time.perf_counter() + args.delay_ms / 1000 + 60
+            while time.perf_counter() < deadline:
+                params = {"wait": 25} if args.long_poll else None
+                res = await recorder.call(
+                    "status_poll", client.get(f"/api/v1/payments/{payment_id}/public", params=params, headers=profile)
+                )
+                if res is not None and res.json()["status"] in ("success", "failed"):
+                    break
+                if not args.long_poll:
+                    await asyncio.sleep(args.poll_ms / 1000)
+            if args.list_every and n % args.list_every == 0:
+                await recorder.call("list_payments", client.get("/api/v1/payments", params={"limit": 50}, headers=headers))
+
+        async def client_loop():
+            nonlocal next_flow
+            while next_flow < args.flows:
+                n = next_flow
+                next_flow += 1
+                await flow(n)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(args.clients)))
+        return time.perf_counter() - start
+
+
+def summarize(recorder: Recorder, elapsed: float, flows: int) -> dict:
+    operations = {}
+    for op in OPERATIONS:
+        samples = recorder.samples[op]
+        latencies = sorted(s[0] for s in samples)
+        queries = [s[1] for s in samples if s[1] is not None]
+        operations[op] = {
+            "count": len(samples),
+            "errors": recorder.errors[op],
+            "throughput_per_s": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+            "db_queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+        }
+    return {"elapsed_s": round(elapsed, 3), "flows_per_s": round(flows / elapsed, 2), "operations": operations}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result: dict):
+    print(f"{result['flows']} flows in {result['elapsed_s']:.1f} s ({result['flows_per_s']:.1f} flows/s)")
+    print(f"{'operation':>15} {'count':>8} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for op, r in result["operations"].items():
+        if not r["count"] and not r["errors"]:
+            continue
+        cells = [f"{r[k]:>9.1f}" if r[k] is not None else f"{'-':>9}" for k in ("p50_ms", "p95_ms", "p99_ms")]
+        queries = f"{r['db_queries_per_request']:>8.1f}" if r["db_queries_per_request"] is not None else f"{'-':>8}"
+        print(f"{op:>15} {r['count']:>8} {r['errors']:>7} {r['throughput_per_s']:>9.1f} {' '.join(cells)} {queries}")
+
+
+def compare(result: dict, baseline: dict, max_regression: float) -> list:
+    """Regressions beyond max_regression (a fraction) in p95 latency or throughput, as messages."""
+    problems = []
+    print(f"\nvs baseline {baseline.get('commit') or '?'} ({baseline.get('started_at', '?')}):")
+    for op, r in result["operations"].items():
+        base = baseline["operations"].get(op)
+        if not base or not base["count"] or not r["count"]:
+            continue
+        p95 = r["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0
+        rate = r["throughput_per_s"] / base["throughput_per_s"] - 1 if base["throughput_per_s"] else 0
+        print(f"{op:>15}  p95 {p95:+7.1%}  throughput {rate:+7.1%}")
+        if p95 > max_regression:
+            problems.append(f"{op}: p95 {base['p95_ms']} -> {r['p95_ms']} ms")
+        if -rate > max_regression:
+            problems.append(f"{op}: throughput {base['throughput_per_s']} -> {r['throughput_per_s']}/s")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--merchants", type=int, default=10)
+    parser.add_argument("--seed-payments", type=int, default=1000, help="historical payments per merchant")
+    parser.add_argument("--flows", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--delay-ms", type=int, default=200, help="TEST_PROCESSING_DELAY")
+    parser.add_argument("--poll-ms", type=int, default=250)
+    parser.add_argument("--long-poll", action="store_true", help="wait on ?wait=25 instead of polling")
+    parser.add_argument("--list-every", type=int, default=10, help="list payments every N flows (0: never)")
+    parser.add_argument("--database-url", help="scratch database; its tables are dropped")
+    parser.add_argument("--port", type=int, default=8770)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="results JSON of an earlier run")
+    parser.add_argument("--max-regression", type=float, default=0.10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench_e2e.db')}"
+        # app.database needs a URL at import time
+        os.environ.setdefault("DATABASE_URL", database_url)
+        print(f"Seeding {args.merchants} merchants x {args.seed_payments} payments...")
+        seed(database_url, args.merchants, args.seed_payments)
+
+        started_at = datetime.now(timezone.utc).isoformat()
+        recorder = Recorder()
+        server = start_server(args.port, database_url, args.delay_ms)
+        try:
+            elapsed = asyncio.run(run_flows(args, recorder))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    result = {
+        "started_at": started_at,
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "database": database_url.split(":", 1)[0] if args.database_url else "sqlite",
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "database_url")},
+        "flows": args.flows,
+        **summarize(recorder, elapsed, args.flows),
+    }
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, args.max_regression)
+        if problems:
+            print("Regressions:\n  " + "\n  ".join(problems))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
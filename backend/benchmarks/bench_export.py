@@ -0,0 +1,175 @@
+"""
+Benchmark and memory check: GET /api/v1/payments/export streams in constant memory.
+
+Seeds one merchant with max(--sizes) payments, one second apart, then exports
+the first N of them for every N in --sizes, each in a fresh process, and
+reports rows, output size, time and the process's peak RSS. Fails (exit 1)
+when the largest export's peak RSS exceeds the smallest one's by more than
+--max-growth-mb. --baseline also measures loading the same rows as ORM +
+PaymentResponse objects, the way a list endpoint would.
+
+Uses a throwaway SQLite file unless --database-url is given (use a scratch
+Postgres database to exercise the server-side cursor; its tables are dropped).
+
+Usage (from backend/):
+    python benchmarks/bench_export.py --sizes 10000,1000000 --format csv --gzip
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MERCHANT_ID = uuid.UUID("550e8400-e29b-41d4-a716-446655440000")
+START = datetime(2025, 1, 1)
+
+
+def seed(database_url: str, n: int):
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+
+    from app import models
+    from app.database import Base
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        db.execute(insert(models.Merchant), [{
+            "id": MERCHANT_ID, "name": "Bench", "email": "bench@example.com",
+            "api_key": "key_bench", "api_secret": "secret_bench", "is_active": True,
+        }])
+        db.execute(insert(models.Order), [{
+            "id": "order_bench", "merchant_id": MERCHANT_ID, "amount": 50000, "currency": "INR",
+            "status": "created", "created_at": START,
+        }])
+        batch = []
+        for i in range(n):
+            card = i % 2 == 0
+            batch.append({
+                "id": f"pay_{i:016d}",
+                "order_id": "order_bench",
+                "merchant_id": MERCHANT_ID,
+                "amount": 100 + i % 500000,
+                "currency": "INR",
+                "method": "card" if card else "upi",
+                "status": "success" if i % 10 else "failed",
+                "vpa": None if card else "user@okaxis",
+                "card_network": "visa" if card else None,
+                "card_last4": "1111" if card else None,
+                "created_at": START + timedelta(seconds=i),
+            })
+            if len(batch) == 10000:
+                db.execute(insert(models.Payment), batch)
+                batch = []
+        if batch:
+            db.execute(insert(models.Payment), batch)
+        db.commit()
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def child(n: int, fmt: str, gzip: bool, baseline: bool):
+    """Runs one export in this process and prints its measurements as JSON."""
+    from app import exports
+
+    window = {"created_from": START, "created_to": START + timedelta(seconds=n)}
+    started = time.perf_counter()
+    size = 0
+    if baseline:
+        from app import models, schemas
+        from app.database import SessionLocal
+
+        db = SessionLocal()
+        payments = (
+            db.query(models.Payment)
+            .filter(models.Payment.merchant_id == MERCHANT_ID, models.Payment.created_at < window["created_to"])
+            .all()
+        )
+        body = [schemas.PaymentResponse.model_validate(p).model_dump(mode="json") for p in payments]
+        size = len(json.dumps(body))
+        rows = len(body)
+        db.close()
+    else:
+        rows = 0
+        for chunk in exports.iter_payment_export(MERCHANT_ID, fmt, gzip, **window):
+            size += len(chunk)
+            if not gzip:
+                rows += chunk.count(b"\n")
+        if not gzip and fmt == "csv":
+            rows -= 1  # Header
+    print(json.dumps({
+        "rows": rows if not gzip or baseline else None,
+        "mb": size / 1e6,
+        "seconds": time.perf_counter() - started,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def measure(database_url: str, n: int, fmt: str, gzip: bool, baseline: bool) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", str(n), "--format", fmt]
+    if gzip:
+        cmd.append("--gzip")
+    if baseline:
+        cmd.append("--baseline")
+    out = subprocess.run(cmd, env=dict(os.environ, DATABASE_URL=database_url), check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,1000000")
+    parser.add_argument("--format", default="csv", choices=("csv", "ndjson"))
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--baseline", action="store_true", help="also measure materializing the rows")
+    parser.add_argument("--max-growth-mb", type=float, default=64)
+    parser.add_argument("--database-url", help="scratch database; its tables are dropped")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child, args.format, args.gzip, args.baseline)
+        return
+
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench_export.db"
+    # app.database needs a URL at import time
+    os.environ.setdefault("DATABASE_URL", database_url)
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+    print(f"Seeding {sizes[-1]} payments...")
+    seed(database_url, sizes[-1])
+
+    print(f"{'mode':>9} {'payments':>10} {'rows':>10} {'MB out':>9} {'seconds':>9} {'rows/s':>10} {'peak RSS MB':>12}")
+    peaks = []
+    for n in sizes:
+        modes = [("export", False)] + ([("baseline", True)] if args.baseline else [])
+        for mode, baseline in modes:
+            r = measure(database_url, n, args.format, args.gzip, baseline)
+            rows = r["rows"] if r["rows"] is not None else n
+            if r["rows"] is not None:
+                assert r["rows"] == n, f"exported {r['rows']} rows, expected {n}"
+            print(f"{mode:>9} {n:>10} {rows:>10} {r['mb']:>9.1f} {r['seconds']:>9.2f} {n / r['seconds']:>10.0f} {r['peak_rss_mb']:>12.1f}")
+            if not baseline:
+                peaks.append(r["peak_rss_mb"])
+
+    growth = peaks[-1] - peaks[0]
+    print(f"Export peak RSS growth from {sizes[0]} to {sizes[-1]} rows: {growth:.1f} MB (limit {args.max_growth_mb:g})")
+    if growth > args.max_growth_mb:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: id generation speed, and primary-key index cost of random vs
+time-sortable ids.
+
+1. ids/s for the previous generator (16 secrets.choice calls), the random
+   mode and the sortable mode, plus a uniqueness check over --ids ids.
+2. Inserts --rows rows keyed by each kind of id into its own table (a
+   String(64) primary key, like orders and payments), in batches of --batch,
+   and reports insert throughput and the size of the primary key index.
+
+Part 2 uses Postgres when --database-url is given (index size from
+pg_relation_size, leaf density from pgstatindex when the pgstattuple extension
+is installed); otherwise a throwaway SQLite file, which shows the same trend
+through its page count.
+
+Usage (from backend/):
+    python benchmarks/bench_id_generator.py --database-url postgresql://... --rows 2000000
+"""
+import argparse
+import os
+import secrets
+import string
+import sys
+import tempfile
+import time
+
+from sqlalchemy import Column, MetaData, String, Table, create_engine, insert, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.id_generator import generate_random_id, generate_sortable_id  # noqa: E402
+
+ALPHABET = string.ascii_letters + string.digits
+
+
+def previous_generator(prefix: str) -> str:
+    """The generator before ID_GENERATOR_MODE existed."""
+    return prefix + "".join(secrets.choice(ALPHABET) for _ in range(16))
+
+
+GENERATORS = {"previous": previous_generator, "random": generate_random_id, "sortable": generate_sortable_id}
+
+
+def bench_generation(count: int):
+    print(f"{'generator':>10} {'ids/s':>12} {'unique':>8}")
+    for name, generate in GENERATORS.items():
+        start = time.perf_counter()
+        ids = [generate("pay_") for _ in range(count)]
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10} {count / elapsed:>12,.0f} {'yes' if len(set(ids)) == count else 'NO':>8}")
+
+
+def index_stats(conn, dialect: str, table: str) -> str:
+    if dialect == "postgresql":
+        index = f"{table}_pkey"
+        size = conn.execute(text("SELECT pg_relation_size(CAST(:i AS regclass))"), {"i": index}).scalar()
+        stats = f"index {size / 2**20:8.1f} MiB"
+        try:
+            density = conn.execute(text("SELECT avg_leaf_density FROM pgstatindex(:i)"), {"i": index}).scalar()
+            stats += f", leaf density {density:5.1f}%"
+        except Exception:
+            conn.rollback()
+        return stats
+    pages = conn.execute(text("SELECT count(*) FROM dbstat WHERE name = :n"), {"n": f"sqlite_autoindex_{table}_1"}).scalar()
+    page_size = conn.execute(text("PRAGMA page_size")).scalar()
+    return f"index {pages * page_size / 2**20:8.1f} MiB"
+
+
+def bench_inserts(database_url: str, rows: int, batch: int):
+    engine = create_engine(database_url)
+    metadata = MetaData()
+    tables = {
+        name: Table(f"bench_ids_{name}", metadata, Column("id", String(64), primary_key=True), Column("note", String(32)))
+        for name in ("random", "sortable")
+    }
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    print(f"\n{engine.dialect.name}: {rows} rows per table, batches of {batch}")
+    try:
+        for name, table in tables.items():
+            generate = GENERATORS[name]
+            start = time.perf_counter()
+            with engine.begin() as conn:
+                for offset in range(0, rows, batch):
+                    conn.execute(insert(table), [{"id": generate("pay_"), "note": "x"} for _ in range(min(batch, rows - offset))])
+            elapsed = time.perf_counter() - start
+            with engine.connect() as conn:
+                stats = index_stats(conn, engine.dialect.name, table.name)
+            print(f"{name:>10} {rows / elapsed:>10,.0f} rows/s  {stats}")
+    finally:
+        metadata.drop_all(engine)
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ids", type=int, default=1000000)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--database-url", help="Postgres to measure index growth on (default: throwaway SQLite)")
+    args = parser.parse_args()
+
+    bench_generation(args.ids)
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_inserts(args.database_url or f"sqlite:///{os.path.join(tmp, 'ids.db')}", args.rows, args.batch)
+
+
+if __name__ == "__main__":
+    main()
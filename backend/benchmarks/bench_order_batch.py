@@ -0,0 +1,116 @@
+"""
+Benchmark: orders/sec through POST /api/v1/orders vs POST /api/v1/orders/batch.
+
+Starts the API under uvicorn and creates --orders orders twice: one request
+per order from --clients concurrent clients, then in batches of --batch-size
+(also sent --clients at a time). Every single-order request pays for auth,
+an INSERT, a COMMIT and a refresh; a batch pays for them once.
+
+Uses a throwaway SQLite file unless --database-url is given (use Postgres for
+representative numbers; created orders are left behind).
+
+Usage (from backend/):
+    python benchmarks/bench_order_batch.py --orders 20000 --batch-size 500 --clients 8
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HEADERS = {"X-Api-Key": "key_test_abc123", "X-Api-Secret": "secret_test_xyz789"}
+
+
+def start_server(port: int, database_url: str, batch_size: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        EMBEDDED_WORKER="false",
+        RATE_LIMIT_ENABLED="false",  # Measure throughput, not the limiter
+        ORDER_BATCH_MAX=str(max(batch_size, int(os.getenv("ORDER_BATCH_MAX", "1000")))),
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+    )
+
+
+async def wait_until_up(client: httpx.AsyncClient):
+    for _ in range(200):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("API did not start")
+
+
+async def run_requests(clients: int, requests: list):
+    """Runs the request factories `clients` at a time; returns elapsed seconds."""
+    queue = list(reversed(requests))
+
+    async def worker():
+        while queue:
+            res = await queue.pop()()
+            res.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return time.perf_counter() - start
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=300, trust_env=False) as client:
+        await wait_until_up(client)
+
+        def order(i):
+            return {"amount": 10000 + i, "receipt": f"bench_{i}", "notes": {"batch": "bench"}}
+
+        single = [
+            (lambda i=i: client.post("/api/v1/orders", json=order(i), headers=HEADERS))
+            for i in range(args.orders)
+        ]
+        single_s = await run_requests(args.clients, single)
+
+        batches = []
+        for start in range(0, args.orders, args.batch_size):
+            items = [order(i) for i in range(start, min(start + args.batch_size, args.orders))]
+            batches.append(lambda items=items: client.post("/api/v1/orders/batch", json={"items": items}, headers=HEADERS))
+        batch_s = await run_requests(args.clients, batches)
+
+    print(f"orders          : {args.orders} ({args.clients} concurrent clients)")
+    print(f"single endpoint : {single_s:8.2f} s  {args.orders / single_s:9.0f} orders/s")
+    print(f"batch of {args.batch_size:<6} : {batch_s:8.2f} s  {args.orders / batch_s:9.0f} orders/s")
+    print(f"speedup         : {single_s / batch_s:8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--database-url", help="database the API runs against (default: throwaway SQLite)")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        server = start_server(args.port, database_url, args.batch_size)
+        try:
+            asyncio.run(run(args))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: dashboard stats computed in SQL vs. in Python.
+
+Seeds one merchant with N payments and times
+  - python : the previous crud.get_merchant_stats (load every row, sum in Python)
+  - sql    : crud.get_merchant_stats (COUNT/SUM ... FILTER in the database)
+  - grouped: crud.get_merchant_stats_breakdown by day + method
+  - rollups: crud.get_merchant_stats from merchant_payment_rollups
+
+Runs against --database-url (use a scratch Postgres database for representative
+numbers - its tables are dropped and recreated), otherwise a throwaway SQLite
+file per size.
+
+Usage (from backend/):
+    python benchmarks/bench_stats.py --sizes 10000,100000,1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MERCHANT_ID = uuid.UUID("550e8400-e29b-41d4-a716-446655440000")
+
+
+def python_stats(db, models, merchant_id):
+    """The pre-aggregation implementation, kept here for comparison."""
+    payments = db.query(models.Payment).filter(models.Payment.merchant_id == merchant_id).all()
+    successful = [p for p in payments if p.status == "success"]
+    rate = (len(successful) / len(payments)) * 100 if payments else 0
+    return {"total_transactions": len(payments), "total_amount": sum(p.amount for p in successful), "success_rate": round(rate, 2)}
+
+
+def seed(db, models, n):
+    from sqlalchemy import insert
+
+    db.execute(insert(models.Merchant), [{
+        "id": MERCHANT_ID, "name": "Bench", "email": "bench@example.com",
+        "api_key": "key_bench", "api_secret": "secret_bench", "is_active": True,
+    }])
+    db.execute(insert(models.Order), [{
+        "id": "order_bench", "merchant_id": MERCHANT_ID, "amount": 50000, "currency": "INR", "status": "created",
+    }])
+    start = datetime.utcnow() - timedelta(days=90)
+    batch = []
+    for i in range(n):
+        method = random.choice(("upi", "card"))
+        batch.append({
+            "id": f"pay_{i:016d}",
+            "order_id": "order_bench",
+            "merchant_id": MERCHANT_ID,
+            "amount": random.randint(100, 500000),
+            "currency": "INR",
+            "method": method,
+            "status": random.choices(("success", "failed", "processing"), (90, 8, 2))[0],
+            "card_network": random.choice(("visa", "mastercard", "rupay")) if method == "card" else None,
+            "created_at": start + timedelta(seconds=random.randint(0, 90 * 86400)),
+        })
+        if len(batch) == 10000:
+            db.execute(insert(models.Payment), batch)
+            batch = []
+    if batch:
+        db.execute(insert(models.Payment), batch)
+    db.commit()
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run(n, repeat, database_url):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app import crud, models, rollups
+    from app.database import Base
+
+    engine = create_engine(database_url or f"sqlite:///{tempfile.mkdtemp()}/bench_stats.db")
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        seed(db, models, n)
+        rollups.rebuild(db)
+        results = {
+            "python": timed(lambda: (python_stats(db, models, MERCHANT_ID), db.expunge_all()), repeat),
+            "sql": timed(lambda: crud.get_merchant_stats(db, MERCHANT_ID), repeat),
+            "grouped": timed(lambda: crud.get_merchant_stats_breakdown(db, MERCHANT_ID, ["day", "method"]), repeat),
+            "rollups": timed(lambda: crud.get_merchant_stats(db, MERCHANT_ID, source="rollups"), repeat),
+        }
+        assert python_stats(db, models, MERCHANT_ID)["total_amount"] == crud.get_merchant_stats(db, MERCHANT_ID)["total_amount"]
+        assert crud.get_merchant_stats(db, MERCHANT_ID) == crud.get_merchant_stats(db, MERCHANT_ID, source="rollups")
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--database-url", help="scratch database; its tables are dropped")
+    args = parser.parse_args()
+    # app.database needs a URL at import time even though each run builds its own engine.
+    os.environ.setdefault("DATABASE_URL", args.database_url or f"sqlite:///{tempfile.mkdtemp()}/import.db")
+
+    print(f"{'payments':>10} {'python ms':>12} {'sql ms':>10} {'grouped ms':>12} {'rollups ms':>12} {'speedup':>9}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        r = run(n, args.repeat, args.database_url)
+        print(f"{n:>10} {r['python']:>12.1f} {r['sql']:>10.1f} {r['grouped']:>12.1f} {r['rollups']:>12.1f} {r['python'] / r['sql']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
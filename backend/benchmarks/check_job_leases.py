@@ -0,0 +1,74 @@
+"""
+Lease expiry check for the payment job queue.
+
+Claims two jobs, lets their leases run out as if their worker had died, and
+claims again: the job with attempts left must be claimed again (attempts + 1),
+the one on its last attempt must be dead-lettered with last_error
+'lease expired' instead of being retried forever. Fails (exit 1) otherwise.
+Uses a throwaway SQLite file unless --database-url is given (use a scratch
+database; its tables are dropped).
+
+Usage (from backend/):
+    python benchmarks/check_job_leases.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="scratch database; its tables are dropped")
+    args = parser.parse_args()
+
+    # app.database needs a URL at import time
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/check_job_leases.db"
+
+    from app import job_queue, models
+    from app.database import Base, SessionLocal, engine
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    retried = job_queue.enqueue(db, "pay_lease_retried")
+    exhausted = job_queue.enqueue(db, "pay_lease_exhausted")
+    retried.max_attempts = 3
+    exhausted.max_attempts = 1
+    db.commit()
+    ids = {"retried": retried.id, "exhausted": exhausted.id}
+    db.close()
+
+    first = job_queue.claim(SessionLocal(), "check:crashed", 10)
+    # The worker dies holding both leases
+    db = SessionLocal()
+    db.query(models.PaymentJob).update({"locked_until": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    db.close()
+    second = job_queue.claim(SessionLocal(), "check:next", 10)
+
+    db = SessionLocal()
+    jobs = {name: db.get(models.PaymentJob, job_id) for name, job_id in ids.items()}
+    problems = []
+    if len(first) != 2:
+        problems.append(f"first claim took {len(first)} jobs, expected 2")
+    if [job["id"] for job in second] != [ids["retried"]]:
+        problems.append(f"second claim took {[job['payment_id'] for job in second]}, expected only pay_lease_retried")
+    if (jobs["retried"].status, jobs["retried"].attempts) != ("running", 2):
+        problems.append(f"retried job is {jobs['retried'].status} after {jobs['retried'].attempts} attempts")
+    if (jobs["exhausted"].status, jobs["exhausted"].last_error) != ("dead", "lease expired"):
+        problems.append(f"exhausted job is {jobs['exhausted'].status} ({jobs['exhausted'].last_error})")
+    db.close()
+
+    for name, job in jobs.items():
+        print(f"{name:>9}: status={job.status} attempts={job.attempts}/{job.max_attempts} last_error={job.last_error}")
+    if problems:
+        print("\n".join(problems))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
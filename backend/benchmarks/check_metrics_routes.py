@@ -0,0 +1,56 @@
+"""
+Route label check for /metrics.
+
+Calls the order and payment list routes and the public order lookup on the
+API (in-process, against a throwaway SQLite file), then reads /metrics and
+fails (exit 1) unless each request was counted under its own full route
+template:
+
+    /api/v1/orders, /api/v1/payments, /api/v1/orders/{order_id}/public
+
+Usage (from backend/):
+    python benchmarks/check_metrics_routes.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HEADERS = {"X-Api-Key": "key_test_abc123", "X-Api-Secret": "secret_test_xyz789"}
+EXPECTED = {
+    ("GET", "/api/v1/orders"),
+    ("GET", "/api/v1/payments"),
+    ("GET", "/api/v1/orders/{order_id}/public"),
+}
+
+
+def main():
+    # app.database needs a URL at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/check_metrics.db"
+    os.environ.setdefault("TEST_MODE", "true")
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        client.get("/api/v1/orders", headers=HEADERS).raise_for_status()
+        client.get("/api/v1/payments", headers=HEADERS).raise_for_status()
+        client.get("/api/v1/orders/order_missing/public")
+        body = client.get("/metrics").text
+
+    labels = set(re.findall(r'^http_request_duration_seconds_count\{method="([^"]+)",route="([^"]*)"', body, re.M))
+    print("routes counted:")
+    for method, route in sorted(labels):
+        print(f"  {method} {route or '(empty)'}")
+    missing = EXPECTED - labels
+    if missing:
+        print(f"Missing route labels: {', '.join(f'{m} {r}' for m, r in sorted(missing))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Statement count check for the payment write path.
+
+Creates --payments payments (UPI and card alternately, a share with invalid
+details so both outcomes are covered) the way POST /api/v1/payments does, then
+finalizes each as the worker would, counting the SQL statements every step
+sends. Fails (exit 1) when any step sends more than its budget:
+
+    Postgres: create 1, finalize 1 (+1 outbox INSERT for merchants with a webhook_url)
+    SQLite:   create 3, finalize 4 (success) / 3 (failed)
+
+COMMIT is not counted. Pass --webhook-url to give the merchant a webhook and
+--verbose to print every statement. Uses a throwaway SQLite file unless
+--database-url is given (use a scratch Postgres database; its tables are dropped).
+
+Usage (from backend/):
+    python benchmarks/check_payment_statements.py --database-url postgresql://localhost/bench --webhook-url http://localhost:9000/hooks
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MERCHANT_ID = uuid.UUID("550e8400-e29b-41d4-a716-446655440000")
+BUDGETS = {
+    "postgresql": {"create": 1, "finalize success": 1, "finalize failed": 1},
+    "sqlite": {"create": 3, "finalize success": 4, "finalize failed": 3},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payments", type=int, default=100)
+    parser.add_argument("--webhook-url", help="merchant webhook_url (adds the outbox INSERT to finalization)")
+    parser.add_argument("--database-url", help="scratch database; its tables are dropped")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/check_statements.db"
+    # app.database needs a URL at import time
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("TEST_MODE", "true")
+
+    from sqlalchemy import event, insert
+
+    from app import models, schemas
+    from app.database import Base, SessionLocal, engine
+    from app.processor import finalize_payment
+    from app.routers.payments import execute_payment_processing
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.execute(insert(models.Merchant), [{
+        "id": MERCHANT_ID, "name": "Bench", "email": "bench@example.com", "api_key": "key_bench",
+        "api_secret": "secret_bench", "is_active": True, "webhook_url": args.webhook_url,
+    }])
+    order_ids = [f"order_check{i:011d}" for i in range(args.payments)]
+    db.execute(insert(models.Order), [
+        {"id": order_id, "merchant_id": MERCHANT_ID, "amount": 50000, "currency": "INR", "status": "created",
+         "created_at": datetime.utcnow()}
+        for order_id in order_ids
+    ])
+    db.commit()
+    db.close()
+
+    counting = {"step": None}
+    counts = defaultdict(list)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        step = counting["step"]
+        if step is not None:
+            counts[step][-1] += 1
+            if args.verbose:
+                print(f"  [{step}] {' '.join(statement.split())[:160]}")
+
+    def measure(step: str, fn, *fn_args):
+        counting["step"] = step
+        counts[step].append(0)
+        try:
+            return fn(*fn_args)
+        finally:
+            counting["step"] = None
+
+    started = time.perf_counter()
+    for i, order_id in enumerate(order_ids):
+        if i % 2:
+            payment_in = schemas.PaymentCreate(order_id=order_id, method="upi", vpa="user@okaxis")
+        else:
+            number = "4111111111111111" if i % 4 == 0 else "4111111111111112"  # Second one fails Luhn
+            payment_in = schemas.PaymentCreate(order_id=order_id, method="card", card={
+                "number": number, "expiry_month": 12, "expiry_year": 2099, "cvv": "123", "holder_name": "Check",
+            })
+        db = SessionLocal()
+        try:
+            payment = measure("create", execute_payment_processing, db, payment_in, MERCHANT_ID)
+            payment_id, error = payment.id, None
+            if i % 4 == 2:
+                error = {"code": "INVALID_CARD", "desc": "Card validation failed"}
+        finally:
+            db.close()
+        measure("finalize failed" if error else "finalize success", finalize_payment, payment_id, error)
+        # A second run must find nothing to do and write nothing
+        measure("refinalize", finalize_payment, payment_id, None)
+    elapsed = time.perf_counter() - started
+
+    dialect = engine.dialect.name
+    budgets = dict(BUDGETS.get(dialect, BUDGETS["sqlite"]), refinalize=1)
+    if args.webhook_url:
+        budgets["finalize success"] += 1
+        budgets["finalize failed"] += 1
+    print(f"{args.payments} payments on {dialect} in {elapsed:.2f} s")
+    print(f"{'step':>17} {'runs':>6} {'min':>5} {'max':>5} {'budget':>7}")
+    over = []
+    for step, budget in budgets.items():
+        runs = counts.get(step, [])
+        if not runs:
+            continue
+        print(f"{step:>17} {len(runs):>6} {min(runs):>5} {max(runs):>5} {budget:>7}")
+        if max(runs) > budget:
+            over.append(step)
+    if over:
+        print(f"Over budget: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Load test: database queries per completed checkout, polling vs long-poll vs SSE.
+
+Runs the API in-process under uvicorn (embedded worker, throwaway SQLite unless
+--database-url is given) and counts every SQL statement it executes. For each
+mode, --checkouts clients create an order and a payment at the same time and
+then wait for the final status the way the checkout page would:
+
+  poll     : GET /payments/{id}/public every --poll-interval s (the old page)
+  longpoll : GET /payments/{id}/public?wait=25 until the status is final
+  sse      : GET /payments/{id}/events until the final status event
+
+"status" counts the statements run by the status endpoints alone; "total"
+adds creating and finalizing the payments, which is the same in every mode.
+Wall-clock seconds on SQLite are noisy (writers wait on the file lock).
+
+Usage (from backend/):
+    python benchmarks/load_checkout_status.py --checkouts 300 --delay-ms 5000
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HEADERS = {"X-Api-Key": "key_test_abc123", "X-Api-Secret": "secret_test_xyz789"}
+TERMINAL = ("success", "failed")
+
+# Set for the duration of status requests; SQLAlchemy events see it because
+# run_in_threadpool and run_sync carry the request's context along.
+in_status_request = contextvars.ContextVar("in_status_request", default=False)
+
+
+def tag_status_requests(app):
+    async def tagged(scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] == "http" and scope["method"] == "GET" and (path.endswith("/public") or path.endswith("/events")):
+            in_status_request.set(True)
+        await app(scope, receive, send)
+    return tagged
+
+
+async def wait_poll(client, payment_id, interval):
+    while True:
+        await asyncio.sleep(interval)
+        status = (await client.get(f"/api/v1/payments/{payment_id}/public")).json()["status"]
+        if status in TERMINAL:
+            return status
+
+
+async def wait_longpoll(client, payment_id, _interval):
+    while True:
+        status = (await client.get(f"/api/v1/payments/{payment_id}/public", params={"wait": 25})).json()["status"]
+        if status in TERMINAL:
+            return status
+
+
+async def wait_sse(client, payment_id, _interval):
+    async with client.stream("GET", f"/api/v1/payments/{payment_id}/events") as res:
+        async for line in res.aiter_lines():
+            if line.startswith("data: "):
+                status = json.loads(line[len("data: "):])["status"]
+                if status in TERMINAL:
+                    return status
+    raise RuntimeError("stream ended before the payment was final")
+
+
+MODES = {"poll": wait_poll, "longpoll": wait_longpoll, "sse": wait_sse}
+
+
+async def run_mode(client, mode, args, counter):
+    order_ids = []
+    for _ in range(args.checkouts):
+        res = await client.post("/api/v1/orders", json={"amount": 50000}, headers=HEADERS)
+        res.raise_for_status()
+        order_ids.append(res.json()["id"])
+
+    start_total, start_status = counter["statements"], counter["status"]
+
+    async def checkout(order_id):
+        res = await client.post("/api/v1/payments/public", json={"order_id": order_id, "method": "upi", "vpa": "user@okaxis"})
+        res.raise_for_status()
+        return await MODES[mode](client, res.json()["id"], args.poll_interval)
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(checkout(o) for o in order_ids))
+    elapsed = time.perf_counter() - start
+    completed = len([o for o in outcomes if o in TERMINAL])
+    return completed, counter["statements"] - start_total, counter["status"] - start_status, elapsed
+
+
+async def main_async(args):
+    import uvicorn
+    from sqlalchemy import event
+
+    from app import database
+    from app.main import app
+
+    counter = {"statements": 0, "status": 0}
+
+    def count(*_):
+        counter["statements"] += 1
+        if in_status_request.get():
+            counter["status"] += 1
+
+    engines = [database.engine] + ([database.async_engine.sync_engine] if database.async_engine is not None else [])
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count)
+
+    # Keep-alive above the client's idle gaps, or it may reuse a connection the server just closed
+    server = uvicorn.Server(uvicorn.Config(tag_status_requests(app), port=args.port, log_level="warning", timeout_keep_alive=120))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    rows = []
+    limits = httpx.Limits(max_connections=args.checkouts * 2, max_keepalive_connections=args.checkouts * 2)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=120, trust_env=False) as client:
+            for mode in args.modes.split(","):
+                rows.append((mode, *await run_mode(client, mode, args, counter)))
+    finally:
+        server.should_exit = True
+        await serving
+
+    print(f"checkouts: {args.checkouts}, bank delay: {args.delay_ms} ms, poll interval: {args.poll_interval} s")
+    print(f"{'mode':>9} {'completed':>10} {'status stmts':>13} {'per checkout':>13} {'total stmts':>12} {'per checkout':>13} {'seconds':>8}")
+    for mode, completed, total, status, elapsed in rows:
+        n = max(completed, 1)
+        print(f"{mode:>9} {completed:>10} {status:>13} {status / n:>13.1f} {total:>12} {total / n:>13.1f} {elapsed:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkouts", type=int, default=300)
+    parser.add_argument("--delay-ms", type=int, default=5000)
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--modes", default="poll,longpoll,sse")
+    parser.add_argument("--database-url", help="database the API runs against (default: throwaway SQLite)")
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        os.environ.update(TEST_MODE="true", TEST_PAYMENT_SUCCESS="true", TEST_PROCESSING_DELAY=str(args.delay_ms), RATE_LIMIT_ENABLED="false")
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Load test: how many payments can be 'in flight' at once?
+
+Starts the API under uvicorn against a throwaway SQLite database, fires
+CONCURRENCY simultaneous POST /api/v1/payments requests and samples /health
+while they are being processed.
+
+Before the background processor, every request held a threadpool worker
+(AnyIO default: 40) for the whole simulated bank delay, so responses trickled
+out in waves of 40 and in-flight payments were capped at 40. With the
+processor, every request returns 'processing' at once and the number of
+in-flight payments is bounded only by PAYMENT_PROCESSOR_CONCURRENCY.
+The API runs with the embedded worker, so /health reports its in-flight count.
+
+Usage (from backend/):
+    python benchmarks/load_inflight_payments.py --concurrency 500 --delay-ms 3000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+HEADERS = {"X-Api-Key": "key_test_abc123", "X-Api-Secret": "secret_test_xyz789"}
+CARD = {
+    "number": "4111111111111111",
+    "expiry_month": 12,
+    "expiry_year": 2099,
+    "cvv": "123",
+    "holder_name": "Load Test",
+}
+
+
+def start_server(port: int, db_path: str, delay_ms: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        TEST_MODE="true",
+        TEST_PAYMENT_SUCCESS="true",
+        TEST_PROCESSING_DELAY=str(delay_ms),
+        RATE_LIMIT_ENABLED="false",  # Every client comes from 127.0.0.1
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+    )
+
+
+async def wait_until_up(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("API did not start")
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=300, trust_env=False) as client:
+        await wait_until_up(client)
+
+        order_ids = []
+        for _ in range(args.concurrency):
+            res = await client.post("/api/v1/orders", json={"amount": 50000}, headers=HEADERS)
+            res.raise_for_status()
+            order_ids.append(res.json()["id"])
+
+        peak_in_flight = 0
+        done = asyncio.Event()
+
+        async def sample():
+            nonlocal peak_in_flight
+            while not done.is_set():
+                stats = (await client.get("/health")).json().get("processor") or {}
+                peak_in_flight = max(peak_in_flight, stats.get("in_flight", 0))
+                await asyncio.sleep(0.05)
+
+        async def pay(order_id):
+            start = time.perf_counter()
+            res = await client.post(
+                "/api/v1/payments",
+                json={"order_id": order_id, "method": "card", "card": CARD},
+                headers=HEADERS,
+            )
+            res.raise_for_status()
+            return time.perf_counter() - start
+
+        sampler = asyncio.create_task(sample())
+        start = time.perf_counter()
+        latencies = sorted(await asyncio.gather(*(pay(o) for o in order_ids)))
+        accepted_in = time.perf_counter() - start
+
+        # Let the processor drain so the sample covers the whole run.
+        while True:
+            queue = (await client.get("/health")).json()["queue"]
+            if queue["depth"] == 0 and queue["running"] == 0:
+                break
+            await asyncio.sleep(0.1)
+        finished_in = time.perf_counter() - start
+        done.set()
+        await sampler
+
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"payments submitted      : {args.concurrency}")
+    print(f"simulated bank delay    : {args.delay_ms} ms")
+    print(f"all accepted after      : {accepted_in:.2f} s (p99 create latency {p99 * 1000:.0f} ms)")
+    print(f"all finalized after     : {finished_in:.2f} s")
+    print(f"peak in-flight payments : {peak_in_flight}")
+    print(f"old ceiling (threadpool): 40 in flight, ~{args.concurrency / 40 * args.delay_ms / 1000:.0f} s to accept all")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--delay-ms", type=int, default=3000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start_server(args.port, os.path.join(tmp, "load.db"), args.delay_ms)
+        try:
+            asyncio.run(run(args))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Stub acquirer for testing payment finalization against a slow or failing bank.
+
+Answers the connector protocol in app/acquirers.py, with latency drawn from
+--latency (fixed, uniform between 0 and 2x, exponential or lognormal around
+--latency-ms), a share of declines, of 500s and of requests that hang past any
+sensible timeout. Answers are remembered per Idempotency-Key, so a retried
+authorization gets the same outcome (and is counted as a retry):
+
+    python tools/acquirer_stub.py --port 9200 --latency-ms 300 --latency lognormal --error-rate 0.05
+
+Then point a method (or both) at it and start the API or a worker:
+
+    ACQUIRER_CARD_URL=http://127.0.0.1:9200/authorize ACQUIRER_UPI_URL=http://127.0.0.1:9200/authorize \\
+        uvicorn app.main:app
+
+Degrade it mid-run to watch the circuit breaker open (and close once it recovers):
+
+    curl -X PUT localhost:9200/config -d '{"error_rate": 1.0}'
+    curl -X PUT localhost:9200/config -d '{"error_rate": 0, "hang_rate": 0.5}'
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TUNABLE = ("latency", "latency_ms", "decline_rate", "error_rate", "hang_rate", "hang_ms")
+
+
+def latency_seconds(args) -> float:
+    mean = args.latency_ms / 1000
+    if args.latency == "uniform":
+        return random.uniform(0, 2 * mean)
+    if args.latency == "exponential":
+        return random.expovariate(1 / mean) if mean else 0.0
+    if args.latency == "lognormal":
+        return random.lognormvariate(0, 0.5) * mean  # Median `mean`, with a long right tail
+    return mean
+
+
+def make_handler(args, stats):
+    lock = threading.Lock()
+    outcomes = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like a real acquirer
+
+        def _reply(self, code: int, body: dict):
+            reply = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def do_PUT(self):
+            if self.path != "/config":
+                self.send_error(404)
+                return
+            changes = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            for key, value in changes.items():
+                if key in TUNABLE:
+                    setattr(args, key, value)
+            config = {key: getattr(args, key) for key in TUNABLE}
+            print(f"config: {config}")
+            self._reply(200, config)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            key = self.headers.get("Idempotency-Key") or body.get("payment_id")
+            roll = random.random()
+            if roll < args.hang_rate:
+                with lock:
+                    stats["hung"] += 1
+                time.sleep(args.hang_ms / 1000)
+                self._reply(504, {"error": "timeout"})
+                return
+            time.sleep(latency_seconds(args))
+            if roll < args.hang_rate + args.error_rate:
+                with lock:
+                    stats["errors"] += 1
+                self._reply(500, {"error": "acquirer error"})
+                return
+
+            with lock:
+                stats["received"] += 1
+                outcome = outcomes.get(key)
+                if outcome is None:
+                    if random.random() < args.decline_rate:
+                        outcome = {"approved": False, "code": "PAYMENT_FAILED", "description": "Insufficient funds"}
+                    else:
+                        outcome = {"approved": True}
+                    outcomes[key] = outcome
+                    stats["approved" if outcome["approved"] else "declined"] += 1
+                else:
+                    stats["retries"] += 1
+            if not args.quiet:
+                print(f"{key} {body.get('method')} {body.get('amount')} -> {'approved' if outcome['approved'] else 'declined'}")
+            self._reply(200, outcome)
+
+        def log_message(self, *_):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency", default="fixed", choices=("fixed", "uniform", "exponential", "lognormal"))
+    parser.add_argument("--latency-ms", type=float, default=200, help="mean (median for lognormal) answer time")
+    parser.add_argument("--decline-rate", type=float, default=0.05, help="share of authorizations declined")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="share of requests held for --hang-ms, then 504")
+    parser.add_argument("--hang-ms", type=float, default=60000)
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    stats = {"received": 0, "approved": 0, "declined": 0, "retries": 0, "errors": 0, "hung": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args, stats))
+    server.daemon_threads = True  # Don't wait for hung requests on exit
+    print(f"Acquirer stub listening on http://127.0.0.1:{args.port}/authorize")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(" ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
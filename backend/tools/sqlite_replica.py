@@ -0,0 +1,57 @@
+"""
+Lagging stand-in replica for trying read routing locally with SQLite.
+
+Copies the primary database file into the replica file every --lag-seconds
+(SQLite's online backup, so the primary keeps taking writes), so the replica
+is always up to that much behind, like a streaming replica under load:
+
+    python tools/sqlite_replica.py --primary /tmp/primary.db --replica /tmp/replica.db --lag-seconds 3
+
+    DATABASE_URL=sqlite:////tmp/primary.db DATABASE_READ_URL=sqlite:////tmp/replica.db \\
+        uvicorn app.main:app
+
+A payment read right after it was created then misses on the replica and is
+served from the primary (`fallbacks` in /health `replica`). SQLite has no
+replication lag to measure, so the monitor only checks that the replica
+answers; with two Postgres databases it also reads the replay lag.
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+
+def copy(primary: str, replica: str):
+    # In place, under SQLite's own locking: the API's pooled connections keep
+    # the file open, so replacing it would leave them reading the old copy
+    src = sqlite3.connect(primary)
+    dst = sqlite3.connect(replica)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--primary", required=True, help="primary SQLite file")
+    parser.add_argument("--replica", required=True, help="replica SQLite file (overwritten)")
+    parser.add_argument("--lag-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"Copying {args.primary} -> {args.replica} every {args.lag_seconds:g}s")
+    copies = 0
+    try:
+        while True:
+            started = time.perf_counter()
+            if os.path.exists(args.primary):
+                copy(args.primary, args.replica)
+                copies += 1
+            time.sleep(max(0.0, args.lag_seconds - (time.perf_counter() - started)))
+    except KeyboardInterrupt:
+        print(f"copies={copies}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Stub merchant endpoint for testing webhook delivery locally.
+
+Prints every webhook it receives, checks X-Webhook-Signature against --secret,
+and can be made slow or flaky to exercise retries and per-merchant limits:
+
+    python tools/webhook_stub.py --port 9000 --secret secret_test_xyz789 --fail-rate 0.3 --delay-ms 200
+
+Start the API with WEBHOOK_ALLOWED_HOSTS=localhost,127.0.0.1 (webhook URLs must
+otherwise be public), then point the test merchant at it:
+
+    curl -X PUT localhost:8000/api/v1/webhooks/config -H 'Content-Type: application/json' \\
+         -H 'X-Api-Key: key_test_abc123' -H 'X-Api-Secret: secret_test_xyz789' \\
+         -d '{"webhook_url": "http://localhost:9000/webhooks"}'
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(args, stats):
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like a real endpoint
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            expected = hmac.new(args.secret.encode(), body, hashlib.sha256).hexdigest()
+            valid = hmac.compare_digest(expected, self.headers.get("X-Webhook-Signature", ""))
+            if args.delay_ms:
+                time.sleep(args.delay_ms / 1000)
+            code = 401 if not valid else (500 if random.random() < args.fail_rate else 200)
+
+            with lock:
+                stats["received"] += 1
+                stats["bad_signature"] += not valid
+                event_id = self.headers.get("X-Webhook-Id")
+                stats["duplicates"] += event_id in stats["seen"] and code == 200
+                if code == 200:
+                    stats["seen"].add(event_id)
+            if not args.quiet:
+                try:
+                    event = json.loads(body).get("event")
+                except ValueError:
+                    event = "?"
+                print(f"{code} {event_id} {event} attempt={self.headers.get('X-Webhook-Attempt')} signature={'ok' if valid else 'BAD'}")
+
+            reply = b'{"ok":true}' if code == 200 else b'{"ok":false}'
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, *_):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--secret", default="secret_test_xyz789", help="merchant api_secret the signatures are checked against")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--delay-ms", type=int, default=0, help="time taken to answer each request")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    stats = {"received": 0, "bad_signature": 0, "duplicates": 0, "seen": set()}
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args, stats))
+    print(f"Webhook stub listening on http://127.0.0.1:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"received={stats['received']} delivered={len(stats['seen'])} "
+              f"bad_signature={stats['bad_signature']} duplicates={stats['duplicates']}")
+
+
+if __name__ == "__main__":
+    main()
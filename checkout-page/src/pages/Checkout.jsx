@@ -47,26 +47,45 @@ const Checkout = () => {
         }
     };
 
-    // 3. POLLING: Uses public payment status endpoint
+    const showOutcome = (payment) => {
+        if (payment.status === 'success') {
+            setPaymentData(payment);
+            setView('success');
+            return true;
+        }
+        if (payment.status === 'failed') {
+            setErrorMessage(payment.error_description || "Transaction declined by bank");
+            setView('error');
+            return true;
+        }
+        return false;
+    };
+
+    // 3. STATUS STREAM: the server pushes the final status once (Server-Sent Events)
     const pollStatus = (id) => {
-        const interval = setInterval(async () => {
-            try {
-                const res = await axios.get(`http://localhost:8000/api/v1/payments/${id}/public`);
-                
-                if (res.data.status === 'success') {
-                    setPaymentData(res.data);
-                    setView('success');
-                    clearInterval(interval);
-                } else if (res.data.status === 'failed') {
-                    setErrorMessage(res.data.error_description || "Transaction declined by bank");
-                    setView('error');
-                    clearInterval(interval);
-                }
-            } catch (err) {
-                setView('error');
-                clearInterval(interval);
-            }
-        }, 2000);
+        if (!window.EventSource) {
+            longPollStatus(id);
+            return;
+        }
+        const source = new EventSource(`http://localhost:8000/api/v1/payments/${id}/events`);
+        source.addEventListener('status', (e) => {
+            if (showOutcome(JSON.parse(e.data))) source.close();
+        });
+        source.onerror = () => {
+            // EventSource reconnects by itself while the stream is merely interrupted;
+            // once it gives up, fall back to long-polling.
+            if (source.readyState === EventSource.CLOSED) longPollStatus(id);
+        };
+    };
+
+    // Fallback: each request waits up to 25s on the server for the status to change
+    const longPollStatus = async (id) => {
+        try {
+            const res = await axios.get(`http://localhost:8000/api/v1/payments/${id}/public`, { params: { wait: 25 } });
+            if (!showOutcome(res.data)) longPollStatus(id);
+        } catch (err) {
+            setView('error');
+        }
     };
 
     const styles = {
@@ -6,6 +6,8 @@ import SummaryCards from '../components/SummaryCards';
 const Dashboard = () => {
     const [payments, setPayments] = useState([]);
     const [orders, setOrders] = useState([]);
+    // The orders list is one page; more pages exist when the API returns a next cursor
+    const [moreOrders, setMoreOrders] = useState(false);
     // State includes failed count and success rate for comprehensive reporting
     const [stats, setStats] = useState({ total: 0, amount: 0, rate: 0, failed: 0 });
     const [isRefreshing, setIsRefreshing] = useState(false);
@@ -23,29 +25,25 @@ const Dashboard = () => {
                 'X-Api-Secret': merchant.secret 
             };
 
-            const [payRes, orderRes] = await Promise.all([
-                axios.get('http://localhost:8000/api/v1/payments', { headers }),
-                axios.get('http://localhost:8000/api/v1/orders', { headers })
+            // Totals are aggregated server-side; only the recent rows are fetched for the table
+            const [payRes, orderRes, statsRes] = await Promise.all([
+                axios.get('http://localhost:8000/api/v1/payments', { headers, params: { limit: 5 } }),
+                axios.get('http://localhost:8000/api/v1/orders', { headers }),
+                axios.get('http://localhost:8000/api/v1/payments/stats', { headers })
             ]);
 
-            const paymentsData = payRes.data;
-            // Sorting ensures the most recent activity appears at the top
-            const sortedPayments = paymentsData.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
-            
-            const successful = sortedPayments.filter(p => p.status === 'success');
-            const failed = sortedPayments.filter(p => p.status === 'failed');
-            
-            const totalAmount = successful.reduce((sum, p) => sum + p.amount, 0);
-            const successRate = sortedPayments.length > 0 ? (successful.length / sortedPayments.length) * 100 : 0;
-            
-            setPayments(sortedPayments);
+            const summary = statsRes.data.summary;
+
+            // The API already returns the most recent activity first
+            setPayments(payRes.data);
             setOrders(orderRes.data);
+            setMoreOrders(Boolean(orderRes.headers['x-next-cursor']));
 
             setStats({ 
-                total: successful.length, 
-                amount: totalAmount, 
-                rate: successRate,
-                failed: failed.length
+                total: summary.successful_transactions, 
+                amount: summary.total_amount, 
+                rate: summary.success_rate,
+                failed: summary.failed_transactions
             });
         } catch (err) { 
             console.error("Dashboard Data Error:", err); 
@@ -85,7 +83,7 @@ const Dashboard = () => {
                 <SummaryCards 
                     totalAmount={stats.amount} 
                     totalTransactions={stats.total} 
-                    totalOrders={orders.length} 
+                    totalOrders={moreOrders ? `${orders.length}+` : orders.length} 
                     totalFailed={stats.failed}
                     successRate={stats.rate}
                 />
@@ -3,24 +3,31 @@ import axios from 'axios';
 
 const Orders = () => {
     const [orders, setOrders] = useState([]);
+    const [loading, setLoading] = useState(false);
+    // Cursor of the next (older) page; null once everything is loaded
+    const [nextCursor, setNextCursor] = useState(null);
+
+    // The API returns one page of the merchant's orders, newest first; pass a cursor to append the next one
+    const fetchOrders = async (cursor = null) => {
+        setLoading(true);
+        try {
+            const res = await axios.get('http://localhost:8000/api/v1/orders', {
+                headers: { 
+                    'X-Api-Key': 'key_test_abc123', 
+                    'X-Api-Secret': 'secret_test_xyz789' 
+                },
+                params: cursor ? { cursor } : {}
+            });
+            setOrders(prev => cursor ? [...prev, ...res.data] : res.data);
+            setNextCursor(res.headers['x-next-cursor'] || null);
+        } catch (err) {
+            console.error("Error fetching orders:", err);
+        } finally {
+            setLoading(false);
+        }
+    };
 
     useEffect(() => {
-        const fetchOrders = async () => {
-            try {
-                // Fetching all orders for the authenticated merchant
-                const res = await axios.get('http://localhost:8000/api/v1/orders', {
-                    headers: { 
-                        'X-Api-Key': 'key_test_abc123', 
-                        'X-Api-Secret': 'secret_test_xyz789' 
-                    }
-                });
-                // Sort by date to show newest orders first
-                const sortedOrders = res.data.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
-                setOrders(sortedOrders);
-            } catch (err) {
-                console.error("Error fetching orders:", err);
-            }
-        };
         fetchOrders();
     }, []);
 
@@ -102,12 +109,26 @@ const Orders = () => {
                     );
                 })}
                 
-                {orders.length === 0 && (
+                {orders.length === 0 && !loading && (
                     <div className="col-span-full bg-white p-12 rounded-2xl border-2 border-dashed border-gray-200 text-center">
                         <p className="text-gray-400 font-medium">No orders found in your history.</p>
                     </div>
                 )}
             </div>
+
+            {nextCursor && (
+                <div className="mt-8 flex flex-col items-center gap-2">
+                    <p className="text-sm text-gray-500">Showing the {orders.length} most recent orders.</p>
+                    <button
+                        data-test-id="load-more-orders"
+                        onClick={() => fetchOrders(nextCursor)}
+                        disabled={loading}
+                        className="px-5 py-2.5 bg-white border border-gray-200 rounded-xl shadow-sm text-sm font-bold text-blue-600 hover:border-blue-400 transition disabled:opacity-50"
+                    >
+                        {loading ? 'Loading...' : 'Load more'}
+                    </button>
+                </div>
+            )}
         </div>
     );
 };
@@ -5,17 +5,22 @@ const Transactions = () => {
     const [transactions, setTransactions] = useState([]);
     const [searchTerm, setSearchTerm] = useState('');
     const [loading, setLoading] = useState(true);
+    // Cursor of the next (older) page; null once everything is loaded
+    const [nextCursor, setNextCursor] = useState(null);
 
-    const fetchTransactions = async () => {
+    // The API returns one page, newest first; pass a cursor to append the next one
+    const fetchTransactions = async (cursor = null) => {
+        setLoading(true);
         try {
             const res = await axios.get('http://localhost:8000/api/v1/payments', {
                 headers: { 
                     'X-Api-Key': 'key_test_abc123', 
                     'X-Api-Secret': 'secret_test_xyz789' 
-                }
+                },
+                params: cursor ? { cursor } : {}
             });
-            const sorted = res.data.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
-            setTransactions(sorted);
+            setTransactions(prev => cursor ? [...prev, ...res.data] : res.data);
+            setNextCursor(res.headers['x-next-cursor'] || null);
         } catch (err) {
             console.error("Error fetching transactions:", err);
         } finally {
@@ -124,10 +129,26 @@ const Transactions = () => {
                 
                 {filteredTransactions.length === 0 && !loading && (
                     <div className="p-10 text-center text-gray-400">
-                        <p>No transactions found.</p>
+                        <p>No transactions found{nextCursor ? ' in the loaded transactions' : ''}.</p>
                     </div>
                 )}
             </div>
+
+            {nextCursor && (
+                <div className="mt-6 flex flex-col items-center gap-2">
+                    <p className="text-sm text-gray-500">
+                        Showing the {transactions.length} most recent transactions. Search covers loaded transactions only.
+                    </p>
+                    <button
+                        data-test-id="load-more-transactions"
+                        onClick={() => fetchTransactions(nextCursor)}
+                        disabled={loading}
+                        className="px-5 py-2.5 bg-white border border-gray-200 rounded-xl shadow-sm text-sm font-bold text-blue-600 hover:border-blue-400 transition disabled:opacity-50"
+                    >
+                        {loading ? 'Loading...' : 'Load more'}
+                    </button>
+                </div>
+            )}
         </div>
     );
 };